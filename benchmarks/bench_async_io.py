@@ -0,0 +1,108 @@
+"""同期I/O経路と非同期I/O経路のスループットを並列度ごとに比較するベンチマーク
+
+モックサーバーに対して、旧来の同期クライアント（OpenAI/MessagingApi/supabase）で
+1イベントずつ処理する経路と、main.handle_message の非同期経路を比較する。
+
+    python benchmarks/bench_async_io.py --events 200 --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_server import MockServer  # noqa: E402
+
+PORT = 18080
+MOCK_URL = f'http://127.0.0.1:{PORT}'
+
+os.environ.update({
+    'OPENAI_API_KEY': 'sk-mock',
+    'OPENAI_BASE_URL': f'{MOCK_URL}/v1',
+    'LINE_CHANNEL_ACCESS_TOKEN': 'mock',
+    'LINE_CHANNEL_SECRET': 'mock',
+    'LINE_API_HOST': MOCK_URL,
+    'SUPABASE_URL': MOCK_URL,
+    'SUPABASE_KEY': 'mock.mock.mock',
+})
+
+import main  # noqa: E402
+from linebot.v3.webhooks import MessageEvent  # noqa: E402
+
+
+def make_event(i: int) -> MessageEvent:
+    return MessageEvent.from_dict({
+        'type': 'message', 'mode': 'active', 'timestamp': 0,
+        'webhookEventId': f'bench-{i}', 'deliveryContext': {'isRedelivery': False},
+        'source': {'type': 'user', 'userId': f'U{i % 50}'},
+        'replyToken': f'token-{i}',
+        'message': {'type': 'text', 'id': str(i), 'quoteToken': 'q', 'text': 'リスト'},
+    })
+
+
+def run_sync(events: int, concurrency: int) -> float:
+    """旧実装と同じ同期クライアントでイベントを処理し、events/秒を返す"""
+    import json
+    import openai
+    from linebot.v3.messaging import ApiClient, Configuration, MessagingApi, TextMessage
+    from supabase import create_client
+
+    configuration = Configuration(access_token='mock', host=MOCK_URL)
+    line_bot_api = MessagingApi(ApiClient(configuration))
+    supabase = create_client(MOCK_URL, 'mock.mock.mock')
+
+    def handle(i: int):
+        # 旧実装はメッセージごとにOpenAIクライアントを生成していた
+        client = openai.OpenAI()
+        response = client.chat.completions.create(
+            model='gpt-3.5-turbo',
+            messages=[{'role': 'user', 'content': 'リスト'}],
+        )
+        json.loads(response.choices[0].message.content)
+        supabase.table('tasks').select('*').eq('user_id', f'U{i}').eq('scheduled_date', '2024-01-01').execute()
+        line_bot_api.reply_message_with_http_info({
+            'replyToken': f'token-{i}',
+            'messages': [TextMessage(text='ok')],
+        })
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(handle, range(events)))
+    return events / (time.perf_counter() - start)
+
+
+async def run_async(events: int, concurrency: int) -> float:
+    """main.handle_message の非同期経路でイベントを処理し、events/秒を返す"""
+    await main.create_clients()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handle(i: int):
+        async with semaphore:
+            await main.handle_message(make_event(i), None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(i) for i in range(events)))
+    elapsed = time.perf_counter() - start
+    await main.close_clients()
+    return events / elapsed
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--events', type=int, default=200)
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    args = arg_parser.parse_args()
+
+    with MockServer(port=PORT):
+        print(f"{'concurrency':>11} {'sync ev/s':>10} {'async ev/s':>11}")
+        for concurrency in args.concurrency:
+            sync_rate = run_sync(args.events, concurrency)
+            async_rate = asyncio.run(run_async(args.events, concurrency))
+            print(f"{concurrency:>11} {sync_rate:>10.1f} {async_rate:>11.1f}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,138 @@
+"""続けて送られたメッセージをまとめる（COALESCE_WINDOW）効果のベンチマーク
+
+「明日」「10時 歯医者」のように1つの用件を数回に分けて送る会話を、会話ごとに別のユーザーから送り、
+まとめる時間窓ごとに、1会話あたりのLLM呼び出し数・reply数と、最後のメッセージを送ってから
+最後のreplyが届くまでの時間（p50/p95）、まとめた割合を比べる。
+「明日」のような短い断片は解析結果のキャッシュに当たりやすいため、LLM呼び出し数とは別に意図解析の回数も表示する。
+モックサーバーに向けたアプリを同じプロセスで起動し、時間窓は実行中に切り替える。
+
+    python benchmarks/bench_coalesce.py --conversations 200 --windows 0,0.3,0.6
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx  # noqa: E402
+
+from loadgen import percentile, sign, start_app, webhook_body  # noqa: E402
+from mock_server import MockServer  # noqa: E402
+
+MOCK_PORT = 18088
+APP_PORT = 18130
+
+# 1つの用件を分けて送る会話（定型コマンドはLLMを使わない。{n}は解析結果のキャッシュが効かないよう会話ごとに変える）
+CONVERSATIONS = [
+    ['明日', '10時 歯医者{n}'],
+    ['明日の', '15時に', '打ち合わせ{n}'],
+    ['来週のどこかで歯医者{n}の予約を入れておいて'],
+    ['リスト'],
+    ['リスト', 'あと明日10時に歯医者{n}'],
+]
+
+
+async def send_conversations(url: str, conversations: int, rate: float, gap: float, offset: int,
+                             rng: random.Random) -> Dict[int, Tuple[List[str], float]]:
+    """会話ごとに (replyTokenの一覧, 最後のメッセージを送った時刻) を返す"""
+    sent: Dict[int, Tuple[List[str], float]] = {}
+    start = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=url, timeout=10) as client:
+        async def converse(number: int):
+            await asyncio.sleep(max(0.0, start + number / rate - time.perf_counter()))
+            messages = CONVERSATIONS[number % len(CONVERSATIONS)]
+            tokens = []
+            last_sent = 0.0
+            for index, text in enumerate(messages):
+                if index:
+                    await asyncio.sleep(rng.uniform(gap / 4, gap))
+                i = offset + number * 10 + index
+                body = webhook_body(i, f'Ucoalesce{offset + number:06d}', text.format(n=offset + number))
+                last_sent = time.perf_counter()
+                await client.post('/callback', content=body.encode(),
+                                  headers={'X-Line-Signature': sign(body), 'Content-Type': 'application/json'})
+                tokens.append(f'reply-{i}')
+            sent[number] = (tokens, last_sent)
+
+        await asyncio.gather(*(converse(number) for number in range(conversations)))
+    return sent
+
+
+def wait_settled(mock: MockServer, settle: float, timeout: float) -> None:
+    """replyの受信が settle 秒止まるまで待つ"""
+    deadline = time.perf_counter() + timeout
+    count, changed = len(mock.replies), time.perf_counter()
+    while time.perf_counter() < deadline:
+        time.sleep(0.05)
+        if len(mock.replies) != count:
+            count, changed = len(mock.replies), time.perf_counter()
+        elif time.perf_counter() - changed > settle:
+            return
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--conversations', type=int, default=200)
+    arg_parser.add_argument('--rate', type=float, default=20.0, help='1秒あたりに始まる会話の数')
+    arg_parser.add_argument('--gap', type=float, default=0.4, help='同じ会話のメッセージ間の最大間隔（秒）')
+    arg_parser.add_argument('--windows', default='0,0.3,0.6', help='比べるCOALESCE_WINDOW（秒、カンマ区切り）')
+    arg_parser.add_argument('--max-wait', type=float, default=1.5, help='COALESCE_MAX_WAIT（秒）')
+    arg_parser.add_argument('--openai-latency', type=float, default=0.3)
+    arg_parser.add_argument('--seed', type=int, default=1)
+    args = arg_parser.parse_args()
+
+    latency = {'openai': args.openai_latency, 'supabase': 0.02, 'line': 0.03}
+    results = []
+    with MockServer(port=MOCK_PORT, latency=latency, stateful=True) as mock:
+        server = start_app(mock.url, APP_PORT, 4)
+        import main
+
+        def parses() -> float:
+            return sum(main.intent_parse_total.value(path=path) for path in ('fast', 'cache', 'llm'))
+
+        for run, window in enumerate(float(value) for value in args.windows.split(',')):
+            main.coalescer.window = window
+            main.coalescer.max_wait = max(args.max_wait, window)
+            before = main.coalescer.stats()
+            openai_before, line_before, parses_before = mock.counts['openai'], mock.counts['line'], parses()
+            sent = asyncio.run(send_conversations(f'http://127.0.0.1:{APP_PORT}', args.conversations, args.rate,
+                                                  args.gap, run * 1_000_000, random.Random(args.seed)))
+            wait_settled(mock, settle=max(2.0, args.max_wait * 2), timeout=60)
+            after = main.coalescer.stats()
+            latencies = []
+            unanswered = 0
+            for tokens, last_sent in sent.values():
+                received = [mock.replies[token][0] for token in tokens if token in mock.replies]
+                if received:
+                    latencies.append(max(received) - last_sent)
+                else:
+                    unanswered += 1
+            messages = after['messages'] - before['messages']
+            batches = after['batches'] - before['batches']
+            results.append({
+                'window': window,
+                'messages': sum(len(tokens) for tokens, _ in sent.values()),
+                'parses_per_conv': (parses() - parses_before) / len(sent),
+                'llm_per_conv': (mock.counts['openai'] - openai_before) / len(sent),
+                'replies_per_conv': (mock.counts['line'] - line_before) / len(sent),
+                'merge_ratio': (messages - batches) / messages if messages else 0.0,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p95': percentile(latencies, 0.95) * 1000,
+                'unanswered': unanswered,
+            })
+        server.should_exit = True
+
+    print(f"{'window':>7} {'messages':>9} {'parse/conv':>11} {'LLM/conv':>9} {'reply/conv':>11} {'merged':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'no reply':>9}")
+    for r in results:
+        print(f"{r['window']:>7.2f} {r['messages']:>9} {r['parses_per_conv']:>11.2f} {r['llm_per_conv']:>9.2f} {r['replies_per_conv']:>11.2f} "
+              f"{r['merge_ratio'] * 100:>6.1f}% {r['p50']:>8.0f} {r['p95']:>8.0f} {r['unanswered']:>9}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,95 @@
+"""日付表現の解析コストを比較するマイクロベンチマーク
+
+旧実装（今日・明日・明後日・YYYY-MM-DD以外は毎回dateparserで解析）と、
+date_resolver（事前コンパイルした表＋(表現, 日付)ごとのメモ化）を、
+実際のメッセージに近い表現のコーパスで比較する。
+
+    python benchmarks/bench_date_parse.py --iterations 2000
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+JST = ZoneInfo('Asia/Tokyo')
+
+# LLMが date に入れてくる表現の分布を意識したコーパス（相対表現が大半）
+CORPUS = [
+    '明日', '明日', '明日', '今日', '今日', '明後日', 'あした', 'あさって',
+    '来週月曜', '来週の金曜日', '金曜', '土曜日', '日曜',
+    '3日後', '一週間後', '2週間後', '10日後',
+    '11月3日', '12月25日', '1月5日', '12/24',
+    '2026-12-01', '2026-11-15',
+]
+
+
+def old_parse_date(date_str: str, current_datetime: datetime):
+    """旧 main.parse_date の解析部分（デバッグ出力を除く）"""
+    import dateparser
+    if date_str.lower() in ['今日', 'きょう', 'today']:
+        return current_datetime
+    if date_str.lower() in ['明日', 'あした', 'あす', 'tomorrow']:
+        return datetime.combine(current_datetime.date() + timedelta(days=1), datetime.min.time(), tzinfo=JST)
+    if date_str.lower() in ['明後日', 'あさって', 'day after tomorrow']:
+        return datetime.combine(current_datetime.date() + timedelta(days=2), datetime.min.time(), tzinfo=JST)
+    if re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
+        year, month, day = map(int, date_str.split('-'))
+        return datetime(year, month, day, tzinfo=JST)
+    parsed_date = dateparser.parse(
+        date_str,
+        languages=['ja'],
+        settings={
+            'RELATIVE_BASE': current_datetime,
+            'PREFER_DATES_FROM': 'future',
+            'RETURN_AS_TIMEZONE_AWARE': True,
+            'TIMEZONE': 'Asia/Tokyo'
+        }
+    )
+    return parsed_date or current_datetime
+
+
+def new_parse_date(date_str: str, current_datetime: datetime):
+    from date_resolver import resolve_date
+    return resolve_date(date_str, current_datetime.date())
+
+
+def measure(func, iterations: int):
+    now = datetime.now(JST)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        expr = CORPUS[i % len(CORPUS)]
+        t0 = time.perf_counter()
+        func(expr, now)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    return iterations / elapsed, p99 * 1e6
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--iterations', type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    for label, func in (('旧実装（dateparser）', old_parse_date), ('date_resolver', new_parse_date)):
+        # 初回の読み込み時間は別に表示し、計測からは除く
+        t0 = time.perf_counter()
+        func('明日', datetime.now(JST))
+        first = (time.perf_counter() - t0) * 1000
+        rate, p99 = measure(func, args.iterations)
+        print(f"{label:<24}: {rate:12.0f} parses/s  p99 {p99:10.1f} µs  初回 {first:8.1f} ms")
+
+    from date_resolver import _resolve
+    info = _resolve.cache_info()
+    print(f"date_resolver のメモ化: hits={info.hits} misses={info.misses}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,205 @@
+"""LLMによる意図解析の呼び出しを、旧実装と現行実装で比べるベンチマーク
+
+fixtures/llm_intents.json に記録した応答（旧プロンプトへの自由形式の応答と、function callingの引数）を
+返す擬似クライアントを使い、1メッセージあたりの呼び出し回数・入出力トークン数・失敗率・レイテンシを比べる。
+トークン数は mock_server.estimate_tokens による概算。レイテンシは「固定時間＋トークン数に比例する時間」に
+ばらつきを加えたモデルとリトライ時の待ち時間の合計で、実際には待たない。
+
+    python benchmarks/bench_llm_intent.py --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.update({
+    'OPENAI_API_KEY': 'sk-mock',
+    'LINE_CHANNEL_ACCESS_TOKEN': 'mock',
+    'LINE_CHANNEL_SECRET': 'mock',
+    'SUPABASE_URL': 'http://127.0.0.1:9',
+    'SUPABASE_KEY': 'mock.mock.mock',
+})
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from openai.types.chat import ChatCompletion  # noqa: E402
+
+import main  # noqa: E402
+from llm_intent import IntentSchemaError  # noqa: E402
+from mock_server import _chat_completion  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'llm_intents.json')
+
+# 旧 build_system_prompt の本文
+OLD_PROMPT = """あなたはタスク管理アシスタントです。ユーザーのメッセージを解析し、適切なアクションを判断してください。
+
+現在の日付は {current_date} です。この日付を基準として相対的な日付（今日、明日、明後日など）を判断してください。
+
+アクションの種類：
+1. register: タスクの登録
+2. complete: タスクの完了
+3. list: タスク一覧の表示
+4. list_date: 特定の日付のタスク一覧
+5. remind: リマインドの設定
+6. current_time: 現在の日時を確認
+
+応答は以下のJSON形式で返してください：
+{{
+    "action": "register" | "complete" | "list" | "list_date" | "remind" | "current_time",
+    "task_content": "タスクの内容",
+    "date": "日付（YYYY-MM-DD形式）",
+    "time": "時間（HH:MM形式）",
+    "remind_time": "リマインド時間（HH:MM形式）",
+    "tasks": [
+        {{"task_content": "タスクの内容", "date": "日付（YYYY-MM-DD形式）", "time": "時間（HH:MM形式）", "remind_time": "リマインド時間（HH:MM形式）"}}
+    ]
+}}
+
+複数のタスクについて：
+- 1つのメッセージで複数のタスクを登録・完了する場合は、すべてのタスクを tasks 配列に入れてください
+- tasks の各要素で日付を省略した場合は、直前の要素と同じ日付を指定してください
+- タスクが1つだけの場合は tasks を省略して構いません
+- 一覧の番号でタスクの完了を指定された場合は、task_content に番号（数字のみ）を入れてください
+
+日付の指定について：
+- 今日の予定を聞かれた場合は、dateを空（null）にしてください
+- 明日の予定を聞かれた場合は、現在の日付に1日を加えた日付を指定してください
+- 明後日の予定を聞かれた場合は、現在の日付に2日を加えた日付を指定してください
+- 特定の日付を指定された場合は、その日付をそのまま使用してください
+"""
+
+
+class ReplayClient:
+    """記録した応答を返し、呼び出し回数・トークン数・モデル上の所要時間を積算する擬似OpenAIクライアント"""
+
+    def __init__(self, entries, rng: random.Random, base_latency: float, seconds_per_token: float):
+        self.entries = {entry['message']: entry for entry in entries}
+        self.rng = rng
+        self.base_latency = base_latency
+        self.seconds_per_token = seconds_per_token
+        self.chat = self
+        self.completions = self
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.elapsed = 0.0
+
+    async def create(self, **request):
+        message = request['messages'][-1]['content']
+        entry = self.entries[message]
+        if request.get('tools'):
+            content = entry['structured']
+        else:
+            content = entry['legacy'][min(self.calls, len(entry['legacy']) - 1)]
+        data = _chat_completion(content, request)
+        usage = data['usage']
+        if request.get('max_tokens') and usage['completion_tokens'] > request['max_tokens']:
+            data['choices'][0]['finish_reason'] = 'length'
+            usage['completion_tokens'] = request['max_tokens']
+        self.calls += 1
+        self.prompt_tokens += usage['prompt_tokens']
+        self.completion_tokens += usage['completion_tokens']
+        # 入力は速く、出力は1トークンずつ生成される（ばらつきは対数正規）
+        self.elapsed += (self.base_latency + usage['prompt_tokens'] * self.seconds_per_token / 50
+                         + usage['completion_tokens'] * self.seconds_per_token) * self.rng.lognormvariate(0, 0.25)
+        return ChatCompletion.model_validate(data)
+
+
+async def legacy_call(client: ReplayClient, message: str, today: date) -> bool:
+    """旧 process_message_with_llm と retry_on_error の組み合わせ（5回×5回、1秒間隔）を再現する"""
+    attempts = 25
+    for attempt in range(attempts):
+        response = await client.create(
+            model='gpt-3.5-turbo',
+            messages=[{'role': 'system', 'content': OLD_PROMPT.format(current_date=today.isoformat())},
+                      {'role': 'user', 'content': message}],
+            temperature=0.3
+        )
+        try:
+            json.loads(response.choices[0].message.content)
+            return True
+        except ValueError:
+            if attempt < attempts - 1:
+                client.elapsed += 1.0
+    return False
+
+
+async def current_call(client: ReplayClient, message: str, today: date) -> bool:
+    try:
+        await main.process_message_with_llm(message)
+        return True
+    except IntentSchemaError:
+        return False
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def measure(name: str, call, client: ReplayClient, entries, today: date, repeat: int) -> dict:
+    latencies, calls, prompt, completion, failures = [], 0, 0, 0, 0
+    for _ in range(repeat):
+        for entry in entries:
+            client.reset()
+            if not await call(client, entry['message'], today):
+                failures += 1
+            latencies.append(client.elapsed)
+            calls += client.calls
+            prompt += client.prompt_tokens
+            completion += client.completion_tokens
+    count = len(latencies)
+    return {
+        'impl': name,
+        'calls': calls / count,
+        'prompt_tokens': prompt / count,
+        'completion_tokens': completion / count,
+        'failure_rate': failures / count,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=20, help='フィクスチャ全体を繰り返す回数')
+    arg_parser.add_argument('--base-latency', type=float, default=0.25, help='1回の呼び出しの固定時間（秒）')
+    arg_parser.add_argument('--seconds-per-token', type=float, default=0.02, help='出力1トークンあたりの生成時間（秒）')
+    arg_parser.add_argument('--seed', type=int, default=1)
+    arg_parser.add_argument('--json', help='集計結果をJSONで保存するパス')
+    args = arg_parser.parse_args()
+
+    with open(FIXTURES) as f:
+        fixture = json.load(f)
+    today = date.fromisoformat(fixture['today'])
+    entries = fixture['entries']
+
+    async def run():
+        results = []
+        for name, call in (('legacy', legacy_call), ('current', current_call)):
+            client = ReplayClient(entries, random.Random(args.seed), args.base_latency, args.seconds_per_token)
+            main.openai_client = client
+            results.append(await measure(name, call, client, entries, today, args.repeat))
+        return results
+
+    results = asyncio.run(run())
+    print(f"{'impl':<8} {'calls':>6} {'prompt tok':>10} {'compl tok':>10} {'fail %':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['impl']:<8} {r['calls']:>6.2f} {r['prompt_tokens']:>10.1f} {r['completion_tokens']:>10.1f} "
+              f"{r['failure_rate'] * 100:>7.2f} {r['p50']:>8.0f} {r['p95']:>8.0f} {r['p99']:>8.0f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main_cli()
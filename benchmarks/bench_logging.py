@@ -0,0 +1,91 @@
+"""1リクエストあたりのログ出力コストを比較するマイクロベンチマーク
+
+旧実装（ホットパスでprintを20行程度同期出力）と、
+JSON・キュー経由のロギング（DEBUGは無効、処理完了時にINFOを1行）を比較する。
+
+    python benchmarks/bench_logging.py --requests 20000
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from logging_config import get_logger, request_id, setup_logging, shutdown_logging  # noqa: E402
+
+JST = ZoneInfo('Asia/Tokyo')
+logger = get_logger('bench')
+
+
+def old_request(i: int):
+    """旧実装のhandle_task_list（+parse_date）相当のprint"""
+    now = datetime.now(JST)
+    print(f"get_current_jst_datetime: システム時刻 = {now}")
+    print(f"handle_task_list: 現在の日時 = {now}")
+    print(f"handle_task_list: 日付部分 = {now.date()}")
+    print("handle_task_list: 指定された日付 = 明日")
+    print(f"get_current_jst_datetime: システム時刻 = {now}")
+    print("parse_date: 入力文字列: 明日")
+    print(f"parse_date: 現在の日時: {now}")
+    print("parse_date: 明日として処理")
+    print(f"parse_date: 明日の日付: {now}")
+    print(f"handle_task_list: 解析された日付 = {now}")
+    print(f"handle_task_list: 取得したタスク数 = {i % 5}")
+
+
+def new_request(i: int, summary: bool = True):
+    """ロギング移行後の同じ処理（DEBUGは無効なので整形も出力もしない）"""
+    now = datetime.now(JST)
+    request_id.set(f'event-{i}')
+    logger.debug("get_current_jst_datetime: システム時刻 = %s", now)
+    logger.debug("handle_task_list: 現在の日時 = %s", now)
+    logger.debug("handle_task_list: 日付部分 = %s", now.date())
+    logger.debug("handle_task_list: 指定された日付 = %s", '明日')
+    logger.debug("get_current_jst_datetime: システム時刻 = %s", now)
+    logger.debug("parse_date: 入力文字列: %s", '明日')
+    logger.debug("parse_date: 現在の日時: %s", now)
+    logger.debug("parse_date: 明日として処理")
+    logger.debug("parse_date: 明日の日付: %s", now)
+    logger.debug("handle_task_list: 解析された日付 = %s", now)
+    logger.debug("handle_task_list: 取得したタスク数 = %s", i % 5)
+    if summary:
+        logger.info("message handled", extra={'action': 'list_date', 'user_id': 'U1', 'elapsed_ms': 1.0})
+
+
+def measure(func, requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        func(i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    results = []
+    # コンテナではPYTHONUNBUFFERED等で行バッファになっていることが多いため両方測る
+    for label, buffering in (('print（旧・行バッファ）', 1), ('print（旧・ブロックバッファ）', -1)):
+        with tempfile.TemporaryFile('w', buffering=buffering) as out:
+            with contextlib.redirect_stdout(out):
+                results.append((label, measure(old_request, args.requests)))
+
+    with tempfile.TemporaryFile('w', buffering=1) as out:
+        setup_logging(level='INFO', stream=out)
+        results.append(('logging（DEBUG無効）', measure(lambda i: new_request(i, summary=False), args.requests)))
+        results.append(('logging（DEBUG無効＋INFO 1行）', measure(new_request, args.requests)))
+        shutdown_logging()
+
+    baseline = results[0][1]
+    for label, us in results:
+        print(f"{label:<32}: {us:8.2f} µs/request (旧・行バッファ比 {(1 - us / baseline) * 100:.0f}% 削減)")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,146 @@
+"""朝・昼の通知のベンチマーク：タスクから毎回作る旧方式とダイジェストを読む方式を比べる
+
+SQLiteのタスクストアにユーザーごとのタスクを入れ、朝の通知のあと一部のユーザーがタスクを完了してから
+昼の通知を送る。ストアから読んだ行数・問い合わせ回数、LINEへのリクエスト数・宛先数、所要時間を比べる。
+ダイジェスト方式では、登録・完了時の書き込み（アプリが行う分）は計測に含めない。
+
+    python benchmarks/bench_notify_digest.py --users 2000 --tasks 4 --changed 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+PORT = 18086
+# config は読み込み時に環境変数を読むため、notify より先に設定する
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ['LINE_API_HOST'] = f'http://127.0.0.1:{PORT}'
+os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'mock')
+
+from mock_server import MockServer  # noqa: E402
+import kvstore  # noqa: E402
+import notify  # noqa: E402
+from digest import NotifiedVersions, build_digest  # noqa: E402
+from task_store import SqliteTaskStore  # noqa: E402
+
+TODAY = date(2026, 10, 17)
+
+
+class CountingStore:
+    """問い合わせ回数と読んだ行数を数えるストアのラッパー"""
+
+    def __init__(self, store: SqliteTaskStore):
+        self.store = store
+        self.queries = 0
+        self.rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    async def _count(self, rows):
+        self.queries += 1
+        self.rows += len(rows)
+        return rows
+
+    async def day_tasks_page(self, *args):
+        return await self._count(await self.store.day_tasks_page(*args))
+
+    async def digests_page(self, *args):
+        return await self._count(await self.store.digests_page(*args))
+
+
+def seed(store: SqliteTaskStore, users: int, tasks: int, done: float, rng: random.Random) -> None:
+    rows = []
+    for user in range(users):
+        for number in range(rng.randint(1, tasks * 2 - 1)):
+            rows.append({
+                'user_id': f'U{user:032x}',
+                'content': f'タスク{number}',
+                'scheduled_date': TODAY.isoformat(),
+                'scheduled_time': f'{9 + number % 10:02d}:00' if rng.random() < 0.7 else None,
+                'is_done': rng.random() < done,
+            })
+    store.load(rows)
+
+
+async def complete_some(store: SqliteTaskStore, changed: float, rng: random.Random, digests: bool) -> int:
+    """一部のユーザーの未完了タスクを1件ずつ完了にする（ダイジェスト方式ならアプリと同じく書き直す）"""
+    users = [row['user_id'] for row in store.conn.execute(
+        'SELECT DISTINCT user_id FROM tasks WHERE scheduled_date = ? AND is_done = 0', (TODAY.isoformat(),))]
+    count = 0
+    for user_id in users:
+        if rng.random() >= changed:
+            continue
+        tasks = await store.list_day(user_id, TODAY.isoformat())
+        task = next(task for task in tasks if not task['is_done'])
+        await store.mark_done(user_id, [task['id']])
+        if digests:
+            await store.upsert_digests([build_digest(user_id, TODAY.isoformat(),
+                                                     await store.list_day(user_id, TODAY.isoformat()))])
+        count += 1
+    return count
+
+
+async def run(name: str, digests: bool, args, mock: MockServer) -> dict:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteTaskStore(os.path.join(directory, 'tasks.sqlite3'))
+        seed(store, args.users, args.tasks, args.done, rng)
+        notified = None
+        if digests:
+            await notify.rebuild_digests(store, TODAY)
+            notified = NotifiedVersions(kvstore.create_store('notified', max_entries=args.users * 2))
+        counting = CountingStore(store)
+        result = {'impl': name}
+        for kind, build_message, only_open in (('morning', notify.build_morning_message, False),
+                                               ('noon', notify.build_afternoon_message, True)):
+            if kind == 'noon':
+                result['changed_users'] = await complete_some(store, args.changed, rng, digests)
+            counting.queries = counting.rows = 0
+            line_before = mock.counts['line']
+            start = time.perf_counter()
+            stats = await notify.send_notification(build_message, only_open=only_open, today=TODAY, store=counting,
+                                                   digests=digests, notified=notified,
+                                                   skip_unchanged=digests and kind == 'noon')
+            result[kind] = {
+                'queries': counting.queries,
+                'rows': counting.rows,
+                'line_requests': mock.counts['line'] - line_before,
+                'recipients': stats['recipients'],
+                'wall_ms': (time.perf_counter() - start) * 1000,
+            }
+        await store.close()
+    return result
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--users', type=int, default=2000)
+    arg_parser.add_argument('--tasks', type=int, default=4, help='1ユーザーあたりの平均タスク数')
+    arg_parser.add_argument('--done', type=float, default=0.3, help='朝の時点で完了済みのタスクの割合')
+    arg_parser.add_argument('--changed', type=float, default=0.2, help='朝から昼までにタスクを完了するユーザーの割合')
+    arg_parser.add_argument('--latency', type=float, default=0.01, help='LINE APIの疑似レイテンシ（秒）')
+    arg_parser.add_argument('--seed', type=int, default=1)
+    args = arg_parser.parse_args()
+
+    with MockServer(port=PORT, latency={'line': args.latency}) as mock:
+        results = [asyncio.run(run(name, digests, args, mock))
+                   for name, digests in (('tasks', False), ('digests', True))]
+
+    print(f"{'impl':<8} {'run':<8} {'queries':>8} {'rows':>8} {'LINE req':>9} {'recipients':>11} {'wall ms':>9}")
+    for result in results:
+        for kind in ('morning', 'noon'):
+            r = result[kind]
+            print(f"{result['impl']:<8} {kind:<8} {r['queries']:>8} {r['rows']:>8} {r['line_requests']:>9} "
+                  f"{r['recipients']:>11} {r['wall_ms']:>9.0f}")
+    print(f"changed users before noon: {results[0]['changed_users']}")
+
+
+if __name__ == '__main__':
+    main_cli()
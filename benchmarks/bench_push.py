@@ -0,0 +1,88 @@
+"""通知送信のベンチマーク：旧実装の逐次pushとPushEngineを比較する
+
+モックのLINEエンドポイントに対して、ユーザーごとに同期APIで1件ずつpushする旧方式と、
+並列・レート制限・multicastまとめ送りを行うPushEngineの送信時間を比較する。
+
+    python benchmarks/bench_push.py --users 2000 --identical 0.3 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_server import MockServer  # noqa: E402
+from linebot.v3.messaging import (  # noqa: E402
+    ApiClient, AsyncApiClient, AsyncMessagingApi, Configuration, MessagingApi, TextMessage
+)
+from push_engine import PushEngine  # noqa: E402
+
+PORT = 18082
+MOCK_URL = f'http://127.0.0.1:{PORT}'
+
+
+def make_messages(users: int, identical: float):
+    """identical の割合のユーザーは同じ文面（タスクなしの定型文など）になるようにする"""
+    shared = int(users * identical)
+    messages = []
+    for i in range(users):
+        if i < shared:
+            text = '【今日のタスク】\n⏳ 散歩'
+        else:
+            text = f'【今日のタスク】\n⏳ 10:00:00 会議{i}'
+        messages.append((f'U{i:032x}', text))
+    return messages
+
+
+def run_sequential(messages) -> float:
+    """旧実装と同じく同期APIで1件ずつpushする"""
+    configuration = Configuration(access_token='mock', host=MOCK_URL)
+    line_bot_api = MessagingApi(ApiClient(configuration))
+    start = time.perf_counter()
+    failures = 0
+    for user_id, text in messages:
+        try:
+            line_bot_api.push_message_with_http_info({
+                'to': user_id,
+                'messages': [TextMessage(text=text)]
+            })
+        except Exception:
+            failures += 1
+    elapsed = time.perf_counter() - start
+    print(f"sequential: {len(messages)}件 {elapsed:.2f}s {len(messages) / elapsed:.1f} sends/s failures={failures}")
+    return elapsed
+
+
+async def run_engine(messages, concurrency: int) -> float:
+    configuration = Configuration(access_token='mock', host=MOCK_URL)
+    configuration.connection_pool_maxsize = concurrency
+    async with AsyncApiClient(configuration) as client:
+        engine = PushEngine(AsyncMessagingApi(client), concurrency=concurrency, base_delay=0.05)
+        stats = await engine.send_all(messages)
+    print(f"engine(concurrency={concurrency}): {stats.as_dict()}")
+    return stats.wall_time
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--users', type=int, default=2000)
+    arg_parser.add_argument('--identical', type=float, default=0.3, help='同じ文面になるユーザーの割合')
+    arg_parser.add_argument('--concurrency', type=int, default=50)
+    arg_parser.add_argument('--latency', type=float, default=0.03, help='LINE APIの疑似レイテンシ（秒）')
+    arg_parser.add_argument('--error-rate', type=float, default=0.01, help='429を返す割合')
+    arg_parser.add_argument('--skip-sequential', action='store_true')
+    args = arg_parser.parse_args()
+
+    messages = make_messages(args.users, args.identical)
+    with MockServer(port=PORT, latency={'line': args.latency}, line_error_rate=args.error_rate) as server:
+        if not args.skip_sequential:
+            run_sequential(messages)
+        before = server.counts['line']
+        asyncio.run(run_engine(messages, args.concurrency))
+        print(f"engine HTTP requests: {server.counts['line'] - before} (429: {server.counts['line_429']})")
+
+
+if __name__ == '__main__':
+    main_cli()
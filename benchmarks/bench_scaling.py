@@ -0,0 +1,107 @@
+"""gunicornのワーカー数ごとのスループットを比べるベンチマーク
+
+モックサーバー（OpenAI・LINE、SupabaseはインメモリSQLite）に向けたアプリを
+`gunicorn -w N` で起動し、loadgen と同じWebhookを送ってreplyが届くまでを測る。
+ワーカー間の状態（重複判定・番号の対応・キャッシュの版・リーダーのリース）は共有ストア（既定はSQLite）に置く。
+
+    python benchmarks/bench_scaling.py --workers 1,2,4 --requests 1000 --concurrency 64
+    python benchmarks/bench_scaling.py --shared-store redis --shared-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx  # noqa: E402
+
+from loadgen import DEFAULT_MIX, app_env, generate, parse_mix, report  # noqa: E402
+from mock_server import MockServer  # noqa: E402
+
+MOCK_PORT = 18085
+APP_PORT = 18110
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def start_gunicorn(workers: int, env: dict) -> subprocess.Popen:
+    """アプリをgunicornで起動し、/healthz が応答するまで待つ"""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:app', '-k', 'uvicorn.workers.UvicornWorker',
+         '-w', str(workers), '--bind', f'127.0.0.1:{APP_PORT}', '--log-level', 'warning'],
+        cwd=ROOT, env={**os.environ, **env}
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn exited with {process.returncode}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{APP_PORT}/healthz', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn did not become healthy')
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--workers', default='1,2,4', help='試すgunicornワーカー数（カンマ区切り）')
+    arg_parser.add_argument('--event-workers', type=int, default=4, help='各ワーカーのEVENT_WORKERS')
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--concurrency', type=int, default=64)
+    arg_parser.add_argument('--users', type=int, default=100)
+    arg_parser.add_argument('--mix', default=DEFAULT_MIX)
+    arg_parser.add_argument('--openai-latency', type=float, default=0.3)
+    arg_parser.add_argument('--supabase-latency', type=float, default=0.02)
+    arg_parser.add_argument('--line-latency', type=float, default=0.03)
+    arg_parser.add_argument('--shared-store', default='sqlite', help='SHARED_STORE_BACKEND（sqlite / redis）')
+    arg_parser.add_argument('--shared-url', help='SHARED_STORE_URL（sqliteなら一時ファイルを使う）')
+    arg_parser.add_argument('--timeout', type=float, default=60.0, help='replyが届くまで待つ秒数')
+    arg_parser.add_argument('--json', help='集計結果をJSONで保存するパス')
+    args = arg_parser.parse_args()
+
+    latency = {'openai': args.openai_latency, 'supabase': args.supabase_latency, 'line': args.line_latency}
+    actions = parse_mix(args.mix)
+    summary = {}
+    with MockServer(port=MOCK_PORT, latency=latency, stateful=True) as mock, \
+            tempfile.TemporaryDirectory() as directory:
+        for workers in [int(value) for value in args.workers.split(',')]:
+            env = {
+                **app_env(mock.url, args.event_workers),
+                'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+                'SHARED_STORE_BACKEND': args.shared_store,
+                'SHARED_STORE_URL': args.shared_url or os.path.join(directory, f'shared-{workers}.sqlite3'),
+                'SCHEDULER_STATE_URL': os.path.join(directory, f'scheduler-{workers}.sqlite3'),
+            }
+            process = start_gunicorn(workers, env)
+            try:
+                print(f'\n== gunicorn workers={workers}')
+                mock.replies.clear()
+                sent, failed, start = asyncio.run(generate(f'http://127.0.0.1:{APP_PORT}', actions, args.requests,
+                                                           0.0, args.concurrency, args.users))
+                deadline = time.perf_counter() + args.timeout
+                while time.perf_counter() < deadline and not all(token in mock.replies for token in sent):
+                    time.sleep(0.05)
+                summary[workers] = report(sent, failed, dict(mock.replies), start, args.timeout)['total']
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print(f"\n{'workers':>7} {'req/s':>8} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'error %':>8}")
+    base = next(iter(summary.values()))['throughput'] or 1e-9
+    for workers, total in summary.items():
+        print(f"{workers:>7} {total['throughput']:>8.1f} {total['throughput'] / base:>8.2f} {total['p50']:>8.1f} "
+              f"{total['p99']:>8.1f} {total['error_rate'] * 100:>8.2f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main_cli()
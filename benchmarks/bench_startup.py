@@ -0,0 +1,152 @@
+"""起動時間のベンチマーク（スリープからの復帰・cronでの通知スクリプトの起動）
+
+- `python -X importtime` で main・notify の読み込み時間（累積）を測り、直接読み込んでいる重いモジュールを表示する
+- アプリをuvicornのサブプロセスで起動し、プロセスの生成から /healthz が初めて200を返すまでと、
+  続けて送ったWebhookへのreplyがモックのLINEに届くまで（起動処理・SDKの読み込みを含む）の時間を測る
+
+各項目は --runs 回の中央値。--budget に予算のJSON（benchmarks/startup_budget.json）を渡すと、
+超えた項目があれば終了コード1で終わる（CIでのチェック用）。
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --budget benchmarks/startup_budget.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import httpx  # noqa: E402
+
+from loadgen import app_env, sign, webhook_body  # noqa: E402
+from mock_server import MockServer  # noqa: E402
+
+MOCK_PORT = 18087
+APP_PORT = 18120
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def parse_importtime(stderr: str) -> Dict[str, List[Tuple[str, int]]]:
+    """-X importtime の出力から、各トップレベルモジュールの (名前, 累積マイクロ秒) を深さ0と1について返す"""
+    modules: Dict[str, List[Tuple[str, int]]] = {}
+    children: List[Tuple[str, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative)))
+        elif depth == 0:
+            # 子モジュールの行は親の行より先に出力される
+            modules[name.strip()] = [(name.strip(), int(cumulative))] + children
+            children = []
+        else:
+            continue
+    return modules
+
+
+def measure_import(module: str, env: Dict[str, str], directory: str) -> Tuple[float, List[Tuple[str, int]]]:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=directory, env=env, capture_output=True, text=True, check=True)
+    lines = parse_importtime(result.stderr)[module]
+    return lines[0][1] / 1000, sorted(lines[1:], key=lambda item: -item[1])
+
+
+def measure_first_200(env: Dict[str, str], directory: str, mock: MockServer, index: int,
+                      timeout: float) -> Tuple[float, float]:
+    """uvicornを起動し、(/healthzが200を返すまで, 最初のreplyが届くまで) のミリ秒を返す"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--app-dir', ROOT, '--port', str(APP_PORT),
+         '--log-level', 'warning'],
+        cwd=directory, env=env
+    )
+    url = f'http://127.0.0.1:{APP_PORT}'
+    try:
+        with httpx.Client(timeout=1) as client:
+            first_200 = None
+            while first_200 is None:
+                if time.perf_counter() - start > timeout:
+                    raise SystemExit('アプリが起動しませんでした')
+                if process.poll() is not None:
+                    raise SystemExit(f'uvicorn exited with {process.returncode}')
+                try:
+                    if client.get(f'{url}/healthz').status_code == 200:
+                        first_200 = time.perf_counter() - start
+                except httpx.HTTPError:
+                    time.sleep(0.005)
+            body = webhook_body(index, 'Ustartup', 'リスト')
+            # 起動直後の /callback はSDKの読み込みが終わるまで待たされる
+            client.post(f'{url}/callback', content=body.encode(), timeout=timeout,
+                        headers={'X-Line-Signature': sign(body), 'Content-Type': 'application/json'})
+            token = f'reply-{index}'
+            while token not in mock.replies:
+                if time.perf_counter() - start > timeout:
+                    raise SystemExit('replyが届きませんでした')
+                time.sleep(0.005)
+            first_reply = mock.replies[token][0] - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return first_200 * 1000, first_reply * 1000
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', type=int, default=5)
+    arg_parser.add_argument('--warmup', type=int, default=1, help='集計しない最初の実行回数（.pycの生成など）')
+    arg_parser.add_argument('--top', type=int, default=8, help='表示する重いモジュールの数')
+    arg_parser.add_argument('--timeout', type=float, default=30.0)
+    arg_parser.add_argument('--budget', help='項目ごとの上限（ミリ秒）のJSON。超えたら終了コード1')
+    arg_parser.add_argument('--json', help='集計結果をJSONで保存するパス')
+    args = arg_parser.parse_args()
+
+    samples: Dict[str, List[float]] = {'import_main_ms': [], 'import_notify_ms': [],
+                                       'first_200_ms': [], 'first_reply_ms': []}
+    heaviest = {}
+    with MockServer(port=MOCK_PORT, stateful=True) as mock, tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, **app_env(mock.url, 4), 'PYTHONPATH': ROOT, 'LOG_LEVEL': 'WARNING'}
+        for run in range(args.warmup + args.runs):
+            results = {}
+            for module in ('main', 'notify'):
+                results[f'import_{module}_ms'], heaviest[module] = measure_import(module, env, directory)
+            results['first_200_ms'], results['first_reply_ms'] = measure_first_200(env, directory, mock, run,
+                                                                                   args.timeout)
+            if run >= args.warmup:
+                for name, value in results.items():
+                    samples[name].append(value)
+
+    summary = {name: statistics.median(values) for name, values in samples.items()}
+    for module, lines in heaviest.items():
+        print(f'{module} が直接読み込んでいる重いモジュール:')
+        for name, microseconds in lines[:args.top]:
+            print(f'  {microseconds / 1000:>8.1f} ms  {name}')
+    print(f"\n{'item':<18} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for name, values in samples.items():
+        print(f'{name:<18} {summary[name]:>10.1f} {min(values):>8.1f} {max(values):>8.1f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    if args.budget:
+        with open(args.budget) as f:
+            budget = json.load(f)
+        over = [f'{name}: {summary[name]:.1f}ms > {limit}ms' for name, limit in budget.items()
+                if name in summary and summary[name] > limit]
+        if over:
+            print('\n予算を超えました: ' + ', '.join(over))
+            sys.exit(1)
+        print('\n予算内です')
+
+
+if __name__ == '__main__':
+    main_cli()
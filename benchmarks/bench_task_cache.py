@@ -0,0 +1,71 @@
+"""タスク一覧（list）アクションのレイテンシをキャッシュ有効・無効で比較するベンチマーク
+
+モックのSupabase(PostgREST)に対して main.handle_task_list を繰り返し呼び、
+p50/p99レイテンシを表示する。
+
+    python benchmarks/bench_task_cache.py --requests 500 --users 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_server import MockServer  # noqa: E402
+
+PORT = 18081
+MOCK_URL = f'http://127.0.0.1:{PORT}'
+
+os.environ.update({
+    'OPENAI_API_KEY': 'sk-mock',
+    'LINE_CHANNEL_ACCESS_TOKEN': 'mock',
+    'LINE_CHANNEL_SECRET': 'mock',
+    'SUPABASE_URL': MOCK_URL,
+    'SUPABASE_KEY': 'mock.mock.mock',
+})
+
+import main  # noqa: E402
+from task_cache import TaskCache  # noqa: E402
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run(requests: int, users: int, cache_enabled: bool):
+    await main.create_clients()
+    main.task_cache = TaskCache(max_bytes=16 * 1024 * 1024 if cache_enabled else 0)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await main.handle_task_list(f'U{i % users}')
+        latencies.append(time.perf_counter() - start)
+    await main.close_clients()
+    return latencies
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=500)
+    arg_parser.add_argument('--users', type=int, default=20)
+    arg_parser.add_argument('--supabase-latency', type=float, default=0.02)
+    args = arg_parser.parse_args()
+
+    with MockServer(port=PORT, latency={'supabase': args.supabase_latency}) as server:
+        print(f"{'cache':>5} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'db calls':>8}")
+        for cache_enabled in (False, True):
+            before = server.counts['supabase']
+            latencies = asyncio.run(run(args.requests, args.users, cache_enabled))
+            print(f"{'on' if cache_enabled else 'off':>5} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.2f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.2f} "
+                  f"{statistics.mean(latencies) * 1000:>8.2f} "
+                  f"{server.counts['supabase'] - before:>8}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,77 @@
+"""TaskStore の読み書きレイテンシをバックエンドごとに比較するベンチマーク
+
+モックのSupabase（PostgREST、インメモリSQLite・疑似レイテンシ付き）と、
+組み込みの SqliteTaskStore（WAL）に対して一覧取得・登録・完了を繰り返し、p50/p99を表示する。
+
+    python benchmarks/bench_task_store.py --requests 300 --users 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_server import MockServer  # noqa: E402
+from supabase import acreate_client  # noqa: E402
+from task_store import SqliteTaskStore, SupabaseTaskStore  # noqa: E402
+
+PORT = 18084
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run(store, requests: int, users: int):
+    latencies = {'list': [], 'insert': [], 'mark_done': []}
+    for i in range(requests):
+        user_id = f'U{i % users}'
+        start = time.perf_counter()
+        rows = await store.insert([{'user_id': user_id, 'content': f'タスク{i}', 'scheduled_date': '2026-01-01',
+                                    'scheduled_time': f'{9 + i % 10:02d}:00'}])
+        latencies['insert'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await store.list_day(user_id, '2026-01-01')
+        latencies['list'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await store.mark_done(user_id, [rows[0]['id']])
+        latencies['mark_done'].append(time.perf_counter() - start)
+    return latencies
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=300)
+    arg_parser.add_argument('--users', type=int, default=50)
+    arg_parser.add_argument('--supabase-latency', type=float, default=0.05)
+    args = arg_parser.parse_args()
+
+    async def supabase_store(url):
+        return SupabaseTaskStore(await acreate_client(url, 'mock.mock.mock'))
+
+    with MockServer(port=PORT, latency={'supabase': args.supabase_latency}, stateful=True) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        print(f"{'backend':<9} {'op':<10} {'p50 ms':>9} {'p99 ms':>9}")
+        for name in ('supabase', 'sqlite'):
+            async def measure():
+                if name == 'supabase':
+                    store = await supabase_store(server.url)
+                else:
+                    store = SqliteTaskStore(os.path.join(directory, 'tasks.sqlite3'))
+                try:
+                    return await run(store, args.requests, args.users)
+                finally:
+                    await store.close()
+
+            for op, values in asyncio.run(measure()).items():
+                print(f"{name:<9} {op:<10} {percentile(values, 0.5) * 1000:>9.3f} {percentile(values, 0.99) * 1000:>9.3f}")
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,98 @@
+"""段階ごとの計測（tracing.py）のオーバーヘッドと、処理時間の内訳・トレース・プロファイルの確認
+
+1. span() 1回あたりのオーバーヘッド（トレース外・トレース内）を測る
+2. モックサーバー（OpenAI・LINE・Supabase・OTLPコレクター）に向けたアプリを同じプロセスで起動してWebhookを送り、
+   段階ごとの件数・平均・p95、コレクターが受け取ったスパン数、書き出されたプロファイルを表示する
+
+    python benchmarks/bench_tracing.py --requests 300 --profile-threshold 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+from loadgen import app_env, parse_mix, start_app, generate  # noqa: E402
+from mock_server import MockServer  # noqa: E402
+
+MOCK_PORT = 18090
+APP_PORT = 18140
+
+
+def span_overhead(iterations: int) -> None:
+    """span() の出入り1回あたりの時間（マイクロ秒）"""
+    import tracing
+
+    def run() -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with tracing.span('bench'):
+                pass
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    outside = run()
+    with tracing.trace('bench.root'):
+        inside = run()
+    print(f'span overhead: {outside:.2f} us (no trace), {inside:.2f} us (in trace)')
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=300)
+    arg_parser.add_argument('--concurrency', type=int, default=16)
+    arg_parser.add_argument('--mix', default='list=4,register=3,complete=1,llm=2')
+    arg_parser.add_argument('--openai-latency', type=float, default=0.4)
+    arg_parser.add_argument('--sample-rate', type=float, default=1.0, help='TRACE_SAMPLE_RATE')
+    arg_parser.add_argument('--profile-threshold', type=float, default=0.5, help='PROFILE_SLOW_THRESHOLD（秒、0で無効）')
+    arg_parser.add_argument('--iterations', type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    latency = {'openai': args.openai_latency, 'supabase': 0.02, 'line': 0.03}
+    with MockServer(port=MOCK_PORT, latency=latency, jitter=0.3, stateful=True) as mock, \
+            tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            **app_env(mock.url, 4),
+            'TRACE_EXPORTER': 'otlp',
+            'OTLP_ENDPOINT': mock.url,
+            'TRACE_SAMPLE_RATE': str(args.sample_rate),
+            'PROFILE_SLOW_THRESHOLD': str(args.profile_threshold),
+            'PROFILE_DIR': directory,
+        })
+        # 設定（config）は読み込み時に環境変数を読むため、アプリのモジュールは環境変数を設定してから読み込む
+        import tracing
+        span_overhead(args.iterations)
+        server = start_app(mock.url, APP_PORT, 4)
+        sent, _, _ = asyncio.run(generate(f'http://127.0.0.1:{APP_PORT}', parse_mix(args.mix), args.requests,
+                                          0.0, args.concurrency, 50))
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline and not all(token in mock.replies for token in sent):
+            time.sleep(0.05)
+        tracing.shutdown_tracing()
+        server.should_exit = True
+
+        print(f"\n{'stage':<20} {'count':>7} {'avg ms':>9} {'p95 ms':>9}")
+        for stage, stats in tracing.stage_stats().items():
+            if stage.startswith('bench'):
+                continue
+            print(f"{stage:<20} {stats['count']:>7} {stats['avg_ms']:>9.1f} {stats['p95_ms']:>9.0f}")
+        traces = {span['traceId'] for span in mock.spans}
+        print(f'\nOTLP: {mock.counts["otlp"]} requests, {len(traces)} traces, {len(mock.spans)} spans')
+
+        profiles = sorted(os.listdir(directory))
+        print(f'profiles over {args.profile_threshold}s: {len(profiles)}')
+        if profiles:
+            with open(os.path.join(directory, profiles[-1])) as f:
+                lines = f.read().splitlines()
+            print(f'{profiles[-1]} (top stacks):')
+            for line in lines[:5]:
+                stack, _, count = line.rpartition(' ')
+                print(f'  {count:>5}  {";".join(stack.split(";")[-3:])}')
+
+
+if __name__ == '__main__':
+    main_cli()
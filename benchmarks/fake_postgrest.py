@@ -0,0 +1,207 @@
+"""モックサーバー用の、SQLite（インメモリ）に保存するPostgRESTもどき
+
+アプリとnotifyが使う範囲のクエリ（select・eq/neq/gt/gte/lt/lte/in/is・or/and・
+order・limit、insert、update）だけを解釈する。
+"""
+import re
+import sqlite3
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+TASKS_SCHEMA = (
+    'CREATE TABLE tasks ('
+    'id TEXT PRIMARY KEY, user_id TEXT NOT NULL, content TEXT NOT NULL, '
+    'is_done INTEGER NOT NULL DEFAULT 0, created_at TEXT, scheduled_date TEXT, '
+    'scheduled_time TEXT, remind_time TEXT)'
+)
+COLUMNS = ('id', 'user_id', 'content', 'is_done', 'created_at', 'scheduled_date', 'scheduled_time', 'remind_time')
+TIME_COLUMNS = ('scheduled_time', 'remind_time')
+
+_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+_RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'columns', 'on_conflict'}
+_CONDITION = re.compile(r'^(\w+)\.(not\.)?(\w+)\.(.*)$', re.S)
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _split(text: str) -> List[str]:
+    """括弧・ダブルクォートの内側を除いてカンマで区切る"""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(value: str) -> str:
+    return value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+
+
+def _value(column: str, value: str) -> Any:
+    if column == 'is_done':
+        return 1 if value == 'true' else 0
+    return value
+
+
+def _strip_parens(value: str) -> str:
+    return value[1:-1] if value.startswith('(') and value.endswith(')') else value
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    # PostgresのTIME型と同じく HH:MM:SS で返す
+    if not value:
+        return value
+    parts = value.split(':')
+    return ':'.join(f'{int(part):02d}' for part in (parts + ['0', '0'])[:3])
+
+
+def _condition(column: str, negate: bool, operator: str, value: str) -> Tuple[str, list]:
+    if column not in COLUMNS:
+        raise QueryError(f'unknown column: {column}')
+    if operator == 'is':
+        sql = f'{column} IS {"NULL" if value == "null" else "TRUE" if value == "true" else "FALSE"}'
+        params = []
+    elif operator == 'in':
+        values = [_value(column, _unquote(item)) for item in _split(_strip_parens(value))]
+        sql = f'{column} IN ({",".join("?" * len(values))})'
+        params = values
+    elif operator in _OPERATORS:
+        sql = f'{column} {_OPERATORS[operator]} ?'
+        params = [_value(column, _unquote(value))]
+    else:
+        raise QueryError(f'unsupported operator: {operator}')
+    return (f'NOT ({sql})', params) if negate else (sql, params)
+
+
+def _logical(joiner: str, body: str) -> Tuple[str, list]:
+    """or=(a.eq.1,and(b.gt.2,c.is.null)) の括弧内を解釈する"""
+    clauses, params = [], []
+    for item in _split(body):
+        match = re.match(r'^(and|or)\((.*)\)$', item, re.S)
+        if match:
+            sql, values = _logical(match.group(1).upper(), match.group(2))
+        else:
+            condition = _CONDITION.match(item)
+            if not condition:
+                raise QueryError(f'invalid condition: {item}')
+            sql, values = _condition(condition.group(1), bool(condition.group(2)), condition.group(3),
+                                     condition.group(4))
+        clauses.append(f'({sql})')
+        params.extend(values)
+    return f' {joiner} '.join(clauses), params
+
+
+class SqliteTasks:
+    """tasks テーブルだけを持つインメモリSQLite"""
+
+    def __init__(self, rows: Optional[List[Dict[str, Any]]] = None):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(TASKS_SCHEMA)
+        self.conn.execute('CREATE INDEX tasks_user_date_time_idx ON tasks (user_id, scheduled_date, scheduled_time)')
+        self.conn.execute('CREATE INDEX tasks_date_done_user_time_idx ON tasks (scheduled_date, is_done, user_id, scheduled_time, id)')
+        if rows:
+            self.insert(rows)
+
+    def _where(self, params) -> Tuple[str, list]:
+        clauses, values = [], []
+        for key, value in params.items():
+            if key in _RESERVED_PARAMS:
+                continue
+            if key in ('or', 'and'):
+                sql, args = _logical(key.upper(), _strip_parens(value))
+            else:
+                match = re.match(r'^(not\.)?(\w+)\.(.*)$', value, re.S)
+                if not match:
+                    raise QueryError(f'invalid filter: {key}={value}')
+                sql, args = _condition(key, bool(match.group(1)), match.group(2), match.group(3))
+            clauses.append(f'({sql})')
+            values.extend(args)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', values
+
+    @staticmethod
+    def _row(row: sqlite3.Row, columns) -> Dict[str, Any]:
+        data = {column: row[column] for column in columns}
+        if 'is_done' in data:
+            data['is_done'] = bool(data['is_done'])
+        return data
+
+    @staticmethod
+    def _columns(params) -> Tuple[str, ...]:
+        select = params.get('select', '*')
+        if select == '*':
+            return COLUMNS
+        columns = tuple(column.strip() for column in select.split(','))
+        for column in columns:
+            if column not in COLUMNS:
+                raise QueryError(f'unknown column: {column}')
+        return columns
+
+    def select(self, params) -> List[Dict[str, Any]]:
+        columns = self._columns(params)
+        where, values = self._where(params)
+        sql = f'SELECT * FROM tasks{where}'
+        if 'order' in params:
+            terms = []
+            for term in params['order'].split(','):
+                column, *options = term.split('.')
+                if column not in COLUMNS:
+                    raise QueryError(f'unknown column: {column}')
+                direction = 'DESC' if 'desc' in options else 'ASC'
+                # Postgresの既定（ASCはNULLS LAST、DESCはNULLS FIRST）に合わせる
+                nulls_first = 'nullsfirst' in options or (direction == 'DESC' and 'nullslast' not in options)
+                terms.append(f'{column} IS {"NOT " if nulls_first else ""}NULL, {column} {direction}')
+            sql += ' ORDER BY ' + ', '.join(terms)
+        if 'limit' in params:
+            sql += ' LIMIT ?'
+            values.append(int(params['limit']))
+        return [self._row(row, columns) for row in self.conn.execute(sql, values)]
+
+    def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted = []
+        for row in rows:
+            data = {column: row.get(column) for column in COLUMNS if column in row}
+            data['id'] = str(data.get('id') or uuid.uuid4())
+            data['is_done'] = 1 if data.get('is_done') else 0
+            for column in TIME_COLUMNS:
+                data[column] = _normalize_time(data.get(column))
+            # IDが指定された行は upsert（on_conflict=id）として扱う
+            updates = ', '.join(f'{column} = excluded.{column}' for column in data if column != 'id')
+            self.conn.execute(
+                f'INSERT INTO tasks ({", ".join(data)}) VALUES ({", ".join("?" * len(data))}) '
+                f'ON CONFLICT(id) DO UPDATE SET {updates}', list(data.values()))
+            inserted.append(self._row(self.conn.execute('SELECT * FROM tasks WHERE id = ?', (data['id'],)).fetchone(),
+                                      COLUMNS))
+        self.conn.commit()
+        return inserted
+
+    def update(self, params, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        where, args = self._where(params)
+        ids = [row['id'] for row in self.conn.execute(f'SELECT id FROM tasks{where}', args)]
+        if not ids:
+            return []
+        values = {column: value for column, value in values.items() if column in COLUMNS and column != 'id'}
+        if 'is_done' in values:
+            values['is_done'] = 1 if values['is_done'] else 0
+        placeholders = ','.join('?' * len(ids))
+        self.conn.execute(f'UPDATE tasks SET {", ".join(f"{column} = ?" for column in values)} '
+                          f'WHERE id IN ({placeholders})', list(values.values()) + ids)
+        self.conn.commit()
+        return [self._row(row, COLUMNS)
+                for row in self.conn.execute(f'SELECT * FROM tasks WHERE id IN ({placeholders})', ids)]
+
+    def count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
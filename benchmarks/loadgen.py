@@ -0,0 +1,229 @@
+"""署名付きのLINE Webhookを /callback に送り続ける負荷試験
+
+モックサーバー（OpenAI・LINE、SupabaseはインメモリSQLite）に向けたアプリを同じプロセスで起動し、
+アクションごとにWebhook送信からreplyがLINEに届くまでの時間を測る。
+スループット・p50/p95/p99・エラー率（/callbackが2xx以外、またはタイムアウトまでにreplyが届かない）を表示し、
+--max-p99 / --max-error-rate を超えた場合は終了コード1で終わる（デプロイ前のチェック用）。
+
+    python benchmarks/loadgen.py --requests 1000 --concurrency 32
+    python benchmarks/loadgen.py --rate 50 --duration 30 --mix list=5,register=3,complete=1,llm=1
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mock_server import MockServer  # noqa: E402
+
+MOCK_PORT = 18083
+APP_PORT = 18100
+CHANNEL_SECRET = 'loadtest-secret'
+
+# アクションごとのメッセージ（i は通し番号）
+MESSAGES = {
+    'list': lambda i: 'リスト',
+    'list_date': lambda i: '明日のタスク',
+    'register': lambda i: f'タスク 明日 10:00 負荷試験{i}',
+    'complete': lambda i: '完了 1',
+    'llm': lambda i: f'来週のどこかで歯医者の予約を入れておいて（{i}）',
+}
+DEFAULT_MIX = 'list=4,list_date=1,register=3,complete=1,llm=1'
+
+
+def parse_mix(text: str) -> List[str]:
+    """'list=4,register=3' をアクション名の繰り返し列にする"""
+    actions = []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in MESSAGES:
+            raise SystemExit(f'unknown action: {name} (choose from {", ".join(MESSAGES)})')
+        actions.extend([name] * int(weight or 1))
+    return actions
+
+
+def webhook_body(i: int, user_id: str, text: str) -> str:
+    return json.dumps({
+        'destination': 'Uloadtest',
+        'events': [{
+            'type': 'message', 'mode': 'active', 'timestamp': int(time.time() * 1000),
+            'webhookEventId': f'loadtest-{i}', 'deliveryContext': {'isRedelivery': False},
+            'source': {'type': 'user', 'userId': user_id},
+            'replyToken': f'reply-{i}',
+            'message': {'type': 'text', 'id': str(i), 'quoteToken': 'q', 'text': text},
+        }],
+    }, ensure_ascii=False)
+
+
+def sign(body: str) -> str:
+    digest = hmac.new(CHANNEL_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def app_env(mock_url: str, workers: int) -> Dict[str, str]:
+    """アプリをモックに向けるための環境変数"""
+    return {
+        'OPENAI_API_KEY': 'sk-mock',
+        'OPENAI_BASE_URL': f'{mock_url}/v1',
+        'LINE_CHANNEL_ACCESS_TOKEN': 'mock',
+        'LINE_CHANNEL_SECRET': CHANNEL_SECRET,
+        'LINE_API_HOST': mock_url,
+        'SUPABASE_URL': mock_url,
+        'SUPABASE_KEY': 'mock.mock.mock',
+        'SCHEDULER_ENABLED': 'false',
+        'KEEP_ALIVE_ENABLED': 'false',
+        'EVENT_WORKERS': str(workers),
+        # 同じユーザーから大量に送るため、レート制限は外して処理能力を測る
+        'USER_RATE_PER_MINUTE': '0',
+        'LLM_USER_RATE_PER_MINUTE': '0',
+        'LLM_GLOBAL_RATE': '0',
+    }
+
+
+def start_app(mock_url: str, port: int, workers: int):
+    """モックに向けた環境変数でアプリを読み込み、uvicornを別スレッドで起動する"""
+    os.environ.update(app_env(mock_url, workers))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import uvicorn
+    import main
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    # 起動処理（クライアントの生成など）はバックグラウンドで行われるため、終わるまで待ってから計測する
+    while not (server.started and main.started.is_set()):
+        time.sleep(0.05)
+    return server
+
+
+async def generate(url: str, actions: List[str], requests: int, rate: float, concurrency: int,
+                   users: int) -> Tuple[Dict[str, Tuple[str, float]], Dict[str, int], float]:
+    """Webhookを送り、replyToken -> (アクション, 送信時刻) と送信失敗数を返す"""
+    import httpx
+    sent: Dict[str, Tuple[str, float]] = {}
+    failed: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=url, timeout=10) as client:
+        async def send(i: int):
+            action = actions[i % len(actions)]
+            body = webhook_body(i, f'Uloadtest{i % users:04d}', MESSAGES[action](i))
+            async with semaphore:
+                sent_at = time.perf_counter()
+                try:
+                    response = await client.post('/callback', content=body.encode(),
+                                                 headers={'X-Line-Signature': sign(body),
+                                                          'Content-Type': 'application/json'})
+                    ok = response.status_code < 300
+                except httpx.HTTPError:
+                    ok = False
+            if ok:
+                sent[f'reply-{i}'] = (action, sent_at)
+            else:
+                failed[action] = failed.get(action, 0) + 1
+
+        tasks = []
+        for i in range(requests):
+            if rate:
+                # 一定間隔で送信する（開ループ）
+                await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            tasks.append(asyncio.create_task(send(i)))
+        await asyncio.gather(*tasks)
+    return sent, failed, start
+
+
+def report(sent, failed, replies, start: float, timeout: float) -> Dict[str, Dict[str, float]]:
+    """アクションごとの集計を表示して返す"""
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = dict(failed)
+    finished = start
+    for token, (action, sent_at) in sent.items():
+        reply = replies.get(token)
+        if reply is None or reply[0] - sent_at > timeout:
+            errors[action] = errors.get(action, 0) + 1
+            continue
+        latencies.setdefault(action, []).append(reply[0] - sent_at)
+        finished = max(finished, reply[0])
+    elapsed = max(finished - start, 1e-9)
+
+    results = {}
+    names = sorted(set(latencies) | set(errors))
+    print(f"{'action':<10} {'count':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'error %':>8}")
+    for name in names + ['total']:
+        if name == 'total':
+            values = [value for items in latencies.values() for value in items]
+            error_count = sum(errors.values())
+        else:
+            values = latencies.get(name, [])
+            error_count = errors.get(name, 0)
+        count = len(values) + error_count
+        results[name] = {
+            'count': count,
+            'throughput': len(values) / elapsed,
+            'p50': percentile(values, 0.50) * 1000,
+            'p95': percentile(values, 0.95) * 1000,
+            'p99': percentile(values, 0.99) * 1000,
+            'error_rate': error_count / count if count else 0.0,
+        }
+        r = results[name]
+        print(f"{name:<10} {count:>6} {r['throughput']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+              f"{r['p99']:>8.1f} {r['error_rate'] * 100:>8.2f}")
+    return results
+
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=500)
+    arg_parser.add_argument('--rate', type=float, default=0.0, help='1秒あたりの送信数（0なら並列度いっぱいに送る）')
+    arg_parser.add_argument('--duration', type=float, default=0.0, help='--rate と併用し、送信数を rate×duration にする')
+    arg_parser.add_argument('--concurrency', type=int, default=32)
+    arg_parser.add_argument('--users', type=int, default=100)
+    arg_parser.add_argument('--mix', default=DEFAULT_MIX)
+    arg_parser.add_argument('--workers', type=int, default=4, help='アプリのEVENT_WORKERS')
+    arg_parser.add_argument('--openai-latency', type=float, default=0.3)
+    arg_parser.add_argument('--supabase-latency', type=float, default=0.02)
+    arg_parser.add_argument('--line-latency', type=float, default=0.03)
+    arg_parser.add_argument('--jitter', type=float, default=0.3)
+    arg_parser.add_argument('--timeout', type=float, default=30.0, help='replyが届くまで待つ秒数')
+    arg_parser.add_argument('--max-p99', type=float, default=0.0, help='全体のp99（ms）の上限')
+    arg_parser.add_argument('--max-error-rate', type=float, default=0.0, help='全体のエラー率（0〜1）の上限')
+    arg_parser.add_argument('--json', help='集計結果をJSONで保存するパス')
+    args = arg_parser.parse_args()
+
+    requests = int(args.rate * args.duration) if args.rate and args.duration else args.requests
+    latency = {'openai': args.openai_latency, 'supabase': args.supabase_latency, 'line': args.line_latency}
+    with MockServer(port=MOCK_PORT, latency=latency, jitter=args.jitter, stateful=True) as mock:
+        server = start_app(mock.url, APP_PORT, args.workers)
+        sent, failed, start = asyncio.run(generate(f'http://127.0.0.1:{APP_PORT}', parse_mix(args.mix), requests,
+                                                   args.rate, args.concurrency, args.users))
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline and not all(token in mock.replies for token in sent):
+            time.sleep(0.05)
+        results = report(sent, failed, dict(mock.replies), start, args.timeout)
+        print(f"mock calls: {mock.counts}  tasks in store: {mock.app['tasks'].count()}")
+        server.should_exit = True
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    total = results['total']
+    if (args.max_p99 and total['p99'] > args.max_p99) or \
+            (args.max_error_rate and total['error_rate'] > args.max_error_rate):
+        print('NG: 上限を超えました', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
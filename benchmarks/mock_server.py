@@ -0,0 +1,214 @@
+"""ベンチマーク用のOpenAI・Supabase(PostgREST)・LINE Messaging API・OTLPコレクターのモックサーバー"""
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from fake_postgrest import QueryError, SqliteTasks
+
+# サービスごとの疑似レイテンシ（秒）
+DEFAULT_LATENCY = {'openai': 0.05, 'supabase': 0.02, 'line': 0.02}
+
+DEFAULT_LLM_RESULT = {'action': 'list', 'task_content': None, 'date': None, 'time': None, 'remind_time': None}
+
+# GETで返すタスク行
+DEFAULT_TASK_ROWS = [
+    {'id': '1', 'content': '朝会', 'scheduled_time': '09:30:00', 'is_done': True},
+    {'id': '2', 'content': 'プレゼン資料作成', 'scheduled_time': '15:00:00', 'is_done': False},
+    {'id': '3', 'content': '散歩', 'scheduled_time': None, 'is_done': False},
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語は1文字1トークン、それ以外は4文字1トークン）"""
+    wide = sum(1 for char in text if ord(char) > 0x2000)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _chat_completion(content: str, request: Optional[dict] = None) -> dict:
+    """リクエストにtoolsがあればツール呼び出し、なければ本文として content を返す"""
+    request = request or {}
+    tools = request.get('tools')
+    if tools:
+        message = {'role': 'assistant', 'content': None, 'tool_calls': [{
+            'id': 'call_mock', 'type': 'function',
+            'function': {'name': tools[0]['function']['name'], 'arguments': content},
+        }]}
+        finish_reason = 'tool_calls'
+    else:
+        message = {'role': 'assistant', 'content': content}
+        finish_reason = 'stop'
+    prompt_tokens = estimate_tokens(json.dumps(request.get('messages', []), ensure_ascii=False)) + \
+        (estimate_tokens(json.dumps(tools, ensure_ascii=False)) if tools else 0)
+    completion_tokens = estimate_tokens(content)
+    return {
+        'id': 'chatcmpl-mock',
+        'object': 'chat.completion',
+        'created': 0,
+        'model': 'gpt-3.5-turbo',
+        'choices': [{
+            'index': 0,
+            'message': message,
+            'finish_reason': finish_reason,
+        }],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+def create_app(latency: Optional[Dict[str, float]] = None, llm_result: Optional[dict] = None,
+               line_error_rate: float = 0.0, jitter: float = 0.0, stateful: bool = False) -> web.Application:
+    """モックAPIのaiohttpアプリケーションを生成する
+
+    line_error_rate を指定すると、その割合でLINE APIが429（Retry-After付き）を返す。
+    jitter を指定すると、各レイテンシを ±jitter の割合でばらつかせる。
+    stateful=True の場合、Supabaseは固定の行を返す代わりにインメモリSQLiteに読み書きする。
+    受け取ったreplyは app['replies'] に replyToken -> (受信時刻, 本文) で記録する。
+    /v1/traces（OTLP/HTTPのJSON）で受け取ったスパンは app['spans'] に記録する。
+    """
+    latency = {**DEFAULT_LATENCY, **(latency or {})}
+    content = json.dumps(llm_result or DEFAULT_LLM_RESULT, ensure_ascii=False)
+    counts: Dict[str, int] = {'openai': 0, 'supabase': 0, 'line': 0, 'line_429': 0, 'otlp': 0}
+    replies: Dict[str, Tuple[float, str]] = {}
+    spans: List[dict] = []
+    tasks = SqliteTasks() if stateful else None
+
+    async def delay(service: str):
+        seconds = latency[service]
+        if jitter:
+            seconds *= random.uniform(1 - jitter, 1 + jitter)
+        await asyncio.sleep(seconds)
+
+    async def openai_chat(request):
+        counts['openai'] += 1
+        body = await request.json()
+        await delay('openai')
+        return web.json_response(_chat_completion(content, body))
+
+    async def postgrest(request):
+        counts['supabase'] += 1
+        await delay('supabase')
+        if tasks is not None:
+            return await postgrest_sqlite(request)
+        if request.method == 'GET':
+            return web.json_response(DEFAULT_TASK_ROWS)
+        if request.method == 'POST':
+            body = await request.json()
+            return web.json_response(body if isinstance(body, list) else [body], status=201)
+        return web.json_response([])
+
+    async def postgrest_sqlite(request):
+        if request.match_info['table'] != 'tasks':
+            return web.json_response([])
+        try:
+            if request.method == 'GET':
+                return web.json_response(tasks.select(request.query))
+            body = await request.json()
+            if request.method == 'POST':
+                return web.json_response(tasks.insert(body if isinstance(body, list) else [body]), status=201)
+            if request.method == 'PATCH':
+                return web.json_response(tasks.update(request.query, body))
+        except QueryError as e:
+            return web.json_response({'message': str(e)}, status=400)
+        return web.json_response([])
+
+    async def line_api(request):
+        counts['line'] += 1
+        await asyncio.sleep(latency['line'])
+        if line_error_rate and random.random() < line_error_rate:
+            counts['line_429'] += 1
+            return web.json_response({'message': 'The API rate limit has been exceeded.'},
+                                     status=429, headers={'Retry-After': '0.05'})
+        if request.match_info['kind'] == 'multicast':
+            return web.json_response({})
+        if request.match_info['kind'] == 'reply':
+            body = await request.json()
+            replies[body['replyToken']] = (time.perf_counter(), body['messages'][0].get('text', ''))
+        return web.json_response({'sentMessages': [{'id': '1', 'quoteToken': 'q'}]})
+
+    async def otlp_traces(request):
+        counts['otlp'] += 1
+        body = await request.json()
+        for resource in body.get('resourceSpans', []):
+            for scope in resource.get('scopeSpans', []):
+                spans.extend(scope.get('spans', []))
+        return web.json_response({})
+
+    app = web.Application()
+    app['counts'] = counts
+    app['replies'] = replies
+    app['spans'] = spans
+    app['tasks'] = tasks
+    app.router.add_post('/v1/chat/completions', openai_chat)
+    app.router.add_route('*', '/rest/v1/{table}', postgrest)
+    app.router.add_post('/v2/bot/message/{kind}', line_api)
+    app.router.add_post('/v1/traces', otlp_traces)
+    return app
+
+
+class MockServer:
+    """別スレッドのイベントループでモックサーバーを動かす"""
+
+    def __init__(self, port: int = 18080, latency: Optional[Dict[str, float]] = None, llm_result: Optional[dict] = None,
+                 line_error_rate: float = 0.0, jitter: float = 0.0, stateful: bool = False):
+        self.port = port
+        self.app = create_app(latency, llm_result, line_error_rate, jitter, stateful)
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self.app['counts']
+
+    @property
+    def replies(self) -> Dict[str, Tuple[float, str]]:
+        return self.app['replies']
+
+    @property
+    def spans(self) -> List[dict]:
+        return self.app['spans']
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port)
+        self._loop.run_until_complete(site.start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self) -> 'MockServer':
+        threading.Thread(target=self._run, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        async def cleanup():
+            await self._runner.cleanup()
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--port', type=int, default=18080)
+    arg_parser.add_argument('--stateful', action='store_true', help='Supabaseの代わりにインメモリSQLiteに読み書きする')
+    arg_parser.add_argument('--jitter', type=float, default=0.0)
+    args = arg_parser.parse_args()
+    web.run_app(create_app(jitter=args.jitter, stateful=args.stateful), host='127.0.0.1', port=args.port)
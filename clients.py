@@ -0,0 +1,68 @@
+import functools
+from typing import TYPE_CHECKING
+
+import config
+from task_store import TaskStore, create_task_store
+
+if TYPE_CHECKING:
+    from linebot.v3 import WebhookParser
+    from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi
+    from openai import AsyncOpenAI
+
+# LINE・OpenAI・SupabaseのSDKは読み込みだけで合わせて1秒近くかかるため、
+# モジュールの読み込み時には import せず、クライアントを生成するときに初めて読み込む
+
+
+def preload() -> None:
+    """SDKをまとめて読み込んでおく（起動直後にバックグラウンドのスレッドで呼ぶ）"""
+    import linebot.v3.messaging  # noqa: F401
+    import linebot.v3.webhooks  # noqa: F401
+    import openai  # noqa: F401
+    if config.TASK_STORE_BACKEND == 'supabase' or config.TASK_REPLICATION:
+        import supabase  # noqa: F401
+
+
+def create_openai() -> "AsyncOpenAI":
+    from openai import AsyncOpenAI
+    # SDKの既定（2回のリトライ・600秒のタイムアウト）は call_with_retry のリトライと重なるため無効にする
+    return AsyncOpenAI(api_key=config.OPENAI_API_KEY, max_retries=0, timeout=config.OPENAI_TIMEOUT)
+
+
+def create_line_api(pool_size: int) -> "AsyncApiClient":
+    """LINE Messaging APIのクライアント（LINE_API_HOSTで接続先を変更できる）"""
+    from linebot.v3.messaging import AsyncApiClient, Configuration
+    configuration = Configuration(access_token=config.LINE_CHANNEL_ACCESS_TOKEN)
+    configuration.connection_pool_maxsize = pool_size
+    if config.LINE_API_HOST:
+        configuration.host = config.LINE_API_HOST
+    return AsyncApiClient(configuration)
+
+
+def messaging_api(api_client: "AsyncApiClient") -> "AsyncMessagingApi":
+    from linebot.v3.messaging import AsyncMessagingApi
+    return AsyncMessagingApi(api_client)
+
+
+def text_message(text: str):
+    from linebot.v3.messaging import TextMessage
+    return TextMessage(text=text)
+
+
+@functools.lru_cache(maxsize=1)
+def webhook_parser() -> "WebhookParser":
+    from linebot.v3 import WebhookParser
+    return WebhookParser(config.LINE_CHANNEL_SECRET)
+
+
+async def create_supabase(service_role: bool = False):
+    """Supabaseの非同期クライアント（service_role=TrueならサービスロールキーでRLSをバイパスする）"""
+    from supabase import acreate_client
+    key = config.SUPABASE_SERVICE_ROLE_KEY if service_role else None
+    return await acreate_client(config.SUPABASE_URL, key or config.SUPABASE_KEY)
+
+
+async def open_task_store(supabase=None) -> TaskStore:
+    """TASK_STORE_BACKEND の設定でストアを開く（supabaseを省略した場合は必要なら生成する）"""
+    if supabase is None and config.TASK_STORE_BACKEND == 'supabase':
+        supabase = await create_supabase()
+    return create_task_store(config.TASK_STORE_BACKEND, supabase=supabase, path=config.TASK_STORE_PATH)
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from jobqueue import user_key
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+coalesced_messages = metrics.counter('coalesced_messages_total', 'まとめる対象として受け付けたメッセージ数')
+coalesced_batches = metrics.counter('coalesced_batches_total', 'キューに積んだまとまりの数（reason=window|max_wait|max_events|shutdown）')
+coalesced_batch_size = metrics.histogram('coalesced_batch_size', '1つのまとまりに含まれるメッセージ数',
+                                         buckets=(1, 2, 3, 4, 5, 8, 10))
+
+
+class MessageBatch:
+    """同じユーザーから続けて届いたイベントのまとまり（キュー上は1件のイベントとして扱う）"""
+
+    def __init__(self, events: List[Any]):
+        self.events = events
+
+    @property
+    def source(self):
+        return self.events[0].source
+
+    @property
+    def webhook_event_id(self) -> Optional[str]:
+        return getattr(self.events[0], 'webhook_event_id', None)
+
+    @property
+    def timestamp(self) -> Optional[int]:
+        return getattr(self.events[0], 'timestamp', None)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class _Pending:
+    def __init__(self, destination: Optional[str], first_at: float):
+        self.destination = destination
+        self.first_at = first_at
+        self.events: List[Any] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MessageCoalescer:
+    """同じキー（既定は送信元ユーザー）のイベントを短い時間窓でまとめてからキューに積む
+
+    最後のイベントから window 秒次が来なければ、最初のイベントから max_wait 秒経てば、
+    または max_events 件たまればまとめて積む（1件だけならイベントのまま、2件以上なら MessageBatch）。
+    重複判定は受け付けた時点でイベントごとに行う。window が0以下なら何もしない（add は False を返す）。
+    """
+
+    def __init__(self, queue, window: float = 0.0, max_wait: float = 1.0, max_events: int = 5,
+                 key: Callable[[Any], Optional[str]] = user_key):
+        self.queue = queue
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.max_events = max_events
+        self.key = key
+        self._pending: Dict[str, _Pending] = {}
+        metrics.gauge('coalesce_pending_users', 'メッセージをまとめている途中のユーザー数', lambda: len(self._pending))
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def add(self, event: Any, destination: Optional[str] = None) -> bool:
+        """イベントを受け付けたらTrue（重複として捨てた場合も含む）、まとめない場合はFalseを返す"""
+        key = self.key(event)
+        if not self.enabled or key is None:
+            return False
+        # 満杯なら受け付けずに QueueFull を送出する（まとめてから積む時点では断れないため）
+        self.queue.ensure_capacity(event)
+        if not await self.queue.is_new(event):
+            return True
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending(destination, now)
+        else:
+            pending.timer.cancel()
+        pending.events.append(event)
+        coalesced_messages.inc()
+        if len(pending.events) >= self.max_events:
+            self._flush(key, 'max_events')
+            return True
+        remaining = pending.first_at + self.max_wait - now
+        if remaining <= self.window:
+            pending.timer = loop.call_later(max(0.0, remaining), self._flush, key, 'max_wait')
+        else:
+            pending.timer = loop.call_later(self.window, self._flush, key, 'window')
+        return True
+
+    def _flush(self, key: str, reason: str) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        events = pending.events
+        coalesced_batches.inc(reason=reason)
+        coalesced_batch_size.observe(len(events))
+        item = events[0] if len(events) == 1 else MessageBatch(events)
+        # 重複判定・満杯の確認は受け付けたときに済んでいる（応答済みなので上限を超えても積む）
+        if not self.queue.put(item, pending.destination, force=True):
+            logger.warning("MessageCoalescer: キューに積めずに%s件を破棄しました", len(events))
+
+    def flush_all(self) -> None:
+        """まとめている途中のイベントをすべてキューに積む（停止時に呼ぶ）"""
+        for key in list(self._pending):
+            self._flush(key, 'shutdown')
+
+    def stats(self) -> dict:
+        """まとめた件数と、別々に処理せずに済んだメッセージの割合を返す"""
+        messages = coalesced_messages.value()
+        batches = sum(coalesced_batches.value(reason=reason)
+                      for reason in ('window', 'max_wait', 'max_events', 'shutdown'))
+        return {
+            'enabled': self.enabled,
+            'window': self.window,
+            'messages': messages,
+            'batches': batches,
+            'merged': messages - batches,
+            'merge_ratio': (messages - batches) / messages if messages else 0.0,
+            'batch_size_avg': coalesced_batch_size.sum() / coalesced_batch_size.count()
+            if coalesced_batch_size.count() else 0.0,
+            'pending_users': len(self._pending),
+        }
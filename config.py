@@ -0,0 +1,144 @@
+import os
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+# main.py・notify.py・scheduler.py・logging_config.py・tracing.py で共通の設定（.env はここで一度だけ読み込む）
+load_dotenv()
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, 'true' if default else 'false').lower() == 'true'
+
+
+JST = ZoneInfo('Asia/Tokyo')
+
+# LINE
+LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+LINE_API_HOST = os.getenv('LINE_API_HOST')
+
+# OpenAI（OPENAI_BASE_URLはSDKが直接読む）
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# 1回の呼び出しのタイムアウト（秒）。リトライは call_with_retry で行うためSDK側では行わない
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 15))
+
+# Supabase
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+# タスクの保存先（supabase / sqlite）。sqliteの場合はTASK_REPLICATIONでSupabaseへ複製できる
+TASK_STORE_BACKEND = os.getenv('TASK_STORE_BACKEND', 'supabase')
+TASK_STORE_PATH = os.getenv('TASK_STORE_PATH', 'tasks.sqlite3')
+TASK_REPLICATION = env_flag('TASK_REPLICATION', False)
+TASK_REPLICATION_INTERVAL = float(os.getenv('TASK_REPLICATION_INTERVAL', 5))
+TASK_REPLICATION_BATCH = int(os.getenv('TASK_REPLICATION_BATCH', 500))
+
+# 実行済みジョブ・通知したダイジェストの版の記録先
+SCHEDULER_STATE_BACKEND = os.getenv('SCHEDULER_STATE_BACKEND', 'sqlite')
+SCHEDULER_STATE_URL = os.getenv('SCHEDULER_STATE_URL', 'scheduler.sqlite3')
+
+# 通知をタスクではなくダイジェスト（1ユーザー1行）から作る
+# Supabaseではmigrations/002を適用し、`python notify.py digests` で既存のタスクから作ってから有効にする
+DIGESTS_ENABLED = env_flag('DIGESTS_ENABLED', False)
+# 昼の通知は、前回の通知（朝）からタスクが変わっていないユーザーには送らない
+AFTERNOON_SKIP_UNCHANGED = env_flag('AFTERNOON_SKIP_UNCHANGED', True)
+
+# 通知の送信（LINE Messaging APIのレート上限 push: 2,000 req/s、multicast: 200 req/s より少し低めが既定）
+DEFAULT_PUSH_RATE = 1500
+DEFAULT_MULTICAST_RATE = 150
+PUSH_CONCURRENCY = int(os.getenv('PUSH_CONCURRENCY', 50))
+PUSH_RATE = float(os.getenv('PUSH_RATE', DEFAULT_PUSH_RATE))
+MULTICAST_RATE = float(os.getenv('MULTICAST_RATE', DEFAULT_MULTICAST_RATE))
+# 1回の問い合わせで取得する行数（PostgRESTのmax-rows以下にする）
+NOTIFY_PAGE_SIZE = int(os.getenv('NOTIFY_PAGE_SIZE', 1000))
+NOTIFIED_VERSIONS_SIZE = int(os.getenv('NOTIFIED_VERSIONS_SIZE', 200000))
+
+# ログ
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+
+# トレース（none / file / otlp）・遅い処理のプロファイル（PROFILE_SLOW_THRESHOLD が0で無効）
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none')
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.getenv('OTLP_ENDPOINT', 'http://localhost:4318')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'line-task-bot')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.1))
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', 3))
+PROFILE_SLOW_THRESHOLD = float(os.getenv('PROFILE_SLOW_THRESHOLD', 0))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))
+
+# Webサービス
+PORT = int(os.getenv('PORT', 10000))
+# LINE APIへの同時接続数の上限
+LINE_POOL_SIZE = int(os.getenv('LINE_POOL_SIZE', 100))
+# スリープ防止のための自己ping（実際のアクセスがKEEP_ALIVE_IDLE秒ない場合のみ送る）
+RENDER_URL = os.getenv('RENDER_URL')
+KEEP_ALIVE_ENABLED = env_flag('KEEP_ALIVE_ENABLED', True)
+KEEP_ALIVE_IDLE = float(os.getenv('KEEP_ALIVE_IDLE', 600))
+# /readyz の依存先の確認結果をキャッシュする秒数
+READINESS_CACHE_TTL = float(os.getenv('READINESS_CACHE_TTL', 15))
+
+# 通知・リマインドのスケジューラ
+SCHEDULER_ENABLED = env_flag('SCHEDULER_ENABLED', True)
+MORNING_DIGEST_TIME = os.getenv('MORNING_DIGEST_TIME', '08:00')
+AFTERNOON_DIGEST_TIME = os.getenv('AFTERNOON_DIGEST_TIME', '12:00')
+REMINDER_SYNC_INTERVAL = float(os.getenv('REMINDER_SYNC_INTERVAL', 60))
+
+# 意図解析
+LLM_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', 300))
+LLM_STRICT_SCHEMA = env_flag('LLM_STRICT_SCHEMA', False)
+# 定型コマンドの解析結果をLLMを使わずに採用する確信度の下限（intent_parserの既定値も兼ねる）
+DEFAULT_MIN_CONFIDENCE = 0.8
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv('FAST_PATH_MIN_CONFIDENCE', DEFAULT_MIN_CONFIDENCE))
+
+# レート制限・LLM呼び出しの同時実行数
+USER_RATE_PER_MINUTE = float(os.getenv('USER_RATE_PER_MINUTE', 20))
+USER_BURST = float(os.getenv('USER_BURST', 10))
+LLM_USER_RATE_PER_MINUTE = float(os.getenv('LLM_USER_RATE_PER_MINUTE', 6))
+LLM_USER_BURST = float(os.getenv('LLM_USER_BURST', 5))
+LLM_GLOBAL_RATE = float(os.getenv('LLM_GLOBAL_RATE', 5))
+LLM_GLOBAL_BURST = float(os.getenv('LLM_GLOBAL_BURST', 20))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+LLM_MAX_WAITING = int(os.getenv('LLM_MAX_WAITING', 32))
+LLM_ADMISSION_TIMEOUT = float(os.getenv('LLM_ADMISSION_TIMEOUT', 5))
+
+# 外部APIのリトライ・サーキットブレーカー
+EXTERNAL_RETRIES = int(os.getenv('EXTERNAL_RETRIES', 2))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.2))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 5))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+# ワーカー・インスタンス間で共有する状態の保存先（memory / sqlite / redis）
+# gunicornで複数ワーカーを動かす場合はsqlite（同一ホスト）かredis（複数インスタンス）を指定する
+SHARED_STORE_BACKEND = os.getenv('SHARED_STORE_BACKEND', 'memory')
+SHARED_STORE_URL = os.getenv('SHARED_STORE_URL', 'shared.sqlite3' if SHARED_STORE_BACKEND == 'sqlite' else None)
+LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 30))
+USER_LOCK_TIMEOUT = float(os.getenv('USER_LOCK_TIMEOUT', 10))
+
+# キャッシュ（保存先の既定は共有ストアと同じ）
+INTENT_CACHE_BACKEND = os.getenv('INTENT_CACHE_BACKEND', SHARED_STORE_BACKEND)
+INTENT_CACHE_URL = os.getenv('INTENT_CACHE_URL', SHARED_STORE_URL)
+INTENT_CACHE_SIZE = int(os.getenv('INTENT_CACHE_SIZE', 1024))
+INTENT_CACHE_TTL = float(os.getenv('INTENT_CACHE_TTL', 6 * 60 * 60))
+TASK_CACHE_MAX_BYTES = int(os.getenv('TASK_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+TASK_CACHE_TTL = float(os.getenv('TASK_CACHE_TTL', 300))
+ORDINAL_MAP_BACKEND = os.getenv('ORDINAL_MAP_BACKEND', SHARED_STORE_BACKEND)
+ORDINAL_MAP_URL = os.getenv('ORDINAL_MAP_URL', SHARED_STORE_URL)
+ORDINAL_MAP_SIZE = int(os.getenv('ORDINAL_MAP_SIZE', 10000))
+ORDINAL_MAP_TTL = float(os.getenv('ORDINAL_MAP_TTL', 30 * 60))
+
+# Webhookイベントの処理キュー
+EVENT_QUEUE_MAXSIZE = int(os.getenv('EVENT_QUEUE_MAXSIZE', 1000))
+EVENT_WORKERS = int(os.getenv('EVENT_WORKERS', 4))
+EVENT_DEDUP_TTL = float(os.getenv('EVENT_DEDUP_TTL', 600))
+EVENT_DEDUP_SIZE = int(os.getenv('EVENT_DEDUP_SIZE', 100000))
+# 同じユーザーから続けて届いたメッセージをまとめる時間窓（秒、0で無効）
+COALESCE_WINDOW = float(os.getenv('COALESCE_WINDOW', 0))
+COALESCE_MAX_WAIT = float(os.getenv('COALESCE_MAX_WAIT', 1.5))
+COALESCE_MAX_MESSAGES = int(os.getenv('COALESCE_MAX_MESSAGES', 5))
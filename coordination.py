@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+leader_transitions = metrics.counter('leader_transitions_total', 'リーダーになった・降りた回数（event別）')
+lock_wait = metrics.histogram('shared_lock_wait_seconds', '共有ロックの取得までの待ち時間')
+lock_timeouts = metrics.counter('shared_lock_timeouts_total', 'ロックを取得できずに諦めた回数')
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LockTimeout(Exception):
+    """共有ロックを時間内に取得できなかった"""
+
+    def __init__(self, key: str):
+        super().__init__(f'lock timeout: {key}')
+        self.key = key
+
+
+def worker_id() -> str:
+    """ホスト・プロセスごとに一意なワーカーID"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class LeaderLease:
+    """共有ストア上のリースを取り合い、複数ワーカーのうち1つだけをリーダーにする
+
+    リーダーは renew_interval ごとにリースを延長し、延長できなければ（ストアの障害・期限切れ）降りる。
+    リーダーが落ちた場合は ttl 秒後に他のワーカーが引き継ぐ。
+    """
+
+    def __init__(self, store, name: str = 'leader', ttl: float = 30, renew_interval: float = 10,
+                 on_elected: Optional[Callback] = None, on_revoked: Optional[Callback] = None):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self.holder = worker_id()
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge('leader', 'このワーカーがリーダーなら1', lambda: 1 if self.is_leader else 0)
+
+    async def _elect(self) -> None:
+        self.is_leader = True
+        leader_transitions.inc(event='elected')
+        logger.info("LeaderLease: %s がリーダーになりました", self.holder)
+        if self.on_elected is not None:
+            await self.on_elected()
+
+    async def _revoke(self) -> None:
+        self.is_leader = False
+        leader_transitions.inc(event='revoked')
+        logger.warning("LeaderLease: %s がリーダーを降りました", self.holder)
+        if self.on_revoked is not None:
+            await self.on_revoked()
+
+    async def step(self) -> None:
+        """リースの取得または延長を1回試みる"""
+        try:
+            if self.is_leader:
+                held = await self.store.arefresh(self.name, self.holder, self.ttl)
+            else:
+                held = await self.store.aadd(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error("LeaderLease: リースの更新に失敗しました: %s", e)
+            held = False
+        if held and not self.is_leader:
+            await self._elect()
+        elif not held and self.is_leader:
+            await self._revoke()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.step()
+            except Exception as e:
+                logger.error("LeaderLease: 切り替え処理に失敗しました: %s", e, exc_info=True)
+
+    async def start(self) -> None:
+        """起動時に一度リースを取りにいき、以降は定期的に取得・延長する"""
+        await self.step()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """ループを止め、リーダーであればリースを手放して他のワーカーにすぐ引き継ぐ"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._revoke()
+            try:
+                await self.store.adelete_if(self.name, self.holder)
+            except Exception as e:
+                logger.error("LeaderLease: リースの解放に失敗しました: %s", e)
+
+
+class SharedLock:
+    """共有ストア上のキー単位の排他ロック（ワーカー・インスタンスをまたいで1つだけが保持する）
+
+    hold に order（Webhookのtimestampなど）を渡すと、同じキーを待っているもののうち order の小さいものから取得する
+    （待ち行列はストア上に置くため、別のワーカーに届いたイベントとも順序がそろう。取得した時点で
+    後から届いたより古いイベントまでは待たない）。
+    保持している間は ttl/3 秒ごとに延長するため、処理が ttl より長くかかっても他に取られない。
+    保持者が落ちれば延長が止まって ttl 秒で解放され、待っているまま落ちたものは timeout 秒で待ち行列から外れる。
+    timeout 秒待っても取得できなければ LockTimeout を送出する。
+    """
+
+    def __init__(self, store, ttl: float = 60, timeout: float = 10, poll_interval: float = 0.02,
+                 max_poll_interval: float = 0.2):
+        self.store = store
+        self.ttl = ttl
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.holder = worker_id()
+
+    async def _update_waiters(self, key: str, update: Callable[[List[list]], List[list]]) -> List[list]:
+        """待ち行列（[order, token, 期限のUNIX時刻] を order 順に並べたもの）を短いロックの下で書き換える"""
+        guard = f'{key}:guard'
+        token = uuid.uuid4().hex
+        delay = self.poll_interval
+        while not await self.store.aadd(guard, token, 5):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+        try:
+            now = time.time()
+            waiters = [w for w in json.loads(await self.store.aget(f'{key}:waiters') or '[]') if w[2] > now]
+            waiters = sorted(update(waiters))
+            if waiters:
+                await self.store.aset(f'{key}:waiters', json.dumps(waiters), self.timeout + 5)
+            else:
+                await self.store.adelete(f'{key}:waiters')
+            return waiters
+        finally:
+            await self.store.adelete_if(guard, token)
+
+    async def _is_next(self, key: str, token: str) -> bool:
+        now = time.time()
+        waiters = [w for w in json.loads(await self.store.aget(f'{key}:waiters') or '[]') if w[2] > now]
+        return not waiters or waiters[0][1] == token
+
+    async def _acquire(self, key: str, token: str, order: Optional[float]) -> bool:
+        start = time.monotonic()
+        delay = self.poll_interval
+        while True:
+            if (order is None or await self._is_next(key, token)) and await self.store.aadd(key, token, self.ttl):
+                return True
+            if time.monotonic() - start >= self.timeout:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def _renew(self, key: str, token: str) -> None:
+        """保持している間、期限が切れる前にロックを延長し続ける"""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                held = await self.store.arefresh(key, token, self.ttl)
+            except Exception as e:
+                logger.error("SharedLock: %s のロックの延長に失敗しました: %s", key, e)
+                continue
+            if not held:
+                logger.warning("SharedLock: %s のロックが期限切れで失われました", key)
+                return
+
+    @asynccontextmanager
+    async def hold(self, key: str, order: Optional[float] = None):
+        token = f'{self.holder}:{uuid.uuid4().hex[:8]}'
+        start = time.monotonic()
+        if order is not None:
+            expires_at = time.time() + self.timeout + 1
+            await self._update_waiters(key, lambda waiters: waiters + [[order, token, expires_at]])
+        try:
+            acquired = await self._acquire(key, token, order)
+        finally:
+            if order is not None:
+                await self._update_waiters(key, lambda waiters: [w for w in waiters if w[1] != token])
+        lock_wait.observe(time.monotonic() - start)
+        if not acquired:
+            lock_timeouts.inc()
+            logger.warning("SharedLock: %s のロックを%s秒で取得できませんでした", key, self.timeout)
+            raise LockTimeout(key)
+        renewal = asyncio.create_task(self._renew(key, token))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            await asyncio.gather(renewal, return_exceptions=True)
+            await self.store.adelete_if(key, token)
@@ -0,0 +1,147 @@
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+import metrics
+from config import JST
+
+date_resolve_total = metrics.counter('date_resolve_total', '日付表現の解析件数（method=table|dateparser|none）')
+
+RELATIVE_DAYS = {
+    '今日': 0, 'きょう': 0, '本日': 0, 'today': 0,
+    '明日': 1, 'あした': 1, 'あす': 1, 'tomorrow': 1,
+    '明後日': 2, 'あさって': 2, 'day after tomorrow': 2,
+    '明明後日': 3, 'しあさって': 3,
+}
+
+WEEKDAYS = {'月': 0, '火': 1, '水': 2, '木': 3, '金': 4, '土': 5, '日': 6}
+
+KANJI_DIGITS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
+
+_NUMBER = r'(\d+|[一二三四五六七八九十]+)'
+_WEEKDAY = r'([月火水木金土日])(?:曜日?|曜)?'
+_PATTERNS = [
+    ('iso', re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$')),
+    ('ymd_ja', re.compile(r'^(\d{4})年(\d{1,2})月(\d{1,2})日?$')),
+    ('md_ja', re.compile(r'^(\d{1,2})月(\d{1,2})日?$')),
+    ('md_slash', re.compile(r'^(\d{1,2})/(\d{1,2})$')),
+    ('days_later', re.compile(rf'^{_NUMBER}日後$')),
+    ('weeks_later', re.compile(rf'^{_NUMBER}週間?後$')),
+    ('next_week_day', re.compile(rf'^(来週|再来週)の?{_WEEKDAY}$')),
+    ('this_week_day', re.compile(rf'^今週の?{_WEEKDAY}$')),
+    ('weekday', re.compile(rf'^{_WEEKDAY}$')),
+    ('next_week', re.compile(r'^(来週|再来週)$')),
+]
+
+
+def _to_int(value: str) -> int:
+    """算用数字または十以下を組み合わせた漢数字（二十三など）を整数にする"""
+    if value.isdigit():
+        return int(value)
+    total = 0
+    current = 0
+    for char in value:
+        digit = KANJI_DIGITS[char]
+        if digit == 10:
+            total += (current or 1) * 10
+            current = 0
+        else:
+            current = digit
+    return total + current
+
+
+def _next_weekday(today: date, weekday: int) -> date:
+    """今日以降で最初に来る指定曜日"""
+    return today + timedelta(days=(weekday - today.weekday()) % 7)
+
+
+def _week_start(today: date) -> date:
+    return today - timedelta(days=today.weekday())
+
+
+def _resolve_table(expr: str, today: date) -> Optional[date]:
+    if expr in RELATIVE_DAYS:
+        return today + timedelta(days=RELATIVE_DAYS[expr])
+    for kind, pattern in _PATTERNS:
+        match = pattern.match(expr)
+        if not match:
+            continue
+        groups = match.groups()
+        if kind in ('iso', 'ymd_ja'):
+            return date(int(groups[0]), int(groups[1]), int(groups[2]))
+        if kind in ('md_ja', 'md_slash'):
+            resolved = date(today.year, int(groups[0]), int(groups[1]))
+            # 年を省略した過去の日付は来年とみなす
+            return resolved if resolved >= today else resolved.replace(year=today.year + 1)
+        if kind == 'days_later':
+            return today + timedelta(days=_to_int(groups[0]))
+        if kind == 'weeks_later':
+            return today + timedelta(weeks=_to_int(groups[0]))
+        if kind == 'next_week_day':
+            weeks = 1 if groups[0] == '来週' else 2
+            return _week_start(today) + timedelta(weeks=weeks, days=WEEKDAYS[groups[1]])
+        if kind == 'this_week_day':
+            return _week_start(today) + timedelta(days=WEEKDAYS[groups[0]])
+        if kind == 'weekday':
+            return _next_weekday(today, WEEKDAYS[groups[0]])
+        if kind == 'next_week':
+            return today + timedelta(weeks=1 if groups[0] == '来週' else 2)
+    return None
+
+
+def _resolve_dateparser(expr: str, today: date) -> Optional[date]:
+    # dateparserは読み込みが重いため、表で解決できない表現が来たときに初めて読み込む
+    import dateparser
+    base = datetime.combine(today, datetime.min.time(), tzinfo=JST)
+    parsed = dateparser.parse(
+        expr,
+        languages=['ja'],
+        settings={
+            'RELATIVE_BASE': base.replace(tzinfo=None),
+            'PREFER_DATES_FROM': 'future',
+            'RETURN_AS_TIMEZONE_AWARE': True,
+            'TIMEZONE': 'Asia/Tokyo'
+        }
+    )
+    if parsed is None:
+        return None
+    parsed = parsed.replace(tzinfo=JST) if parsed.tzinfo is None else parsed.astimezone(JST)
+    resolved = parsed.date()
+    # 過去の日付になった場合は翌日に設定（従来の parse_date と同じ扱い）
+    if resolved < today:
+        resolved += timedelta(days=1)
+    return resolved
+
+
+def normalize_expression(expr: str) -> str:
+    return unicodedata.normalize('NFKC', expr).strip().lower().replace(' ', '')
+
+
+@lru_cache(maxsize=4096)
+def _resolve(expr: str, today: date) -> Optional[date]:
+    try:
+        resolved = _resolve_table(expr, today)
+    except (ValueError, KeyError):
+        resolved = None
+    if resolved is not None:
+        date_resolve_total.inc(method='table')
+        return resolved
+    resolved = _resolve_dateparser(expr, today)
+    date_resolve_total.inc(method='dateparser' if resolved is not None else 'none')
+    return resolved
+
+
+def resolve_date(expr: str, today: date) -> Optional[date]:
+    """日本語の日付表現を日付に変換する。解釈できなければNone
+
+    結果は (表現, 基準日) ごとにメモ化する。
+    """
+    if not expr:
+        return None
+    normalized = normalize_expression(expr)
+    # 'day after tomorrow' のような空白を含む英語表現は空白を詰める前に照合する
+    if expr.strip().lower() in RELATIVE_DAYS:
+        normalized = expr.strip().lower()
+    return _resolve(normalized, today)
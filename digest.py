@@ -0,0 +1,60 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import metrics
+
+# ダイジェストに持たせるタスクの項目（通知の文面に使うものだけ）
+DIGEST_FIELDS = ('content', 'scheduled_time', 'is_done')
+
+digest_writes = metrics.counter('digest_writes_total', '書き込んだダイジェスト数')
+digest_write_failures = metrics.counter('digest_write_failures_total', 'ダイジェストの書き込みに失敗した回数')
+notify_skipped = metrics.counter('notify_skipped_total', '通知を送らなかったユーザー数（reason=empty|unchanged）')
+
+
+def digest_tasks(tasks: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """時間順のタスク一覧から、ダイジェストに入れる項目だけを取り出す"""
+    return [{
+        'content': task.get('content'),
+        # DBはHH:MM:SS、登録直後の行はHH:MMのことがあるためそろえる
+        'scheduled_time': task['scheduled_time'][:5] if task.get('scheduled_time') else None,
+        'is_done': bool(task.get('is_done')),
+    } for task in tasks]
+
+
+def digest_version(items: List[Dict[str, Any]]) -> str:
+    """ダイジェストの内容のハッシュ（同じ内容なら同じ値）"""
+    encoded = json.dumps(items, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def build_digest(user_id: str, scheduled_date: str, tasks: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """ユーザー・日付のタスク一覧からダイジェストの行（DIGEST_COLUMNS）を作る"""
+    items = digest_tasks(tasks)
+    return {
+        'user_id': user_id,
+        'scheduled_date': scheduled_date,
+        'tasks': items,
+        'open_count': sum(1 for item in items if not item['is_done']),
+        'version': digest_version(items),
+        'updated_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class NotifiedVersions:
+    """ユーザー・日付ごとに、最後に通知したダイジェストの版を共有キー・バリューストアに記録する"""
+
+    def __init__(self, store, ttl: float = 2 * 24 * 60 * 60):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(scheduled_date: str, user_id: str) -> str:
+        return f'{scheduled_date}:{user_id}'
+
+    async def get(self, scheduled_date: str, user_id: str) -> Optional[str]:
+        return await self.store.aget(self.key(scheduled_date, user_id))
+
+    async def set(self, scheduled_date: str, user_id: str, version: str) -> None:
+        await self.store.aset(self.key(scheduled_date, user_id), version, self.ttl)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+keep_alive_pings = metrics.counter('keep_alive_pings_total', 'アイドル時に送った自己pingの数（result別）')
+
+# 自己pingに付けるヘッダー（アクセス計測・アイドル判定から除外する）
+KEEP_ALIVE_HEADER = 'X-Keep-Alive'
+
+
+class CachedCheck:
+    """依存サービスの疎通確認を並行実行し、結果を一定時間キャッシュする"""
+
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[None]]], ttl: float = 15, timeout: float = 2):
+        self.checks = checks
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result: Optional[Dict[str, str]] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _run_one(self, check: Callable[[], Awaitable[None]]) -> str:
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+            return 'ok'
+        except asyncio.TimeoutError:
+            return 'timeout'
+        except Exception as e:
+            return f'error: {type(e).__name__}'
+
+    async def result(self) -> Dict[str, str]:
+        """各チェックの結果（'ok' またはエラー内容）を返す"""
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                names = list(self.checks)
+                outcomes = await asyncio.gather(*(self._run_one(self.checks[name]) for name in names))
+                self._result = dict(zip(names, outcomes))
+                self._checked_at = time.monotonic()
+            return self._result
+
+
+class KeepAlive:
+    """実際のアクセスが一定時間ない場合だけ自分自身にpingしてスリープを防ぐ"""
+
+    def __init__(self, url: str, idle_seconds: float = 600, timeout: float = 10):
+        self.url = url
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self.last_activity = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self) -> None:
+        """実際のリクエストを受けたことを記録する"""
+        self.last_activity = time.monotonic()
+
+    async def _run(self) -> None:
+        # httpxは自己pingを始めるときに読み込む（起動時間を短くするため）
+        import httpx
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            while True:
+                idle = time.monotonic() - self.last_activity
+                if idle < self.idle_seconds:
+                    await asyncio.sleep(self.idle_seconds - idle)
+                    continue
+                try:
+                    response = await client.get(self.url, headers={KEEP_ALIVE_HEADER: '1'})
+                    keep_alive_pings.inc(result=str(response.status_code))
+                except Exception as e:
+                    keep_alive_pings.inc(result='error')
+                    logger.warning("Ping failed: %s", e)
+                # pingはアクセスとして数えないが、連続して送らないよう間隔を空ける
+                await asyncio.sleep(self.idle_seconds)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        logger.info("Keep-alive started (idle=%ss)", self.idle_seconds)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
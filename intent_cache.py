@@ -0,0 +1,34 @@
+import json
+import re
+from datetime import date
+from typing import Any, Dict, Optional
+
+from intent_parser import normalize
+
+_SPACES = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '?!。.、,'
+
+
+def normalize_key(message: str) -> str:
+    """表記ゆれ（全角/半角・空白・大文字小文字・末尾の句読点）を吸収したキャッシュキーを返す"""
+    return _SPACES.sub(' ', normalize(message)).lower().rstrip(_TRAILING_PUNCTUATION)
+
+
+class IntentCache:
+    """LLMの解析結果（アクション辞書）をメッセージと日付ごとにキャッシュする"""
+
+    def __init__(self, store, ttl: float = 6 * 60 * 60):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(message: str, today: date) -> str:
+        # プロンプトに日付が埋め込まれるため、相対日付が日をまたいで使い回されないよう日付をキーに含める
+        return f'{today.isoformat()}:{normalize_key(message)}'
+
+    async def get(self, message: str, today: date) -> Optional[Dict[str, Any]]:
+        value = await self.store.aget(self.key(message, today))
+        return json.loads(value) if value is not None else None
+
+    async def put(self, message: str, today: date, result: Dict[str, Any]) -> None:
+        await self.store.aset(self.key(message, today), json.dumps(result, ensure_ascii=False), self.ttl)
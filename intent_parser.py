@@ -0,0 +1,181 @@
+import re
+import unicodedata
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import DEFAULT_MIN_CONFIDENCE
+
+# READMEに記載しているコマンド書式をLLMを使わずに解析する
+LIST_WORDS = {'リスト', '一覧', 'タスク一覧', '今日のタスク', 'きょうのタスク', '今日の予定', '今日のリスト'}
+REGISTER_PREFIXES = ('タスク', '登録')
+COMPLETE_PREFIXES = ('完了', '済み', 'done')
+
+RELATIVE_DAYS = {
+    '今日': 0, 'きょう': 0,
+    '明日': 1, 'あした': 1, 'あす': 1,
+    '明後日': 2, 'あさって': 2,
+}
+
+_ISO_DATE = r'\d{4}-\d{1,2}-\d{1,2}'
+_DATE_TOKEN = re.compile(rf'^({_ISO_DATE}|' + '|'.join(sorted(RELATIVE_DAYS, key=len, reverse=True)) + r')$')
+_TIME_TOKEN = re.compile(r'^([01]?\d|2[0-3]):([0-5]\d)$')
+_LIST_DATE = re.compile(rf'^({_ISO_DATE}|' + '|'.join(RELATIVE_DAYS) + r')の?(タスク|予定|リスト)(一覧)?は?[?？]?$')
+# タスク内容にこれらが残っている場合は日時表現を取りこぼしている可能性が高い（「25:00」のような範囲外の時刻を含む）
+_UNPARSED_DATETIME = re.compile(
+    r'\d{1,2}[:：]\d{2}|\d+\s*(時|分|月|日)|\d+/\d+|来週|再来週|曜|午前|午後|朝|夜|今日|明日|明後日|あした|あさって'
+)
+# タスク内容がこれだけの場合は登録ではなく別のコマンドのつもりの可能性が高い（「タスク 一覧」など）
+_COMMAND_WORDS = LIST_WORDS | {'タスク', '予定', '登録', '完了'}
+
+# 複数タスクの区切り（改行は常に、読点・カンマは各要素が日付か時刻で始まる場合のみ区切りとみなす）
+_LINE_SEPARATOR = re.compile(r'\n+')
+_ITEM_SEPARATOR = re.compile(r'\s*[,、]\s*')
+_BULLET = re.compile(r'^\s*(?:[・\-*]|\d+[.)])\s*')
+# 一覧の番号による完了指定（「完了 2」「完了 1 3」「完了 2番」）
+_ORDINALS = re.compile(r'^\d+番?(?:\s+\d+番?)*$')
+
+
+def normalize(message: str) -> str:
+    """全角英数字・記号・空白を半角に揃え、前後の空白を除く"""
+    return unicodedata.normalize('NFKC', message).strip()
+
+
+def _resolve_date(token: str, today: date) -> Optional[str]:
+    """日付トークンをYYYY-MM-DDに変換する（今日の場合はNone）"""
+    if token in RELATIVE_DAYS:
+        days = RELATIVE_DAYS[token]
+        return None if days == 0 else (today + timedelta(days=days)).isoformat()
+    year, month, day = map(int, token.split('-'))
+    resolved = date(year, month, day)
+    return None if resolved == today else resolved.isoformat()
+
+
+def _action(action: str, task_content: Optional[str] = None, date_str: Optional[str] = None,
+            time_str: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        'action': action,
+        'task_content': task_content,
+        'date': date_str,
+        'time': time_str,
+        'remind_time': None,
+    }
+
+
+def _task(task_content: str, date_str: Optional[str] = None, time_str: Optional[str] = None) -> Dict[str, Any]:
+    return {'task_content': task_content, 'date': date_str, 'time': time_str, 'remind_time': None}
+
+
+def task_items(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """アクション辞書から対象タスクの一覧を取り出す（tasks がなければ単一タスクとして扱う）"""
+    items = result.get('tasks') or [result]
+    return [item for item in items if item.get('task_content')]
+
+
+def _split_items(text: str) -> List[str]:
+    """改行・読点で区切られた複数タスクを要素ごとに分ける"""
+    items = []
+    for line in _LINE_SEPARATOR.split(text):
+        line = _BULLET.sub('', line).strip()
+        if not line:
+            continue
+        parts = _ITEM_SEPARATOR.split(line)
+        # 「資料作成、印刷」のような内容中の読点では区切らない
+        if len(parts) > 1 and all(_starts_with_datetime(part) for part in parts[1:]):
+            items.extend(part for part in parts if part)
+        else:
+            items.append(line)
+    return items
+
+
+def _starts_with_datetime(text: str) -> bool:
+    head = text.split(maxsplit=1)[:1]
+    return bool(head) and bool(_DATE_TOKEN.match(head[0]) or _TIME_TOKEN.match(head[0]))
+
+
+def _parse_register_item(text: str, date_str: Optional[str], today: date):
+    """登録1件分（[日付] [HH:MM] 内容）を解析し、(タスク, 日付)を返す。日付省略時は前の要素の日付を引き継ぐ"""
+    tokens = text.split()
+    time_str = None
+    if tokens and _DATE_TOKEN.match(tokens[0]):
+        date_str = _resolve_date(tokens.pop(0), today)
+    if tokens:
+        time_match = _TIME_TOKEN.match(tokens[0])
+        if time_match:
+            tokens.pop(0)
+            time_str = f'{int(time_match.group(1)):02d}:{time_match.group(2)}'
+    return _task(' '.join(tokens), date_str, time_str), date_str
+
+
+def _strip_prefix(text: str, prefixes) -> Optional[str]:
+    for prefix in prefixes:
+        if text.lower().startswith(prefix.lower()):
+            return text[len(prefix):]
+    return None
+
+
+def parse_command(message: str, today: date) -> Tuple[Optional[Dict[str, Any]], float]:
+    """定型コマンドを解析し、(アクション辞書, 確信度)を返す。解析できなければ(None, 0.0)"""
+    text = normalize(message)
+    if not text:
+        return None, 0.0
+
+    # タスク一覧
+    if text in LIST_WORDS:
+        return _action('list'), 1.0
+    match = _LIST_DATE.match(text)
+    if match:
+        try:
+            date_str = _resolve_date(match.group(1), today)
+        except ValueError:
+            return None, 0.0
+        if date_str is None:
+            return _action('list'), 1.0
+        return _action('list_date', date_str=date_str), 1.0
+
+    # タスク完了（改行・読点区切りで複数指定可）
+    rest = _strip_prefix(text, COMPLETE_PREFIXES)
+    if rest is not None and rest[:1].isspace():
+        contents = []
+        ambiguous = False
+        for line in _LINE_SEPARATOR.split(rest):
+            line = _BULLET.sub('', line).strip()
+            parts = _ITEM_SEPARATOR.split(line)
+            if len(parts) > 1 and not all(_ORDINALS.match(part) for part in parts):
+                # 読点は番号の列挙（「完了 1、3」）でなければ内容の一部か区切りか決められないのでLLMに回す
+                ambiguous = True
+                parts = [line]
+            for item in parts:
+                if _ORDINALS.match(item):
+                    contents.extend(number.rstrip('番') for number in item.split())
+                elif item:
+                    contents.append(item)
+        if not contents:
+            return None, 0.0
+        result = _action('complete', task_content=contents[0])
+        if len(contents) > 1:
+            result['tasks'] = [_task(content) for content in contents]
+        return result, 0.5 if ambiguous else 0.95
+
+    # タスク登録: タスク [日付] [HH:MM] 内容（改行・読点区切りで複数指定可）
+    rest = _strip_prefix(text, REGISTER_PREFIXES)
+    if rest is not None and rest[:1].isspace():
+        tasks = []
+        date_str = None
+        try:
+            for item in _split_items(rest):
+                task, date_str = _parse_register_item(item, date_str, today)
+                tasks.append(task)
+        except ValueError:
+            return None, 0.0
+        if not tasks or not all(task['task_content'] for task in tasks):
+            return None, 0.0
+        ambiguous = any(_UNPARSED_DATETIME.search(task['task_content']) or task['task_content'] in _COMMAND_WORDS
+                        for task in tasks)
+        confidence = 0.5 if ambiguous else 0.9
+        first = tasks[0]
+        result = _action('register', task_content=first['task_content'], date_str=first['date'], time_str=first['time'])
+        if len(tasks) > 1:
+            result['tasks'] = tasks
+        return result, confidence
+
+    return None, 0.0
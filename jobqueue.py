@@ -0,0 +1,226 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+queue_enqueued = metrics.counter('event_queue_enqueued_total', 'キューに投入されたイベント数')
+queue_dropped = metrics.counter('event_queue_dropped_total', '破棄されたイベント数（reason別）')
+queue_processed = metrics.counter('event_queue_processed_total', '処理が完了したイベント数')
+queue_failed = metrics.counter('event_queue_failed_total', '処理中に例外となったイベント数')
+queue_wait = metrics.histogram('event_queue_wait_seconds', 'キュー投入から処理開始までの待ち時間')
+
+
+class RecentIds:
+    """一定時間内に見たIDを覚えておく、上限付きの重複判定セット"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, key: str) -> bool:
+        """未登録なら登録してTrue、TTL内に登録済みならFalseを返す"""
+        now = time.monotonic()
+        # 期限切れを古い順に掃除
+        while self._seen:
+            oldest_key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl:
+                break
+            self._seen.popitem(last=False)
+        if key in self._seen:
+            return False
+        self._seen[key] = now
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return True
+
+    def discard(self, key: str) -> None:
+        self._seen.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class QueueFull(Exception):
+    """キューが満杯（または未起動）でイベントを受け付けられない"""
+
+
+def user_key(event: Any) -> Optional[str]:
+    """イベントの送信元ユーザーID（順序を守る単位）"""
+    source = getattr(event, 'source', None)
+    return getattr(source, 'user_id', None)
+
+
+class EventQueue:
+    """Webhookイベントを受け付ける上限付きキューとワーカープール
+
+    同じキー（既定は送信元ユーザー）のイベントは受信順に1件ずつ処理し、別のキーのイベントは並行して処理する。
+    同じキーのイベントはキーごとの列に並べ、ワーカーが取り出すのは処理中でないキーだけにする
+    （1人のユーザーのイベントが続けて届いても、ワーカーが他のユーザーのイベントを待たせない）。
+    dedup_store を渡すと、webhookEventIdの重複判定をワーカー・インスタンス間で共有する。
+    """
+
+    def __init__(self, handler: Callable[[Any, Optional[str]], Awaitable[None]],
+                 maxsize: int = 1000, workers: int = 4,
+                 dedup_size: int = 10000, dedup_ttl: float = 600,
+                 dedup_store=None, key: Callable[[Any], Optional[str]] = user_key):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.recent_ids = RecentIds(dedup_size, dedup_ttl)
+        self.dedup_store = dedup_store
+        self.dedup_ttl = dedup_ttl
+        self.key = key
+        # 取り出せる項目（キーのないイベント、または次のイベントを処理できるキー）
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # キーごとの未処理イベントの列（処理中のキーは列が空でも残す）
+        self._pending: Dict[str, Deque[Tuple[Any, Optional[str], float]]] = {}
+        self._size = 0
+        metrics.gauge('event_queue_depth', 'キューに滞留しているイベント数', self.depth)
+
+    def depth(self) -> int:
+        return self._size
+
+    async def start(self) -> None:
+        """ワーカーを起動する"""
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("EventQueue: ワーカー%s個を起動しました (maxsize=%s)", self.workers, self.maxsize)
+
+    async def stop(self, timeout: float = 10) -> None:
+        """滞留中のイベントを処理し終えてからワーカーを停止する"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("EventQueue: 停止時に%s件が未処理のまま残りました", self._size)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _is_new(self, event_id: str) -> bool:
+        if self.dedup_store is None:
+            return self.recent_ids.add(event_id)
+        try:
+            return await self.dedup_store.aadd(f'event:{event_id}', '1', self.dedup_ttl)
+        except Exception as e:
+            # 共有ストアの障害時はプロセス内の判定で代用する
+            logger.error("EventQueue: 重複判定ストアにアクセスできません: %s", e)
+            return self.recent_ids.add(event_id)
+
+    async def forget(self, event: Any) -> None:
+        """is_new で記録したwebhookEventIdを消す（積めなかったイベントの再送を重複扱いしない）"""
+        event_id = getattr(event, 'webhook_event_id', None)
+        if not event_id:
+            return
+        self.recent_ids.discard(event_id)
+        if self.dedup_store is not None:
+            try:
+                await self.dedup_store.adelete(f'event:{event_id}')
+            except Exception as e:
+                logger.error("EventQueue: 重複判定ストアにアクセスできません: %s", e)
+
+    async def is_new(self, event: Any) -> bool:
+        """webhookEventIdが初めて届いたものならTrue（重複なら破棄数に数えてFalse）"""
+        event_id = getattr(event, 'webhook_event_id', None)
+        if event_id and not await self._is_new(event_id):
+            queue_dropped.inc(reason='duplicate')
+            return False
+        return True
+
+    async def submit(self, event: Any, destination: Optional[str] = None) -> bool:
+        """重複を除いてイベントをキューに積む。重複ならFalseを返し、満杯なら QueueFull を送出する
+
+        webhookEventIdは積めた場合だけ記録として残す（満杯で断ったイベントの再送を受け付けられるように）。
+        """
+        self.ensure_capacity(event)
+        if not await self.is_new(event):
+            return False
+        if not self.put(event, destination):
+            await self.forget(event)
+            raise QueueFull()
+        return True
+
+    def ensure_capacity(self, event: Any) -> None:
+        """キューが満杯・未起動なら QueueFull を送出する"""
+        if self._queue is None:
+            queue_dropped.inc(reason='not_started')
+            raise QueueFull()
+        if self._size >= self.maxsize:
+            queue_dropped.inc(reason='full')
+            logger.warning("EventQueue: キューが満杯のためイベントを断りました: %s", getattr(event, 'webhook_event_id', None))
+            raise QueueFull()
+
+    def put(self, event: Any, destination: Optional[str] = None, force: bool = False) -> bool:
+        """重複判定をせずにイベントをキューに積む。満杯の場合はFalseを返す
+
+        force=True なら上限を超えても積む（受け付けを済ませた後でキューに移すイベント用）。
+        """
+        event_id = getattr(event, 'webhook_event_id', None)
+        if self._queue is None:
+            queue_dropped.inc(reason='not_started')
+            return False
+        if self._size >= self.maxsize and not force:
+            queue_dropped.inc(reason='full')
+            logger.warning("EventQueue: キューが満杯のためイベントを破棄しました: %s", event_id)
+            return False
+        item = (event, destination, time.monotonic())
+        key = self.key(event)
+        self._size += 1
+        if key is None:
+            self._queue.put_nowait((None, item))
+        elif key in self._pending:
+            # 同じキーのイベントが処理中・待機中なら、その後ろに並べる
+            self._pending[key].append(item)
+        else:
+            self._pending[key] = deque([item])
+            self._queue.put_nowait((key, None))
+        queue_enqueued.inc()
+        return True
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            key, item = await self._queue.get()
+            try:
+                if key is not None:
+                    item = self._pending[key].popleft()
+                self._size -= 1
+                event, destination, enqueued_at = item
+                queue_wait.observe(time.monotonic() - enqueued_at)
+                try:
+                    await self.handler(event, destination)
+                    queue_processed.inc()
+                except Exception as e:
+                    queue_failed.inc()
+                    logger.error("EventQueue: ワーカー%sで処理に失敗しました: %s", index, e, exc_info=True)
+            finally:
+                if key is not None:
+                    if self._pending[key]:
+                        # 同じキーの次のイベントは最後尾に回し、他のキーのイベントを先に処理する
+                        self._queue.put_nowait((key, None))
+                    else:
+                        del self._pending[key]
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """キューの状態を返す"""
+        return {
+            'depth': self.depth(),
+            'maxsize': self.maxsize,
+            'workers': self.workers,
+            'keys': len(self._pending),
+            'enqueued': queue_enqueued.value(),
+            'processed': queue_processed.value(),
+            'failed': queue_failed.value(),
+            'dropped_full': queue_dropped.value(reason='full'),
+            'dropped_duplicate': queue_dropped.value(reason='duplicate'),
+            'wait_seconds_avg': queue_wait.sum() / queue_wait.count() if queue_wait.count() else 0.0,
+        }
@@ -0,0 +1,287 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import metrics
+
+cache_hits = metrics.counter('cache_hits_total', 'キャッシュヒット数（cache別）')
+cache_misses = metrics.counter('cache_misses_total', 'キャッシュミス数（cache別）')
+cache_evictions = metrics.counter('cache_evictions_total', '容量超過で追い出されたエントリ数（cache別）')
+
+
+class _Store:
+    """各メソッドの非同期版（a付き）。イベントループを止めないよう、既定ではスレッドプールで同期のメソッドを実行する"""
+
+    async def _call(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await self._call(self.get, key)
+
+    async def aset(self, key: str, value: str, ttl: float) -> None:
+        await self._call(self.set, key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        await self._call(self.delete, key)
+
+    async def aadd(self, key: str, value: str, ttl: float) -> bool:
+        return await self._call(self.add, key, value, ttl)
+
+    async def arefresh(self, key: str, value: str, ttl: float) -> bool:
+        return await self._call(self.refresh, key, value, ttl)
+
+    async def adelete_if(self, key: str, value: str) -> bool:
+        return await self._call(self.delete_if, key, value)
+
+
+class MemoryStore(_Store):
+    """プロセス内のLRU+TTLキー・バリューストア"""
+
+    def __init__(self, name: str, max_entries: int = 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def _call(self, func, *args):
+        # I/Oを伴わないのでスレッドに渡さずそのまま実行する
+        return func(*args)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > time.monotonic():
+                self._data.move_to_end(key)
+                cache_hits.inc(cache=self.name)
+                return item[0]
+            if item is not None:
+                del self._data[key]
+        cache_misses.inc(cache=self.name)
+        return None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                cache_evictions.inc(cache=self.name)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """キーがない（期限切れを含む）場合だけ保存してTrueを返す"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > time.monotonic():
+                return False
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                cache_evictions.inc(cache=self.name)
+            return True
+
+    def refresh(self, key: str, value: str, ttl: float) -> bool:
+        """値が value のままであれば有効期限を延ばしてTrueを返す"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] != value or item[1] <= time.monotonic():
+                return False
+            self._data[key] = (value, time.monotonic() + ttl)
+            return True
+
+    def delete_if(self, key: str, value: str) -> bool:
+        """値が value のままであれば削除してTrueを返す"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] != value:
+                return False
+            del self._data[key]
+            return True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteStore(_Store):
+    """複数ワーカーで共有できるSQLiteファイル上のキー・バリューストア
+
+    期限切れの掃除と上限を超えた分の追い出しは書き込みのたびではなく、evict_interval 秒に1回まとめて行う
+    （その間は max_entries を一時的に超えることがある）。
+    """
+
+    def __init__(self, name: str, path: str, max_entries: int = 10000, evict_interval: float = 1.0):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self._next_evict = 0.0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            'name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL, used_at REAL NOT NULL, PRIMARY KEY (name, key))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS kv_used_at ON kv (name, used_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (name, expires_at)')
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value FROM kv WHERE name = ? AND key = ? AND expires_at > ?',
+            (self.name, key, now)
+        ).fetchone()
+        if row is None:
+            cache_misses.inc(cache=self.name)
+            return None
+        conn.execute('UPDATE kv SET used_at = ? WHERE name = ? AND key = ?', (now, self.name, key))
+        cache_hits.inc(cache=self.name)
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO kv (name, key, value, expires_at, used_at) VALUES (?, ?, ?, ?, ?)',
+            (self.name, key, value, now + ttl, now)
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        # 期限切れを掃除し、上限を超えた分は最終利用が古い順に追い出す
+        if now < self._next_evict:
+            return
+        self._next_evict = now + self.evict_interval
+        conn.execute('DELETE FROM kv WHERE name = ? AND expires_at <= ?', (self.name, now))
+        excess = conn.execute('SELECT COUNT(*) FROM kv WHERE name = ?', (self.name,)).fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        evicted = conn.execute(
+            'DELETE FROM kv WHERE name = ? AND key IN ('
+            'SELECT key FROM kv WHERE name = ? ORDER BY used_at LIMIT ?)',
+            (self.name, self.name, excess)
+        ).rowcount
+        if evicted > 0:
+            cache_evictions.inc(evicted, cache=self.name)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute('DELETE FROM kv WHERE name = ? AND key = ?', (self.name, key))
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """キーがない（期限切れを含む）場合だけ保存してTrueを返す（プロセス間でも1つだけが成功する）"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('DELETE FROM kv WHERE name = ? AND key = ? AND expires_at <= ?', (self.name, key, now))
+        inserted = conn.execute(
+            'INSERT OR IGNORE INTO kv (name, key, value, expires_at, used_at) VALUES (?, ?, ?, ?, ?)',
+            (self.name, key, value, now + ttl, now)
+        ).rowcount
+        if inserted:
+            self._evict(conn, now)
+        return inserted > 0
+
+    def refresh(self, key: str, value: str, ttl: float) -> bool:
+        """値が value のままであれば有効期限を延ばしてTrueを返す"""
+        now = time.time()
+        return self._conn().execute(
+            'UPDATE kv SET expires_at = ?, used_at = ? WHERE name = ? AND key = ? AND value = ? AND expires_at > ?',
+            (now + ttl, now, self.name, key, value, now)
+        ).rowcount > 0
+
+    def delete_if(self, key: str, value: str) -> bool:
+        """値が value のままであれば削除してTrueを返す"""
+        return self._conn().execute(
+            'DELETE FROM kv WHERE name = ? AND key = ? AND value = ?', (self.name, key, value)
+        ).rowcount > 0
+
+
+# 値を確かめてから延長・削除する処理はRedis側でアトミックに実行する
+_REDIS_REFRESH = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+)
+_REDIS_DELETE_IF = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RedisStore(_Store):
+    """Redis（またはRedis互換のローカルサーバー）上のキー・バリューストア"""
+
+    def __init__(self, name: str, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('Redisバックエンドを使うには redis パッケージをインストールしてください')
+        self.name = name
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._refresh = self._client.register_script(_REDIS_REFRESH)
+        self._delete_if = self._client.register_script(_REDIS_DELETE_IF)
+
+    def _key(self, key: str) -> str:
+        return f'{self.name}:{key}'
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(self._key(key))
+        if value is None:
+            cache_misses.inc(cache=self.name)
+        else:
+            cache_hits.inc(cache=self.name)
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        # 追い出しはRedis側のmaxmemory-policyに任せる（キャッシュ以外を置くインスタンスはnoevictionにする）
+        self._client.set(self._key(key), value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._key(key))
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """キーがない場合だけ保存してTrueを返す（SET NX）"""
+        return bool(self._client.set(self._key(key), value, px=max(1, int(ttl * 1000)), nx=True))
+
+    def refresh(self, key: str, value: str, ttl: float) -> bool:
+        """値が value のままであれば有効期限を延ばしてTrueを返す"""
+        return bool(self._refresh(keys=[self._key(key)], args=[value, max(1, int(ttl * 1000))]))
+
+    def delete_if(self, key: str, value: str) -> bool:
+        """値が value のままであれば削除してTrueを返す"""
+        return bool(self._delete_if(keys=[self._key(key)], args=[value]))
+
+
+def create_store(name: str, backend: str = 'memory', url: Optional[str] = None, max_entries: int = 1024):
+    """設定に応じたキー・バリューストアを生成する"""
+    if backend == 'memory':
+        return MemoryStore(name, max_entries)
+    if backend == 'sqlite':
+        return SqliteStore(name, url or 'cache.sqlite3', max_entries)
+    if backend == 'redis':
+        return RedisStore(name, url or 'redis://localhost:6379/0')
+    raise ValueError(f'不明なキャッシュバックエンドです: {backend}')
+
+
+def cache_stats(name: str) -> dict:
+    """指定したキャッシュのヒット・ミス・追い出し数を返す"""
+    hits = cache_hits.value(cache=name)
+    misses = cache_misses.value(cache=name)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'evictions': cache_evictions.value(cache=name),
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
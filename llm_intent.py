@@ -0,0 +1,166 @@
+import json
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+ACTIONS = ('register', 'complete', 'list', 'list_date', 'remind', 'current_time')
+FIELDS = ('task_content', 'date', 'time', 'remind_time')
+FUNCTION_NAME = 'parse_intent'
+
+llm_calls = metrics.counter('llm_calls_total', 'LLM呼び出し数（result=ok|invalid|truncated）')
+llm_tokens = metrics.counter('llm_tokens_total', 'LLMの入出力トークン数（kind=prompt|completion）')
+llm_call_seconds = metrics.histogram('llm_call_seconds', 'LLM呼び出し1回の所要時間')
+
+_TIME = re.compile(r'^\d{1,2}:\d{2}$')
+_WEEKDAYS = '月火水木金土日'
+
+
+def _nullable(description: str) -> Dict[str, Any]:
+    return {'type': ['string', 'null'], 'description': description}
+
+
+_TASK_PROPERTIES = {
+    'task_content': _nullable('タスクの内容'),
+    'date': _nullable('YYYY-MM-DD。今日ならnull'),
+    'time': _nullable('HH:MM'),
+    'remind_time': _nullable('HH:MM'),
+}
+
+# strictモード（Structured Outputs）でも使えるよう、全項目を必須にしてnullで省略を表す
+INTENT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'action': {'type': 'string', 'enum': list(ACTIONS)},
+        **_TASK_PROPERTIES,
+        'tasks': {
+            'type': ['array', 'null'],
+            'description': '複数タスクのときだけ',
+            'items': {
+                'type': 'object',
+                'properties': _TASK_PROPERTIES,
+                'required': list(FIELDS),
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['action', *FIELDS, 'tasks'],
+    'additionalProperties': False,
+}
+
+# 日付を含まない固定部分（先頭に置き、毎回同じ文字列にしてプロンプトキャッシュを効かせる）
+STATIC_PROMPT = """LINEのタスク管理Botへのメッセージを解析し、parse_intentを呼び出してください。
+action: register=登録 complete=完了 list=今日の一覧 list_date=指定日の一覧 remind=リマインド設定 current_time=現在日時
+- 日付は後述の今日を基準にYYYY-MM-DDで答え、今日ならnull
+- 時刻はHH:MM、指定がなければnull
+- 複数のタスクはtasksに入れ、日付を省略した要素は直前の要素の日付にする
+- 一覧の番号で完了を指定されたらtask_contentは番号（数字のみ）"""
+
+
+class IntentSchemaError(ValueError):
+    """LLMの出力がスキーマに合わない（reason=invalid|truncated）"""
+
+    def __init__(self, message: str, reason: str = 'invalid'):
+        super().__init__(message)
+        self.reason = reason
+
+
+def tools(strict: bool = False) -> List[Dict[str, Any]]:
+    """function callingで渡すツール定義"""
+    function = {'name': FUNCTION_NAME, 'description': 'メッセージの意図', 'parameters': INTENT_SCHEMA}
+    if strict:
+        function['strict'] = True
+    return [{'type': 'function', 'function': function}]
+
+
+TOOL_CHOICE = {'type': 'function', 'function': {'name': FUNCTION_NAME}}
+
+
+@lru_cache(maxsize=4)
+def date_prompt(today: date) -> str:
+    """日付ごとに変わる部分"""
+    return f'今日は{today.isoformat()}（{_WEEKDAYS[today.weekday()]}）です。'
+
+
+def build_messages(message: str, today: date) -> List[Dict[str, str]]:
+    return [
+        {'role': 'system', 'content': STATIC_PROMPT},
+        {'role': 'system', 'content': date_prompt(today)},
+        {'role': 'user', 'content': message},
+    ]
+
+
+def _check_fields(item: Dict[str, Any], where: str) -> Dict[str, Optional[str]]:
+    fields = {}
+    for name in FIELDS:
+        value = item.get(name)
+        if value is not None and not isinstance(value, str):
+            raise IntentSchemaError(f'{where}{name} must be a string or null')
+        if isinstance(value, str):
+            value = value.strip() or None
+        if value is not None and name in ('time', 'remind_time') and not _TIME.match(value):
+            raise IntentSchemaError(f'{where}{name} is not HH:MM: {value}')
+        fields[name] = value
+    return fields
+
+
+def validate_intent(data: Any) -> Dict[str, Any]:
+    """スキーマどおりか確かめ、アプリで使う形（tasksは複数のときだけ）にそろえて返す"""
+    if not isinstance(data, dict):
+        raise IntentSchemaError('intent must be an object')
+    action = data.get('action')
+    if action not in ACTIONS:
+        raise IntentSchemaError(f'unknown action: {action}')
+    result = {'action': action, **_check_fields(data, '')}
+    tasks = data.get('tasks')
+    if tasks is not None:
+        if not isinstance(tasks, list) or not all(isinstance(task, dict) for task in tasks):
+            raise IntentSchemaError('tasks must be an array of objects or null')
+        if len(tasks) > 1:
+            result['tasks'] = [_check_fields(task, f'tasks[{i}].') for i, task in enumerate(tasks)]
+        elif tasks and not result['task_content']:
+            result.update(_check_fields(tasks[0], 'tasks[0].'))
+    return result
+
+
+def parse_response(response) -> Dict[str, Any]:
+    """ツール呼び出しの引数を取り出して検証する。切り詰め・不正な出力は IntentSchemaError"""
+    choice = response.choices[0]
+    if choice.finish_reason == 'length':
+        raise IntentSchemaError('output truncated by max_tokens', reason='truncated')
+    tool_calls = choice.message.tool_calls or []
+    if not tool_calls:
+        raise IntentSchemaError('no tool call in response')
+    try:
+        data = json.loads(tool_calls[0].function.arguments)
+    except json.JSONDecodeError as e:
+        raise IntentSchemaError(f'arguments are not JSON: {e}')
+    return validate_intent(data)
+
+
+def record_usage(response, elapsed: float, result: str) -> Dict[str, int]:
+    """1回の呼び出しのトークン数・所要時間を記録し、トークン数を返す"""
+    usage = getattr(response, 'usage', None)
+    prompt = getattr(usage, 'prompt_tokens', 0) or 0
+    completion = getattr(usage, 'completion_tokens', 0) or 0
+    llm_calls.inc(result=result)
+    llm_tokens.inc(prompt, kind='prompt')
+    llm_tokens.inc(completion, kind='completion')
+    llm_call_seconds.observe(elapsed)
+    return {'prompt_tokens': prompt, 'completion_tokens': completion}
+
+
+def usage_stats() -> Dict[str, float]:
+    """呼び出し1回あたりのトークン数・所要時間"""
+    calls = llm_call_seconds.count()
+    prompt = llm_tokens.value(kind='prompt')
+    completion = llm_tokens.value(kind='completion')
+    return {
+        'calls': calls,
+        'invalid': llm_calls.value(result='invalid') + llm_calls.value(result='truncated'),
+        'prompt_tokens_avg': prompt / calls if calls else 0.0,
+        'completion_tokens_avg': completion / calls if calls else 0.0,
+        'latency_avg': llm_call_seconds.sum() / calls if calls else 0.0,
+    }
@@ -0,0 +1,114 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+import config
+
+# 処理中のWebhookイベントID（ログの相関IDとして出力する）
+request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+# LogRecordの標準属性（これ以外の属性は extra として出力する）
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行のJSONにする"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            data['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """呼び出し元のコンテキストから相関IDを付与し、WARNING未満のログを間引く"""
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        record.request_id = request_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 整形は出力スレッドに任せ、呼び出し側ではメッセージ引数の評価だけ済ませる
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: Optional[str] = None, sample_rate: Optional[float] = None, stream=None) -> None:
+    """JSON形式・キュー経由（出力は別スレッド）のロギングを設定する
+
+    LOG_LEVEL でレベルを、LOG_SAMPLE_RATE でWARNING未満のログを残す割合を指定できる。
+    """
+    global _listener
+    if _listener is not None:
+        return
+    level = level or config.LOG_LEVEL
+    sample_rate = sample_rate if sample_rate is not None else config.LOG_SAMPLE_RATE
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    # 出力しない呼び出し元・スレッド・プロセス情報の収集を省く（logging HOWTOの最適化の項を参照）
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(ContextFilter(sample_rate))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+    # HTTPクライアントはリクエストごとにINFOを出すため、DEBUG以外では抑える
+    if root.level > logging.DEBUG:
+        for name in ('httpx', 'httpcore'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def shutdown_logging() -> None:
+    """キューに残っているログを出力し切ってから出力スレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
@@ -1,50 +1,325 @@
+import config
+from config import JST
 from fastapi import FastAPI, Request, HTTPException
-from linebot.v3 import WebhookHandler
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
-from linebot.v3.messaging import TextMessage
-from linebot.v3.exceptions import InvalidSignatureError
-import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
-from datetime import datetime, time, timedelta
-import re
-import threading
-import requests
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
+import uuid
+from datetime import datetime, time
 import time as time_module
-import openai
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterable, List, Tuple
+from contextlib import asynccontextmanager
 from zoneinfo import ZoneInfo
-import dateparser
-from functools import wraps
-
-# 環境変数の読み込み
-load_dotenv()
-
-# OpenAIの設定
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-# LINE Botの設定
-configuration = Configuration(access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
-handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET'))
-client = ApiClient(configuration)
-line_bot_api = MessagingApi(client)
-
-# Supabaseの設定
-# サービスロールキーを使用してRLSをバイパス
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_SERVICE_ROLE_KEY', os.getenv('SUPABASE_KEY'))  # サービスロールキーがない場合は通常のキーを使用
+from jobqueue import EventQueue, QueueFull, user_key
+from coalescer import MessageBatch, MessageCoalescer
+from coordination import LeaderLease, LockTimeout, SharedLock
+import llm_intent
+from llm_intent import IntentSchemaError
+from resilience import (AdmissionGate, Breakers, CircuitOpenError, Overloaded, RateLimiter, Throttled,
+                        backoff_delay, call_with_retry, is_retryable, requests_shed, requests_throttled)
+from intent_parser import parse_command, task_items
+from date_resolver import resolve_date
+from intent_cache import IntentCache
+from task_cache import TaskCache
+from digest import build_digest, digest_write_failures, digest_writes
+from task_store import TaskStore, SqliteTaskStore, SupabaseTaskStore, TaskReplicator
+from task_matcher import OrdinalMap, match_task
+from scheduler import ReminderInbox, Scheduler, schedule_task_reminder, load_task_reminders, sync_task_reminders
+import notify
+import clients
+from health import CachedCheck, KeepAlive, KEEP_ALIVE_HEADER
+from logging_config import get_logger, setup_logging, request_id
+from tracing import setup_tracing, shutdown_tracing, traced
+import kvstore
+import metrics
+import tracing
+
+if TYPE_CHECKING:
+    from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi
+    from openai import AsyncOpenAI
+    from supabase import AClient
+
+# ログはJSON形式でキュー経由（別スレッド）で出力する
+setup_logging()
+logger = get_logger(__name__)
+# 処理の段階ごとの所要時間・トレースの書き出し・遅いリクエストのプロファイル（tracing.py）
+setup_tracing()
+
+# 外部サービスのクライアント（起動後にバックグラウンドで1つずつ生成し、接続を使い回す）
+# SDKの読み込みもそのときに行い、モジュールの読み込みと/healthzの応答を待たせない（clients.py）
+openai_client: Optional["AsyncOpenAI"] = None
+line_api_client: Optional["AsyncApiClient"] = None
+line_bot_api: Optional["AsyncMessagingApi"] = None
+supabase: Optional["AClient"] = None
+task_store: Optional[TaskStore] = None
+replicator: Optional[TaskReplicator] = None
+
+# タスクの保存先（supabase / sqlite）。sqliteの場合はTASK_REPLICATIONでSupabaseへ複製できる
+TASK_STORE_BACKEND = config.TASK_STORE_BACKEND
+TASK_REPLICATION = config.TASK_REPLICATION
+
+# テスト・ベンチマークで差し替えるクライアント（'openai' / 'line' / 'supabase' / 'task_store'）
+client_overrides: Dict[str, Any] = {}
+
+async def create_clients(**overrides):
+    """OpenAI・LINE・Supabaseの非同期クライアントを生成する
+
+    overrides（または client_overrides）に渡したクライアントは生成せずにそのまま使う。
+    """
+    global openai_client, line_api_client, line_bot_api, supabase, task_store, replicator
+    overrides = {**client_overrides, **overrides}
+    # OpenAIの設定（OPENAI_BASE_URLで接続先を変更できる）
+    openai_client = overrides.get('openai') or clients.create_openai()
+
+    # LINE Botの設定
+    line_api_client = overrides.get('line') or clients.create_line_api(config.LINE_POOL_SIZE)
+    line_bot_api = clients.messaging_api(line_api_client)
+
+    # Supabaseの設定（SQLiteのみで複製しない場合は使わない）
+    # サービスロールキーを使用してRLSをバイパス（ない場合は通常のキーを使用）
+    supabase = overrides.get('supabase')
+    if supabase is None and (TASK_STORE_BACKEND == 'supabase' or TASK_REPLICATION):
+        supabase = await clients.create_supabase(service_role=True)
+
+    # タスクの保存先
+    task_store = overrides.get('task_store') or await clients.open_task_store(supabase)
+    replicator = None
+    if isinstance(task_store, SqliteTaskStore) and TASK_REPLICATION:
+        replicator = TaskReplicator(
+            task_store,
+            SupabaseTaskStore(supabase),
+            interval=config.TASK_REPLICATION_INTERVAL,
+            batch_size=config.TASK_REPLICATION_BATCH
+        )
+
+async def close_clients():
+    """生成したクライアントの接続を閉じる"""
+    if openai_client is not None:
+        await openai_client.close()
+    if line_api_client is not None:
+        await line_api_client.close()
+    if isinstance(task_store, SqliteTaskStore):
+        await task_store.close()
+    if supabase is not None:
+        await supabase.postgrest.aclose()
+
+async def on_elected():
+    """リーダーになったワーカーだけがスケジューラ・自己ping・複製を動かす"""
+    if SCHEDULER_ENABLED:
+        await start_scheduler()
+    if keep_alive is not None:
+        keep_alive.start()
+    if replicator is not None:
+        replicator.start()
+
+async def on_revoked():
+    global scheduler
+    if keep_alive is not None:
+        await keep_alive.stop()
+    if scheduler is not None:
+        await scheduler.stop()
+        scheduler = None
+    if replicator is not None:
+        await replicator.stop()
+
+# クライアントの生成・複製の初期読み込み・リーダーの選出が終わったら立てる（イベントの処理はそれまで待つ）
+started = asyncio.Event()
+# 起動処理がスレッドでSDKを読み込んでいるタスク
+sdk_loading: Optional[asyncio.Task] = None
+
+async def wait_sdk_loaded():
+    """SDKの読み込み中は終わるまで待つ（別スレッドで読み込み中のモジュールを並行して読み込むとデッドロックするため）"""
+    if sdk_loading is not None and not sdk_loading.done():
+        await asyncio.wait([sdk_loading])
+
+async def startup():
+    """SDKをスレッドで読み込んでからクライアントを生成する。失敗したらバックオフして再試行する"""
+    global sdk_loading
+    start = time_module.perf_counter()
+    sdk_loading = asyncio.create_task(asyncio.to_thread(clients.preload))
+    try:
+        await sdk_loading
+    except Exception as e:
+        logger.error("SDKの読み込みに失敗しました: %s", e)
+    attempt = 0
+    while True:
+        try:
+            await create_clients()
+            if replicator is not None:
+                await replicator.bootstrap()
+            break
+        except Exception as e:
+            delay = backoff_delay(attempt, 1, 60)
+            attempt += 1
+            logger.error("起動処理に失敗しました（%.1f秒後に再試行）: %s", delay, e)
+            await asyncio.sleep(delay)
+    await leader.start()
+    started.set()
+    elapsed = time_module.perf_counter() - start
+    startup_seconds.set(elapsed)
+    logger.info("起動処理が完了しました", extra={'elapsed_ms': round(elapsed * 1000, 1)})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 起動処理を待たずにリクエストを受け付ける（/healthzはすぐ応答し、/readyzは完了まで503を返す）
+    await event_queue.start()
+    startup_task = asyncio.create_task(startup())
+    yield
+    if not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    await leader.stop()
+    coalescer.flush_all()
+    await event_queue.stop()
+    shutdown_tracing()
+    if replicator is not None:
+        await replicator.stop()
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
+
+# スリープ防止のための自己ping（実際のアクセスがKEEP_ALIVE_IDLE秒ない場合のみ送る）
+RENDER_URL = config.RENDER_URL
+PORT = config.PORT
+KEEP_ALIVE_ENABLED = config.KEEP_ALIVE_ENABLED
+keep_alive = KeepAlive(
+    RENDER_URL.rstrip('/') + '/healthz',
+    idle_seconds=config.KEEP_ALIVE_IDLE
+) if RENDER_URL and KEEP_ALIVE_ENABLED else None
+
+startup_seconds = metrics.gauge('startup_seconds', '起動処理（SDKの読み込み・クライアントの生成）にかかった秒数')
+request_duration_seconds = metrics.histogram('request_duration_seconds', 'メッセージ処理全体の所要時間（action別）')
+external_call_seconds = metrics.histogram('external_call_seconds', '外部API呼び出しの所要時間（service・op別）')
+http_request_duration_seconds = metrics.histogram('http_request_duration_seconds', 'HTTPリクエストの処理時間（path別）')
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    start = time_module.perf_counter()
+    response = await call_next(request)
+    if request.headers.get(KEEP_ALIVE_HEADER) is None:
+        # パスそのものではなくルートの定義（/tasks/{id} など）で集計し、どのルートにも当たらなければ unmatched にまとめる
+        route = request.scope.get('route')
+        path = getattr(route, 'path', None) or 'unmatched'
+        http_request_duration_seconds.observe(time_module.perf_counter() - start, path=path)
+        if keep_alive is not None:
+            keep_alive.touch()
+    return response
+
+# 通知・リマインドのスケジューラ設定
+SCHEDULER_ENABLED = config.SCHEDULER_ENABLED
+MORNING_DIGEST_TIME = config.MORNING_DIGEST_TIME
+AFTERNOON_DIGEST_TIME = config.AFTERNOON_DIGEST_TIME
+REMINDER_SYNC_INTERVAL = config.REMINDER_SYNC_INTERVAL
+scheduler: Optional[Scheduler] = None
+
+# 登録・完了のたびにユーザー・日付ごとのダイジェストを書き込み、通知はそれを読む
+DIGESTS_ENABLED = config.DIGESTS_ENABLED
+
+# 意図解析に使うモデル
+LLM_MODEL = config.LLM_MODEL
+# 出力トークン数の上限（tasksが多いメッセージでも足りる程度）
+LLM_MAX_TOKENS = config.LLM_MAX_TOKENS
+# Structured Outputsに対応したモデル（gpt-4o-miniなど）ではtrueにするとスキーマどおりの出力が保証される
+LLM_TOOLS = llm_intent.tools(strict=config.LLM_STRICT_SCHEMA)
+
+# 定型コマンド解析の確信度がこの値未満ならLLMに回す
+FAST_PATH_MIN_CONFIDENCE = config.FAST_PATH_MIN_CONFIDENCE
+
+# レート制限（ワーカーごとのトークンバケット、レートを0にすると無効）
+user_limiter = RateLimiter(
+    rate=config.USER_RATE_PER_MINUTE / 60,
+    burst=config.USER_BURST
+)
+llm_user_limiter = RateLimiter(
+    rate=config.LLM_USER_RATE_PER_MINUTE / 60,
+    burst=config.LLM_USER_BURST
 )
+llm_global_limiter = RateLimiter(
+    rate=config.LLM_GLOBAL_RATE,
+    burst=config.LLM_GLOBAL_BURST
+)
+# 同時に実行するLLM呼び出しの上限（空きを待ちきれない分は断る）
+llm_gate = AdmissionGate(
+    config.LLM_MAX_CONCURRENCY,
+    max_waiting=config.LLM_MAX_WAITING,
+    timeout=config.LLM_ADMISSION_TIMEOUT
+)
+metrics.gauge('llm_in_flight', '実行中のLLM呼び出し数', llm_gate.in_flight)
+
+# 外部API（openai / line / supabase / sqlite）ごとのサーキットブレーカーとリトライ
+breakers = Breakers(
+    failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=config.CIRCUIT_RESET_TIMEOUT
+)
+EXTERNAL_RETRIES = config.EXTERNAL_RETRIES
+RETRY_BASE_DELAY = config.RETRY_BASE_DELAY
+RETRY_MAX_DELAY = config.RETRY_MAX_DELAY
+
+THROTTLED_REPLY = 'メッセージが続けて届いたため、少し時間をおいてからもう一度送ってください。'
+OVERLOADED_REPLY = 'ただいま混み合っています。少し時間をおいてからもう一度お試しください。'
+UNPARSED_REPLY = 'メッセージの内容を読み取れませんでした。「タスク 明日 10:00 会議」のように送ってください。'
+ERROR_REPLY = '申し訳ありません。処理中にエラーが発生しました。もう一度お試しください。'
+# 1回のreplyで送れるメッセージ数の上限（LINEの仕様）
+MAX_REPLY_MESSAGES = 5
 
-app = FastAPI()
+# ワーカー・インスタンス間で共有する状態の保存先（memory / sqlite / redis）
+SHARED_STORE_BACKEND = config.SHARED_STORE_BACKEND
+SHARED_STORE_URL = config.SHARED_STORE_URL
+SHARED = SHARED_STORE_BACKEND != 'memory'
 
-# スリープ防止のための自己ping
-RENDER_URL = os.getenv('RENDER_URL')
-PORT = int(os.getenv('PORT', 10000))
+def shared_store(name: str, max_entries: int = 10000):
+    """共有ストア上の名前空間を返す"""
+    return kvstore.create_store(name, backend=SHARED_STORE_BACKEND, url=SHARED_STORE_URL, max_entries=max_entries)
 
-# タイムゾーンの設定
-JST = ZoneInfo('Asia/Tokyo')
+# スケジューラ・自己ping・複製を動かすワーカーを1つに絞るリース
+leader = LeaderLease(
+    shared_store('leases'),
+    ttl=config.LEADER_LEASE_TTL,
+    renew_interval=config.LEADER_LEASE_TTL / 3,
+    on_elected=on_elected,
+    on_revoked=on_revoked
+)
+
+# 同じユーザーのメッセージをワーカー間でも1件ずつ処理するロック（共有ストア使用時のみ）
+user_lock = SharedLock(
+    shared_store('locks'),
+    timeout=config.USER_LOCK_TIMEOUT
+) if SHARED else None
+
+# スケジューラを持たないワーカーで登録されたリマインドをスケジューラに渡す（共有ストア使用時のみ）
+reminder_inbox = ReminderInbox(shared_store('reminders')) if SHARED else None
+
+# LLMの解析結果キャッシュ（既定は共有ストアと同じ保存先）
+intent_cache = IntentCache(
+    kvstore.create_store(
+        'intent',
+        backend=config.INTENT_CACHE_BACKEND,
+        url=config.INTENT_CACHE_URL,
+        max_entries=config.INTENT_CACHE_SIZE
+    ),
+    ttl=config.INTENT_CACHE_TTL
+)
+
+# ユーザー・日付ごとのタスク一覧キャッシュ（TASK_CACHE_MAX_BYTES=0で無効）
+# 一覧はワーカーごとに持ち、ユーザーごとの版だけを共有して他のワーカーの書き込みを検知する
+task_cache = TaskCache(
+    max_bytes=config.TASK_CACHE_MAX_BYTES,
+    ttl=config.TASK_CACHE_TTL,
+    versions=shared_store('taskver') if SHARED else None
+)
+
+# 一覧で表示した番号とタスクIDの対応（「完了 2」で使う）
+ordinal_map = OrdinalMap(
+    kvstore.create_store(
+        'ordinals',
+        backend=config.ORDINAL_MAP_BACKEND,
+        url=config.ORDINAL_MAP_URL,
+        max_entries=config.ORDINAL_MAP_SIZE
+    ),
+    ttl=config.ORDINAL_MAP_TTL
+)
+
+intent_parse_total = metrics.counter('intent_parse_total', '意図解析の件数（path=fast|cache|llm）')
+intent_parse_seconds = metrics.histogram('intent_parse_seconds', '意図解析にかかった時間（path=fast|cache|llm）')
 
 def get_current_jst_datetime() -> datetime:
     """現在の日本時間をdatetimeオブジェクトとして返す"""
@@ -54,7 +329,7 @@ def get_current_jst_datetime() -> datetime:
     now = now.replace(tzinfo=ZoneInfo('UTC'))
     # 日本時間に変換
     now = now.astimezone(JST)
-    print(f"get_current_jst_datetime: システム時刻 = {now}")
+    logger.debug("get_current_jst_datetime: システム時刻 = %s", now)
     return now
 
 def get_current_jst_date() -> datetime:
@@ -71,279 +346,356 @@ def format_jst_datetime(dt: datetime) -> str:
 
 def parse_date(date_str: str) -> datetime:
     """日付文字列を日本時間のdatetimeオブジェクトに変換する"""
-    if not date_str:
-        return get_current_jst_datetime()
-    
-    # 日本語の日付表現を処理
     current_datetime = get_current_jst_datetime()
-    print(f"parse_date: 入力文字列: {date_str}")
-    print(f"parse_date: 現在の日時: {current_datetime}")
-    
-    if date_str.lower() in ['今日', 'きょう', 'today']:
-        print("parse_date: 今日として処理")
+    if not date_str:
         return current_datetime
-    elif date_str.lower() in ['明日', 'あした', 'あす', 'tomorrow']:
-        print("parse_date: 明日として処理")
-        # 現在の日付を取得し、時刻を0時に設定
-        current_date = current_datetime.date()
-        tomorrow_date = current_date + timedelta(days=1)
-        tomorrow = datetime.combine(tomorrow_date, datetime.min.time(), tzinfo=JST)
-        print(f"parse_date: 明日の日付: {tomorrow}")
-        return tomorrow
-    elif date_str.lower() in ['明後日', 'あさって', 'day after tomorrow']:
-        print("parse_date: 明後日として処理")
-        # 現在の日付を取得し、時刻を0時に設定
-        current_date = current_datetime.date()
-        day_after_tomorrow_date = current_date + timedelta(days=2)
-        day_after_tomorrow = datetime.combine(day_after_tomorrow_date, datetime.min.time(), tzinfo=JST)
-        print(f"parse_date: 明後日の日付: {day_after_tomorrow}")
-        return day_after_tomorrow
     
-    # その他の日付表現を解析
-    print(f"parse_date: dateparserで解析を試みます: {date_str}")
-    print(f"parse_date: 基準日時: {current_datetime}")
+    # よく使う表現は事前コンパイルした表で解決し、(表現, 日付) ごとにメモ化する
+    with tracing.span('parse_date'):
+        resolved = resolve_date(date_str, current_datetime.date())
+    logger.debug("parse_date: %s -> %s", date_str, resolved)
     
-    # 日付文字列がYYYY-MM-DD形式の場合
-    if re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
-        try:
-            year, month, day = map(int, date_str.split('-'))
-            parsed_date = datetime(year, month, day, tzinfo=JST)
-            print(f"parse_date: YYYY-MM-DD形式として解析: {parsed_date}")
-            return parsed_date
-        except ValueError:
-            print("parse_date: YYYY-MM-DD形式の解析に失敗")
+    # 日付が解析できない場合・今日の場合は現在日時を使用
+    if resolved is None or resolved == current_datetime.date():
+        return current_datetime
+    return datetime.combine(resolved, datetime.min.time(), tzinfo=JST)
+
+@app.get("/")
+async def root():
+    return {"message": "LINE Task Management Bot is running!"}
+
+@app.get("/healthz")
+async def healthz():
+    """プロセスが応答できるかどうか（外部サービスには問い合わせない）"""
+    return {"status": "ok"}
+
+async def check_task_store():
+    await task_store.ping()
+
+async def check_line():
+    await line_bot_api.get_bot_info()
+
+async def check_openai():
+    await openai_client.models.retrieve(LLM_MODEL)
+
+readiness = CachedCheck(
+    {'tasks': check_task_store, 'line': check_line, 'openai': check_openai},
+    ttl=config.READINESS_CACHE_TTL
+)
+
+@app.get("/readyz")
+async def readyz():
+    """各クライアントが生成済みで依存サービスに到達できるか（結果は一定時間キャッシュ）"""
+    if not started.is_set() or event_queue.depth() >= event_queue.maxsize:
+        return JSONResponse({"status": "not ready"}, status_code=503)
+    checks = await readiness.result()
+    ready = all(result == 'ok' for result in checks.values())
+    return JSONResponse({"status": "ok" if ready else "not ready", "checks": checks}, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "queue": event_queue.stats(),
+        "coalesce": coalescer.stats(),
+        "stages": tracing.stage_stats(),
+        "intent": intent_stats(),
+        "llm": llm_intent.usage_stats(),
+        "task_cache": {**task_cache.stats(), **kvstore.cache_stats('tasks')},
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "circuits": breakers.stats(),
+        "throttled": {scope: requests_throttled.value(scope=scope) for scope in ('user', 'llm_user', 'llm_global')},
+        "shed": {reason: requests_shed.value(reason=reason) for reason in ('overloaded', 'circuit_open')},
+        "leader": {"is_leader": leader.is_leader, "holder": leader.holder, "shared_store": SHARED_STORE_BACKEND},
+        "metrics": metrics.snapshot()
+    }
+
+def normalize_llm_date(value: Optional[str]) -> Optional[str]:
+    """LLMが返した日付表現をYYYY-MM-DDにする（今日の場合はNone）"""
+    if not value:
+        return None
+    # 今日の予定を要求している場合は日付を空にする
+    if value.lower() in ['今日', 'きょう', 'today']:
+        return None
+    return parse_date(value).strftime('%Y-%m-%d')
+
+@traced('llm')
+async def process_message_with_llm(message: str) -> Dict[str, Any]:
+    """LLMのfunction callingでメッセージの意図をスキーマどおりのJSONとして受け取る
+
+    出力がスキーマに合わない場合は IntentSchemaError を送出する（同じ入力で呼び直しても直らないためリトライしない）。
+    """
+    logger.debug("process_message_with_llm: 入力メッセージ = %s", message)
+    today = get_current_jst_datetime().date()
     
-    parsed_date = dateparser.parse(
-        date_str,
-        languages=['ja'],
-        settings={
-            'RELATIVE_BASE': current_datetime,
-            'PREFER_DATES_FROM': 'future',
-            'RETURN_AS_TIMEZONE_AWARE': True,
-            'TIMEZONE': 'Asia/Tokyo'
-        }
-    )
+    # 同時に実行するLLM呼び出しの数を制限し、空きを待ちきれなければ断る
+    async with llm_gate.admit():
+        start = time_module.perf_counter()
+        response = await call_external('openai', 'chat', lambda: openai_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=llm_intent.build_messages(message, today),
+            tools=LLM_TOOLS,
+            tool_choice=llm_intent.TOOL_CHOICE,
+            temperature=0,
+            max_tokens=LLM_MAX_TOKENS
+        ))
+        elapsed = time_module.perf_counter() - start
     
-    print(f"parse_date: dateparserの解析結果: {parsed_date}")
+    try:
+        result = llm_intent.parse_response(response)
+    except IntentSchemaError as e:
+        llm_intent.record_usage(response, elapsed, e.reason)
+        logger.warning("LLMの出力がスキーマに合いません: %s", e)
+        raise
+    usage = llm_intent.record_usage(response, elapsed, 'ok')
+    logger.info("llm call", extra={**usage, 'action': result['action'], 'elapsed_ms': round(elapsed * 1000, 1)})
     
-    if parsed_date:
-        print(f"parse_date: 解析された日付: {parsed_date}")
-        # タイムゾーンを日本時間に設定
-        if parsed_date.tzinfo is None:
-            parsed_date = parsed_date.replace(tzinfo=JST)
-        else:
-            parsed_date = parsed_date.astimezone(JST)
-        print(f"parse_date: タイムゾーン設定後: {parsed_date}")
-        
-        # 日付が過去の場合は翌日に設定
-        if parsed_date.date() < current_datetime.date():
-            print(f"parse_date: 過去の日付を翌日に設定: {parsed_date.date()} -> {parsed_date.date() + timedelta(days=1)}")
-            parsed_date = parsed_date + timedelta(days=1)
-        
-        return parsed_date
+    # 日付の解析を改善
+    result['date'] = normalize_llm_date(result.get('date'))
+    for task in result.get('tasks') or []:
+        task['date'] = normalize_llm_date(task.get('date'))
+    logger.debug("process_message_with_llm: 日付の解析後 = %s", result['date'])
     
-    # 日付が解析できない場合は今日の日付を使用
-    print("parse_date: 日付が解析できないため今日の日付を使用")
-    return current_datetime
+    return result
 
-def keep_alive():
-    while True:
+async def call_external(service: str, op: str, func, retries: Optional[int] = None):
+    """外部APIを所要時間を計測しつつ、サーキットブレーカーと指数バックオフ（ジッター付き）で呼ぶ"""
+    with metrics.timer(external_call_seconds, service=service, op=op), tracing.span(f'{service}.{op}'):
+        return await call_with_retry(
+            func,
+            breaker=breakers[service],
+            retries=EXTERNAL_RETRIES if retries is None else retries,
+            base_delay=RETRY_BASE_DELAY,
+            max_delay=RETRY_MAX_DELAY
+        )
+
+async def reply_text(reply_token: str, text: str) -> None:
+    """replyTokenに1件のテキストで応答する"""
+    await call_external('line', 'reply', lambda: line_bot_api.reply_message_with_http_info(
+        {
+            'replyToken': reply_token,
+            'messages': [clients.text_message(text)]
+        }
+    ))
+
+async def reply_texts(reply_tokens: List[str], texts: List[str]) -> None:
+    """複数のテキストを1回のreplyで応答する
+
+    replyTokenは先頭から順に使い、無効（4xx）で断られた場合だけ次のものを試す。
+    上限を超える分は最後のメッセージにつなげる。
+    """
+    if len(texts) > MAX_REPLY_MESSAGES:
+        texts = texts[:MAX_REPLY_MESSAGES - 1] + ['\n\n'.join(texts[MAX_REPLY_MESSAGES - 1:])]
+    messages = [clients.text_message(text) for text in texts]
+    for index, reply_token in enumerate(reply_tokens):
         try:
-            if RENDER_URL:
-                response = requests.get(RENDER_URL, timeout=10)
-                if response.status_code == 200:
-                    print("Ping sent successfully")
-                else:
-                    print(f"Ping failed with status code: {response.status_code}")
-        except requests.exceptions.Timeout:
-            print("Ping timeout")
+            await call_external('line', 'reply', lambda: line_bot_api.reply_message_with_http_info(
+                {
+                    'replyToken': reply_token,
+                    'messages': messages
+                }
+            ))
+            return
         except Exception as e:
-            print(f"Ping failed: {str(e)}")
-        time_module.sleep(30)  # 30秒ごとにping
+            if is_retryable(e) or isinstance(e, Overloaded) or index == len(reply_tokens) - 1:
+                raise
+            logger.warning("replyTokenが使えないため次のものを試します: %s", e)
 
-@app.on_event("startup")
-async def startup_event():
-    if RENDER_URL:
-        thread = threading.Thread(target=keep_alive, daemon=True)
-        thread.start()
-        print("Keep-alive thread started")
+async def fetch_day_tasks(user_id: str, query_date: str) -> list:
+    """指定ユーザー・日付のタスクを時間順で返す（キャッシュがあればDBに問い合わせない）"""
+    version = await task_cache.version(user_id)
+    tasks = task_cache.get(user_id, query_date, version)
+    if tasks is None:
+        tasks = await call_external(task_store.name, 'select', lambda: task_store.list_day(user_id, query_date))
+        task_cache.set(user_id, query_date, tasks, version)
+    return tasks
 
-@app.get("/")
-async def root():
-    return {"message": "LINE Task Management Bot is running!"}
+@traced('digest.refresh')
+async def refresh_digests(user_id: str, dates: Iterable[str]) -> None:
+    """書き込んだ日付のダイジェストを、反映済みの一覧（通常はキャッシュ）から作り直してまとめて書き込む
 
-def get_system_prompt() -> str:
-    """システムプロンプトを生成する"""
-    current_datetime = get_current_jst_datetime()
-    current_date = current_datetime.strftime('%Y-%m-%d')
-    
-    return f"""あなたはタスク管理アシスタントです。ユーザーのメッセージを解析し、適切なアクションを判断してください。
-
-現在の日付は {current_date} です。この日付を基準として相対的な日付（今日、明日、明後日など）を判断してください。
-
-アクションの種類：
-1. register: タスクの登録
-2. complete: タスクの完了
-3. list: タスク一覧の表示
-4. list_date: 特定の日付のタスク一覧
-5. remind: リマインドの設定
-6. current_time: 現在の日時を確認
-
-応答は以下のJSON形式で返してください：
-{{
-    "action": "register" | "complete" | "list" | "list_date" | "remind" | "current_time",
-    "task_content": "タスクの内容",
-    "date": "日付（YYYY-MM-DD形式）",
-    "time": "時間（HH:MM形式）",
-    "remind_time": "リマインド時間（HH:MM形式）"
-}}
-
-日付の指定について：
-- 今日の予定を聞かれた場合は、dateを空（null）にしてください
-- 明日の予定を聞かれた場合は、現在の日付に1日を加えた日付を指定してください
-- 明後日の予定を聞かれた場合は、現在の日付に2日を加えた日付を指定してください
-- 特定の日付を指定された場合は、その日付をそのまま使用してください
-"""
-
-def retry_on_error(max_retries=5, delay=1):
-    """エラー発生時に指定回数リトライするデコレータ"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    if retries == max_retries:
-                        print(f"最終的なエラー: {str(e)}")
-                        raise
-                    print(f"エラー発生 (試行 {retries}/{max_retries}): {str(e)}")
-                    time_module.sleep(delay)
-            return None
-        return wrapper
-    return decorator
-
-@retry_on_error()
-def process_message_with_llm(message: str) -> Dict[str, Any]:
-    """LLMを使用してメッセージを処理し、アクションを判断する"""
-    print(f"process_message_with_llm: 入力メッセージ = {message}")
-    
-    client = openai.OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": get_system_prompt()},
-            {"role": "user", "content": message}
-        ],
-        temperature=0.3
-    )
+    失敗しても登録・完了自体は成功しているため、ログに残すだけにする。
+    """
+    if not DIGESTS_ENABLED:
+        return
+    try:
+        rows = [build_digest(user_id, day, await fetch_day_tasks(user_id, day)) for day in sorted(set(dates))]
+        await call_external(task_store.name, 'digest', lambda: task_store.upsert_digests(rows))
+        digest_writes.inc(len(rows))
+    except Exception as e:
+        digest_write_failures.inc()
+        logger.error("ダイジェストの書き込みに失敗しました: %s", e)
+
+def build_task_row(user_id: str, task: Dict[str, Any], current_datetime: datetime):
+    """登録するタスク1件を検証し、(挿入する行, エラーメッセージ)を返す"""
+    date, time = task.get('date'), task.get('time')
+    # 日付のバリデーション
+    task_date = parse_date(date)
+    logger.debug("タスクの日付: %s", task_date)
     
-    # 応答をJSONとして解析
-    import json
-    result = json.loads(response.choices[0].message.content)
-    print(f"process_message_with_llm: LLM応答 = {result}")
+    # 日付の比較（日付部分のみ）
+    if task_date.date() < current_datetime.date():
+        logger.debug("日付比較: %s < %s", task_date.date(), current_datetime.date())
+        return None, '過去の日付にはタスクを登録できません。今日以降の日付を指定してください。'
     
-    # 日付の解析を改善
-    if result.get('date'):
-        print(f"process_message_with_llm: 日付の解析前 = {result['date']}")
-        # 今日の予定を要求している場合は日付を空にする
-        if result['date'].lower() in ['今日', 'きょう', 'today']:
-            result['date'] = None
-        else:
-            parsed_date = parse_date(result['date'])
-            result['date'] = parsed_date.strftime('%Y-%m-%d')
-        print(f"process_message_with_llm: 日付の解析後 = {result['date']}")
+    # 時間のバリデーション
+    if time:
+        try:
+            # 時間をdatetimeオブジェクトに変換
+            task_time = datetime.strptime(time, '%H:%M').time()
+            task_datetime = task_date.replace(hour=task_time.hour, minute=task_time.minute)
+            logger.debug("タスクの日時: %s", task_datetime)
+            
+            # 同じ日付の場合のみ時間を比較
+            if task_date.date() == current_datetime.date():
+                if task_datetime < current_datetime:
+                    logger.debug("時間比較: %s < %s", task_datetime, current_datetime)
+                    return None, '過去の時間にはタスクを登録できません。現在時刻以降の時間を指定してください。'
+        except ValueError:
+            return None, '時間の形式が正しくありません。HH:MM形式で指定してください。'
     
-    return result
+    return {
+        'user_id': user_id,
+        'content': task['task_content'],
+        'scheduled_date': task_date.strftime('%Y-%m-%d'),
+        'scheduled_time': time,
+        'remind_time': task.get('remind_time'),
+        'created_at': format_jst_datetime(current_datetime)
+    }, None
 
-def handle_task_registration(user_id: str, task_content: str, date: str, time: str, remind_time: str = None) -> str:
-    """タスクを登録する"""
+@traced('task.register')
+async def handle_task_registration(user_id: str, tasks: List[Dict[str, Any]]) -> str:
+    """タスクを登録する（複数の場合も1回のinsertでまとめて登録する）"""
     try:
         # 現在の日時を取得
         current_datetime = get_current_jst_datetime()
-        print(f"現在の日時: {current_datetime}")
-        
-        # 日付のバリデーション
-        task_date = parse_date(date)
-        print(f"タスクの日付: {task_date}")
-        print(f"タスクの日付（日付部分）: {task_date.date()}")
-        print(f"現在の日付（日付部分）: {current_datetime.date()}")
+        logger.debug("現在の日時: %s", current_datetime)
         
-        # 日付の比較（日付部分のみ）
-        if task_date.date() < current_datetime.date():
-            print(f"日付比較: {task_date.date()} < {current_datetime.date()}")
-            return f'過去の日付にはタスクを登録できません。今日以降の日付を指定してください。'
-        
-        # 時間のバリデーション
-        if time:
-            try:
-                # 時間をdatetimeオブジェクトに変換
-                task_time = datetime.strptime(time, '%H:%M').time()
-                task_datetime = task_date.replace(hour=task_time.hour, minute=task_time.minute)
-                print(f"タスクの日時: {task_datetime}")
-                
-                # 同じ日付の場合のみ時間を比較
-                if task_date.date() == current_datetime.date():
-                    if task_datetime < current_datetime:
-                        print(f"時間比較: {task_datetime} < {current_datetime}")
-                        return f'過去の時間にはタスクを登録できません。現在時刻以降の時間を指定してください。'
-            except ValueError:
-                return f'時間の形式が正しくありません。HH:MM形式で指定してください。'
+        rows = []
+        errors = []
+        for task in tasks:
+            row, error = build_task_row(user_id, task, current_datetime)
+            if row is None:
+                errors.append((task['task_content'], error))
+            else:
+                rows.append(row)
+        if not rows:
+            if len(errors) == 1:
+                return errors[0][1]
+            return '\n'.join(['タスクを登録できませんでした:'] + [f'・{content}: {error}' for content, error in errors])
         
         # タスクを登録
-        data = {
-            'user_id': user_id,
-            'content': task_content,
-            'scheduled_date': task_date.strftime('%Y-%m-%d'),
-            'scheduled_time': time,
-            'remind_time': remind_time,
-            'created_at': format_jst_datetime(current_datetime)
-        }
-        
-        supabase.table('tasks').insert(data).execute()
+        # 登録は冪等ではないのでリトライしない
+        inserted = await call_external(task_store.name, 'insert', lambda: task_store.insert(rows), retries=0)
+        # DBが返した行を使い、時刻の表記をそろえる
+        inserted = inserted or rows
+        # キャッシュ済みの一覧とダイジェストにも反映
+        await task_cache.add_tasks(user_id, inserted)
+        await refresh_digests(user_id, [row['scheduled_date'] for row in inserted])
+        # リマインド時刻が指定されていればスケジューラに登録（スケジューラを持たないワーカーでは共有ストアに積む）
+        if scheduler is not None:
+            for row in inserted:
+                schedule_task_reminder(scheduler, row, send_task_reminder)
+        elif reminder_inbox is not None:
+            try:
+                await reminder_inbox.publish(inserted)
+            except Exception as e:
+                # 当日分を取りこぼしても翌日以降の分は日次の読み込みで拾われる
+                logger.error("リマインドの受け渡しに失敗しました: %s", e)
         
         # 登録完了メッセージを生成
-        date_str = task_date.strftime('%Y年%m月%d日')
-        time_str = f' {time}' if time else ''
-        return f'タスクを登録しました:\n{date_str}{time_str} {task_content}'
+        lines = ['タスクを登録しました:']
+        for row in rows:
+            date_str = datetime.strptime(row['scheduled_date'], '%Y-%m-%d').strftime('%Y年%m月%d日')
+            time_str = f" {row['scheduled_time']}" if row['scheduled_time'] else ''
+            lines.append(f"{date_str}{time_str} {row['content']}")
+        if errors:
+            lines.append('登録できなかったタスク:')
+            lines.extend(f'・{content}: {error}' for content, error in errors)
+        return '\n'.join(lines)
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"エラー: {str(e)}")
+        logger.error("エラー: %s", e)
         return f'タスクの登録に失敗しました: {str(e)}'
 
-def handle_task_completion(user_id: str, task_content: str) -> str:
-    """タスクを完了にする"""
+async def resolve_completion_targets(user_id: str, contents: List[str]):
+    """完了対象を (タスクIDと内容の一覧, 見つからなかった指定) に解決する
+
+    番号は直前に表示した一覧から、内容は今日の未完了タスクから近いものを探す。
+    """
+    targets = {}
+    missing = []
+    open_tasks = None
+    for content in contents:
+        if content.isdigit():
+            task = await ordinal_map.resolve(user_id, int(content))
+        else:
+            if open_tasks is None:
+                today = get_current_jst_datetime().date().isoformat()
+                open_tasks = [task for task in await fetch_day_tasks(user_id, today) if not task['is_done']]
+            task = match_task(content, [task for task in open_tasks if task['id'] not in targets])
+        if task is None:
+            missing.append(content)
+        else:
+            targets[task['id']] = task['content']
+    return targets, missing
+
+@traced('task.complete')
+async def handle_task_completion(user_id: str, contents: List[str]) -> str:
+    """タスクを完了にする（複数の場合も主キーでの1回のupdateでまとめて完了にする）"""
     try:
-        supabase.table('tasks').update({'is_done': True}).eq('user_id', user_id).eq('content', task_content).execute()
-        return f'タスクを完了しました: {task_content}'
+        targets, missing = await resolve_completion_targets(user_id, contents)
+        if targets:
+            updated = await call_external(task_store.name, 'update',
+                                          lambda: task_store.mark_done(user_id, list(targets)))
+            await task_cache.mark_done(user_id, targets)
+            # 番号で指定したタスクは今日以外の日付のこともある
+            dates = {row['scheduled_date'] for row in updated or [] if row.get('scheduled_date')}
+            await refresh_digests(user_id, dates or [get_current_jst_datetime().date().isoformat()])
+        if len(contents) == 1 and targets:
+            return f'タスクを完了しました: {next(iter(targets.values()))}'
+        lines = []
+        if targets:
+            lines.append('タスクを完了しました:')
+            lines.extend(f'✅ {content}' for content in targets.values())
+        if missing:
+            lines.append('見つからなかったタスク:')
+            lines.extend(f'・{content}' for content in missing)
+            if any(content.isdigit() for content in missing):
+                lines.append('番号で指定する場合は「リスト」で一覧を表示し直してください。')
+        return '\n'.join(lines)
+    except Overloaded:
+        raise
     except Exception as e:
         return f'タスクの完了に失敗しました: {str(e)}'
 
-def handle_task_list(user_id: str, date: str = None) -> str:
+@traced('task.list')
+async def handle_task_list(user_id: str, date: str = None) -> str:
     """タスク一覧を表示する"""
     try:
         current_datetime = get_current_jst_datetime()
-        print(f"handle_task_list: 現在の日時 = {current_datetime}")
-        print(f"handle_task_list: 日付部分 = {current_datetime.date()}")
+        logger.debug("handle_task_list: 現在の日時 = %s", current_datetime)
+        logger.debug("handle_task_list: 日付部分 = %s", current_datetime.date())
         
         # 日付の処理
         if date:
-            print(f"handle_task_list: 指定された日付 = {date}")
+            logger.debug("handle_task_list: 指定された日付 = %s", date)
             # 日付文字列をdatetimeオブジェクトに変換
             task_date = parse_date(date)
-            print(f"handle_task_list: 解析された日付 = {task_date}")
+            logger.debug("handle_task_list: 解析された日付 = %s", task_date)
             query_date = task_date.strftime('%Y-%m-%d')
         else:
-            print(f"handle_task_list: 今日の日付を使用 = {current_datetime.date().isoformat()}")
+            logger.debug("handle_task_list: 今日の日付を使用 = %s", current_datetime.date().isoformat())
             query_date = current_datetime.date().isoformat()
             task_date = current_datetime
         
         # タスクの取得
-        query = supabase.table('tasks').select('*').eq('user_id', user_id).eq('scheduled_date', query_date)
-        response = query.order('scheduled_time').execute()
-        tasks = response.data
-        print(f"handle_task_list: 取得したタスク数 = {len(tasks)}")
+        tasks = await fetch_day_tasks(user_id, query_date)
+        logger.debug("handle_task_list: 取得したタスク数 = %s", len(tasks))
         
         if not tasks:
             date_str = '今日' if task_date.date() == current_datetime.date() else task_date.strftime('%m/%d')
@@ -352,25 +704,28 @@ def handle_task_list(user_id: str, date: str = None) -> str:
         # タスク一覧の作成
         date_str = '今日' if task_date.date() == current_datetime.date() else task_date.strftime('%m/%d')
         task_list = [f'【{date_str}のタスク】']
-        for task in tasks:
+        for number, task in enumerate(tasks, 1):
             status = '✅' if task['is_done'] else '⏳'
             time_str = f"{task['scheduled_time']} " if task['scheduled_time'] else ''
-            task_list.append(f"{status} {time_str}{task['content']}")
+            task_list.append(f"{number}. {status} {time_str}{task['content']}")
+        # 「完了 番号」で指定できるよう表示した順番を覚えておく
+        await ordinal_map.remember(user_id, tasks)
         
         return '\n'.join(task_list)
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"handle_task_list: エラー発生 = {str(e)}")
+        logger.error("handle_task_list: エラー発生 = %s", e)
         return f'の取得に失敗しましたタスク一覧: {str(e)}'
 
-def handle_reminder(user_id: str, date: str, time: str) -> str:
+@traced('task.remind')
+async def handle_reminder(user_id: str, date: str, time: str) -> str:
     """指定された日時のタスクをリマインドする"""
     try:
-        query = supabase.table('tasks').select('*').eq('user_id', user_id).eq('scheduled_date', date)
+        tasks = await fetch_day_tasks(user_id, date)
         if time:
-            query = query.eq('scheduled_time', time)
-        
-        response = query.execute()
-        tasks = response.data
+            # DBのTIME型は秒まで返すため時:分で比較
+            tasks = [task for task in tasks if (task['scheduled_time'] or '')[:5] == time[:5]]
         
         if not tasks:
             return f'{date} {time if time else ""}の予定はありません'
@@ -380,14 +735,73 @@ def handle_reminder(user_id: str, date: str, time: str) -> str:
             task_list.append(f"・{task['content']}")
         
         return '\n'.join(task_list)
+    except Overloaded:
+        raise
     except Exception as e:
         return f'予定の取得に失敗しました: {str(e)}'
 
+async def send_task_reminder(task: dict) -> None:
+    """リマインド時刻になったタスクを未完了であればユーザーに通知する"""
+    done = await call_external(task_store.name, 'select', lambda: task_store.is_done(task['id']))
+    if done is None or done:
+        return
+    time_str = f"{task['scheduled_time'][:5]} " if task.get('scheduled_time') else ''
+    # 同じリトライキーで再送すればLINE側で重複送信が防がれる
+    retry_key = str(uuid.uuid4())
+    await call_external('line', 'push', lambda: line_bot_api.push_message_with_http_info(
+        {
+            'to': task['user_id'],
+            'messages': [clients.text_message(f"【リマインド】\n{time_str}{task['content']}")]
+        },
+        x_line_retry_key=retry_key
+    ))
+
+async def start_scheduler() -> Scheduler:
+    """朝・昼の通知とタスクのリマインドを登録してスケジューラを起動する"""
+    global scheduler
+    # 実行済みジョブの記録（再起動後の二重送信を防ぐ）
+    state = kvstore.create_store('scheduler', backend=config.SCHEDULER_STATE_BACKEND, url=config.SCHEDULER_STATE_URL)
+    scheduler = Scheduler(state=state)
+    # 通知したダイジェストの版（昼の通知で変わっていないユーザーを飛ばすのに使う）
+    notified = notify.create_notified_versions() if DIGESTS_ENABLED else None
+
+    async def morning(day):
+        await notify.send_notification(notify.build_morning_message, only_open=False, today=day, store=task_store,
+                                       digests=DIGESTS_ENABLED, notified=notified)
+
+    async def afternoon(day):
+        await notify.send_notification(notify.build_afternoon_message, only_open=True, today=day, store=task_store,
+                                       digests=DIGESTS_ENABLED, notified=notified,
+                                       skip_unchanged=config.AFTERNOON_SKIP_UNCHANGED)
+
+    async def load_reminders(day):
+        count = await load_task_reminders(scheduler, task_store, send_task_reminder, day)
+        logger.info("Scheduler: %sからのリマインド%s件を登録しました", day, count)
+
+    scheduler.schedule_daily('morning', MORNING_DIGEST_TIME, morning)
+    scheduler.schedule_daily('afternoon', AFTERNOON_DIGEST_TIME, afternoon)
+    scheduler.schedule_daily('reminder_load', '00:00', load_reminders, catch_up=60 * 60)
+
+    async def sync_reminders():
+        count = await sync_task_reminders(scheduler, reminder_inbox, send_task_reminder)
+        if count:
+            logger.info("Scheduler: 他のワーカーで登録されたリマインド%s件を登録しました", count)
+
+    if reminder_inbox is not None and REMINDER_SYNC_INTERVAL > 0:
+        # 他のワーカーで登録されたタスクのリマインドを、前回から積まれた分だけ取り込む
+        scheduler.schedule_every('reminder_sync', REMINDER_SYNC_INTERVAL, sync_reminders)
+    try:
+        await load_reminders(get_current_jst_datetime().date())
+    except Exception as e:
+        logger.error("Scheduler: リマインドの読み込みに失敗しました: %s", e)
+    scheduler.start()
+    return scheduler
+
 def handle_current_time() -> str:
     """現在の日時を返す"""
     current_datetime = get_current_jst_datetime()
-    print(f"handle_current_time: 現在の日時 = {current_datetime}")
-    print(f"handle_current_time: 日付部分 = {current_datetime.date()}")
+    logger.debug("handle_current_time: 現在の日時 = %s", current_datetime)
+    logger.debug("handle_current_time: 日付部分 = %s", current_datetime.date())
     return f'現在の日時は {current_datetime.strftime("%Y年%m月%d日 %H時%M分")} です。'
 
 @app.post("/callback")
@@ -396,16 +810,158 @@ async def callback(request: Request):
     body = await request.body()
     body_str = body.decode()
     
+    await wait_sdk_loaded()
+    from linebot.v3.exceptions import InvalidSignatureError
     try:
-        handler.handle(body_str, signature)
+        payload = clients.webhook_parser().parse(body_str, signature, as_payload=True)
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     
+    # 署名検証済みのイベントをキューに積み、処理を待たずに応答する
+    # テキストメッセージはユーザーごとに短い時間まとめてから積む（COALESCE_WINDOW）
+    # 満杯の場合は503を返してLINEに再送させる（積めたイベントは再送されても重複として捨てる）
+    try:
+        for event in payload.events:
+            if is_text_message(event) and await coalescer.add(event, payload.destination):
+                continue
+            await event_queue.submit(event, payload.destination)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Event queue is full")
+    
     return "OK"
 
-@handler.add(MessageEvent, message=TextMessageContent)
-@retry_on_error()
-def handle_message(event, destination):
+def is_text_message(event) -> bool:
+    """ユーザーからのテキストメッセージのイベントか（SDKの読み込み後に呼ぶ）"""
+    from linebot.v3.webhooks import MessageEvent, TextMessageContent
+    return isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent)
+
+async def dispatch_event(event, destination):
+    """キューから取り出したイベントを種類に応じたハンドラに渡す"""
+    # 起動直後に届いたイベントはクライアントの生成が終わるまで待つ
+    await started.wait()
+    # このイベントの処理中に出るログにwebhookEventIdを付ける
+    request_id.set(getattr(event, 'webhook_event_id', None))
+    if isinstance(event, MessageBatch):
+        handler = handle_batch
+    elif is_text_message(event):
+        handler = handle_message
+    else:
+        return
+    key = user_key(event)
+    # 1件（まとめた場合は1まとまり）の処理を1つのトレースとして記録する
+    with tracing.trace('batch' if handler is handle_batch else 'message',
+                       event_id=getattr(event, 'webhook_event_id', None) or ''):
+        if user_lock is None or key is None:
+            await handler(event, destination)
+            return
+        # 別のワーカーが同じユーザーのメッセージを処理中なら終わるまで待ち、待っているものはWebhookの受信時刻順に処理する
+        try:
+            async with user_lock.hold(f'user:{key}', order=getattr(event, 'timestamp', None)):
+                await handler(event, destination)
+        except LockTimeout:
+            # ロックなしで処理すると順序が入れ替わるため、処理せずに再送を促す
+            events = event.events if isinstance(event, MessageBatch) else [event]
+            reply_tokens = [e.reply_token for e in events if e.reply_token]
+            if reply_tokens:
+                await reply_text(reply_tokens[0], OVERLOADED_REPLY)
+
+# Webhookイベントの処理キュー
+event_queue = EventQueue(
+    dispatch_event,
+    maxsize=config.EVENT_QUEUE_MAXSIZE,
+    workers=config.EVENT_WORKERS,
+    dedup_ttl=config.EVENT_DEDUP_TTL,
+    dedup_store=shared_store('events', max_entries=config.EVENT_DEDUP_SIZE) if SHARED else None
+)
+
+# 同じユーザーから続けて届いたメッセージをまとめて1回の解析・1回のreplyで処理する（COALESCE_WINDOW=0で無効）
+# まとめるのはワーカーごと（同じユーザーのWebhookが別のワーカーに届いた場合は別々に処理される）
+coalescer = MessageCoalescer(
+    event_queue,
+    window=config.COALESCE_WINDOW,
+    max_wait=config.COALESCE_MAX_WAIT,
+    max_events=config.COALESCE_MAX_MESSAGES
+)
+coalesced_parses_saved = metrics.counter('coalesced_parses_saved_total', 'まとめたことで減った意図解析の回数')
+coalesced_replies_saved = metrics.counter('coalesced_replies_saved_total', 'まとめたことで減ったreplyの回数')
+
+@traced('intent')
+async def resolve_intent(message: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """定型コマンドの高速解析を試み、確信度が低い場合のみLLMで解析する
+
+    LLMを呼ぶ前にユーザーごと・全体のレート制限を確かめ、超えていれば Throttled を送出する。
+    """
+    start = time_module.perf_counter()
+    today = get_current_jst_datetime().date()
+    result, confidence = parse_command(message, today)
+    if result is not None and confidence >= FAST_PATH_MIN_CONFIDENCE:
+        intent_parse_total.inc(path='fast')
+        intent_parse_seconds.observe(time_module.perf_counter() - start, path='fast')
+        return result
+
+    # 同じ日に同じ文面が来ていればLLMの解析結果を使い回す
+    result = await intent_cache.get(message, today)
+    if result is not None:
+        intent_parse_total.inc(path='cache')
+        intent_parse_seconds.observe(time_module.perf_counter() - start, path='cache')
+        return result
+
+    if user_id is not None and not llm_user_limiter.allow(user_id):
+        raise Throttled('llm_user')
+    if not llm_global_limiter.allow():
+        raise Throttled('llm_global')
+    start = time_module.perf_counter()
+    result = await process_message_with_llm(message)
+    intent_parse_total.inc(path='llm')
+    intent_parse_seconds.observe(time_module.perf_counter() - start, path='llm')
+    if result and result.get('action'):
+        await intent_cache.put(message, today, result)
+    return result
+
+def intent_stats() -> Dict[str, float]:
+    """高速解析・キャッシュのヒット率と経路別の平均レイテンシを返す"""
+    stats = {}
+    for path in ('fast', 'cache', 'llm'):
+        count = intent_parse_seconds.count(path=path)
+        stats[f'{path}_count'] = intent_parse_total.value(path=path)
+        stats[f'{path}_latency_avg'] = intent_parse_seconds.sum(path=path) / count if count else 0.0
+    total = stats['fast_count'] + stats['cache_count'] + stats['llm_count']
+    stats['fast_path_hit_rate'] = stats['fast_count'] / total if total else 0.0
+    stats['cache'] = kvstore.cache_stats('intent')
+    return stats
+
+async def process_text(user_id: str, message: str) -> Tuple[Optional[str], str]:
+    """メッセージを解析してアクションを実行し、(action, 応答テキスト) を返す（応答しない場合はactionがNone）"""
+    try:
+        # 定型コマンドはその場で解析し、それ以外はLLMで処理
+        result = await resolve_intent(message, user_id)
+        if not result:
+            return None, ''
+        action = result['action']
+        response_text = await run_action(user_id, result)
+    except Throttled as e:
+        requests_throttled.inc(scope=e.scope)
+        action = 'throttled'
+        response_text = OVERLOADED_REPLY if e.scope == 'llm_global' else THROTTLED_REPLY
+    except IntentSchemaError:
+        action = 'unparsed'
+        response_text = UNPARSED_REPLY
+    except Overloaded as e:
+        requests_shed.inc(reason='circuit_open' if isinstance(e, CircuitOpenError) else 'overloaded')
+        logger.warning("過負荷のためメッセージを処理しませんでした: %s", e)
+        action = 'shed'
+        response_text = OVERLOADED_REPLY
+    except Exception as e:
+        # 想定外の失敗でも応答は返す（まとめて処理している場合は他の単位の応答も返せるように）
+        logger.error("メッセージの処理に失敗しました: %s", e, exc_info=True)
+        action = 'error'
+        response_text = ERROR_REPLY
+    
+    # 応答テキストが空の場合はエラーメッセージを設定
+    return action, response_text or ERROR_REPLY
+
+async def handle_message(event, destination):
+    start = time_module.perf_counter()
     user_id = event.source.user_id
     message = event.message.text
     
@@ -413,43 +969,105 @@ def handle_message(event, destination):
     if not message.strip():
         return
 
-    # LLMでメッセージを処理
-    result = process_message_with_llm(message)
-    if not result:
+    # ユーザーごとのレート制限を超えたら解析せずに定型文を返す
+    if not user_limiter.allow(user_id):
+        requests_throttled.inc(scope='user')
+        await reply_text(event.reply_token, THROTTLED_REPLY)
         return
 
-    # アクションに応じて処理
+    action, response_text = await process_text(user_id, message)
+    if action is None:
+        return
+    
+    await reply_text(event.reply_token, response_text)
+    elapsed = time_module.perf_counter() - start
+    request_duration_seconds.observe(elapsed, action=action)
+    logger.info("message handled", extra={'action': action, 'user_id': user_id, 'elapsed_ms': round(elapsed * 1000, 1),
+                                          'trace_id': tracing.current_trace_id()})
+
+def group_messages(messages: List[str]) -> List[str]:
+    """続けて届いたメッセージを解析の単位に分ける
+
+    定型コマンドとして解析できるものは1件ずつ、それ以外は連続する分を改行でつないで1件にする
+    （「明日」「10時 歯医者」のように分けて送られた文を1回のLLM呼び出しで解析する）。
+    """
+    today = get_current_jst_datetime().date()
+    groups: List[str] = []
+    pending: List[str] = []
+    for message in messages:
+        result, confidence = parse_command(message, today)
+        if result is not None and confidence >= FAST_PATH_MIN_CONFIDENCE:
+            if pending:
+                groups.append('\n'.join(pending))
+                pending = []
+            groups.append(message)
+        else:
+            pending.append(message)
+    if pending:
+        groups.append('\n'.join(pending))
+    return groups
+
+async def handle_batch(batch: MessageBatch, destination):
+    """同じユーザーから続けて届いたメッセージをまとめて解析・実行し、1回のreplyで応答する"""
+    start = time_module.perf_counter()
+    user_id = batch.source.user_id
+    messages = [event.message.text for event in batch.events if event.message.text.strip()]
+    reply_tokens = [event.reply_token for event in batch.events if event.reply_token]
+    if not messages or not reply_tokens:
+        return
+
+    groups = group_messages(messages)
+    # レート制限は解析する単位ごとに数える（バケットの容量を超えて消費しない）
+    if not user_limiter.allow(user_id, cost=min(len(groups), user_limiter.burst)):
+        requests_throttled.inc(scope='user')
+        await reply_text(reply_tokens[0], THROTTLED_REPLY)
+        return
+
+    actions = []
+    response_texts = []
+    for message in groups:
+        action, response_text = await process_text(user_id, message)
+        if action is not None:
+            actions.append(action)
+            response_texts.append(response_text)
+    coalesced_parses_saved.inc(len(messages) - len(groups))
+    if not response_texts:
+        return
+
+    await reply_texts(reply_tokens, response_texts)
+    coalesced_replies_saved.inc(len(batch.events) - 1)
+    elapsed = time_module.perf_counter() - start
+    for action in actions:
+        request_duration_seconds.observe(elapsed, action=action)
+    logger.info("messages handled", extra={'action': ','.join(actions), 'user_id': user_id, 'messages': len(messages),
+                                           'groups': len(groups), 'elapsed_ms': round(elapsed * 1000, 1),
+                                           'trace_id': tracing.current_trace_id()})
+
+async def run_action(user_id: str, result: Dict[str, Any]) -> str:
+    """解析結果のアクションを実行し、応答テキストを返す"""
     response_text = ""
     action = result['action']
     if action == 'register':
-        if not result.get('task_content'):
+        tasks = task_items(result)
+        if not tasks:
             raise ValueError("タスクの内容が指定されていません")
-        response_text = handle_task_registration(user_id, result['task_content'], result['date'], result['time'], result.get('remind_time'))
+        response_text = await handle_task_registration(user_id, tasks)
     elif action == 'complete':
-        if not result.get('task_content'):
+        tasks = task_items(result)
+        if not tasks:
             raise ValueError("完了するタスクが指定されていません")
-        response_text = handle_task_completion(user_id, result['task_content'])
+        response_text = await handle_task_completion(user_id, [task['task_content'] for task in tasks])
     elif action == 'list':
-        response_text = handle_task_list(user_id)
+        response_text = await handle_task_list(user_id)
     elif action == 'list_date':
-        response_text = handle_task_list(user_id, result['date'])
+        response_text = await handle_task_list(user_id, result['date'])
     elif action == 'remind':
-        response_text = handle_reminder(user_id, result['date'], result['time'])
+        response_text = await handle_reminder(user_id, result['date'], result['time'])
     elif action == 'current_time':
         response_text = handle_current_time()
     else:
         raise ValueError("不明なアクションです")
-    
-    # 応答テキストが空の場合はエラーメッセージを設定
-    if not response_text:
-        response_text = "申し訳ありません。処理中にエラーが発生しました。もう一度お試しください。"
-    
-    line_bot_api.reply_message_with_http_info(
-        {
-            'replyToken': event.reply_token,
-            'messages': [TextMessage(text=response_text)]
-        }
-    )
+    return response_text
 
 if __name__ == "__main__":
     import uvicorn
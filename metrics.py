@@ -0,0 +1,196 @@
+import bisect
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 既定のヒストグラム境界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry: Dict[str, "_Metric"] = {}
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ"""
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        return [(self.name, key, value) for key, value in list(self._values.items())]
+
+
+class Gauge(_Metric):
+    """任意の値を取るゲージ（関数を渡すと読み出し時に評価する）"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, description)
+        self._values: Dict[Tuple, float] = {}
+        self._func = func
+
+    def set(self, value: float, **labels) -> None:
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels) -> float:
+        if self._func is not None and not labels:
+            return self._func()
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        if self._func is not None:
+            return [(self.name, (), self._func())]
+        return [(self.name, key, value) for key, value in list(self._values.items())]
+
+
+class Histogram(_Metric):
+    """累積バケット方式のヒストグラム"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(_label_key(labels), ()))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(_label_key(labels), 0.0)
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        """観測のあったラベルの組み合わせを返す"""
+        return [dict(key) for key in list(self._counts)]
+
+    def quantile(self, q: float, **labels) -> float:
+        """q分位点を含むバケットの上限を返す（最後のバケットに入る場合は最大の境界）"""
+        counts = self._counts.get(_label_key(labels))
+        if not counts:
+            return 0.0
+        rank = q * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        result = []
+        for key, counts in list(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                result.append((f'{self.name}_bucket', key + (('le', repr(bound)),), cumulative))
+            cumulative += counts[-1]
+            result.append((f'{self.name}_bucket', key + (('le', '+Inf'),), cumulative))
+            result.append((f'{self.name}_count', key, cumulative))
+            result.append((f'{self.name}_sum', key, self._sums[key]))
+        return result
+
+
+def _register(metric: _Metric) -> _Metric:
+    with _lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, description: str) -> Counter:
+    """カウンタを登録して返す（同名があればそれを返す）"""
+    return _register(Counter(name, description))
+
+
+def gauge(name: str, description: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+    """ゲージを登録して返す（同名があればそれを返す）"""
+    return _register(Gauge(name, description, func))
+
+
+def histogram(name: str, description: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    """ヒストグラムを登録して返す（同名があればそれを返す）"""
+    return _register(Histogram(name, description, buckets))
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """登録済みメトリクスをJSON化しやすい辞書で返す"""
+    result: Dict[str, Dict[str, float]] = {}
+    for metric in list(_registry.values()):
+        for sample_name, key, value in metric.samples():
+            label_str = ','.join(f'{k}={v}' for k, v in key)
+            result.setdefault(sample_name, {})[label_str] = value
+    return result
+
+
+class _Timer:
+    def __init__(self, metric: Histogram, labels: Dict[str, str]):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metric.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timer(metric: Histogram, **labels) -> _Timer:
+    """with文の区間の所要時間をヒストグラムに記録する"""
+    return _Timer(metric, labels)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_prometheus() -> str:
+    """登録済みメトリクスをPrometheusのテキスト形式で返す"""
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f'# HELP {metric.name} {_escape(metric.description)}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for sample_name, key, value in metric.samples():
+            if key:
+                label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in key)
+                lines.append(f'{sample_name}{{{label_str}}} {value}')
+            else:
+                lines.append(f'{sample_name} {value}')
+    return '\n'.join(lines) + '\n'
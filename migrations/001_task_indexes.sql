@@ -0,0 +1,15 @@
+-- タスク一覧・通知・完了の問い合わせをインデックスで引けるようにする
+-- Supabaseの SQL Editor などで実行してください（何度実行しても問題ありません）
+
+-- 一覧・リマインド: user_id = ? AND scheduled_date = ? ORDER BY scheduled_time
+create index if not exists tasks_user_date_time_idx
+    on tasks (user_id, scheduled_date, scheduled_time);
+
+-- 朝・昼の通知（キーセットページング）:
+--   scheduled_date = ? [AND is_done = false] AND (user_id, scheduled_time, id) > カーソル
+--   ORDER BY user_id, scheduled_time, id LIMIT ?
+-- 未完了のみの場合は等号の2列に続く3列で並び順とカーソルの条件をそのままインデックスで引ける。
+-- 完了済みも含む場合は is_done ごとの範囲を読んで並べ替える
+drop index if exists tasks_date_done_idx;
+create index if not exists tasks_date_done_user_time_idx
+    on tasks (scheduled_date, is_done, user_id, scheduled_time, id);
@@ -0,0 +1,20 @@
+-- 朝・昼の通知で読む、ユーザー・日付ごとのタスク一覧のダイジェスト
+-- タスクの登録・完了のたびにアプリが書き込み、通知は tasks の代わりにこのテーブルを1ユーザー1行で読む
+-- Supabaseの SQL Editor などで実行してください（何度実行しても問題ありません）
+-- 既存のタスクからダイジェストを作るには、実行後に `python notify.py digests YYYY-MM-DD` を日付ごとに実行します
+
+create table if not exists task_digests (
+    user_id text not null,
+    scheduled_date date not null,
+    -- [{"content": ..., "scheduled_time": ..., "is_done": ...}, ...]（時間順）
+    tasks jsonb not null default '[]'::jsonb,
+    open_count integer not null default 0,
+    -- tasks の内容から計算したハッシュ（変わっていなければ昼の通知を送らない）
+    version text not null default '',
+    updated_at timestamptz not null default now(),
+    primary key (user_id, scheduled_date)
+);
+
+-- 通知: scheduled_date = ? [AND open_count > 0] AND user_id > ? ORDER BY user_id
+create index if not exists task_digests_date_user_idx
+    on task_digests (scheduled_date, user_id);
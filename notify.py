@@ -1,103 +1,225 @@
-import os
-from dotenv import load_dotenv
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
-from linebot.v3.messaging import TextMessage
-from supabase import create_client, Client
-from datetime import datetime, time
-import pytz
-
-# 環境変数の読み込み
-load_dotenv()
-
-# LINE Botの設定
-configuration = Configuration(access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
-client = ApiClient(configuration)
-line_bot_api = MessagingApi(client)
-
-# Supabaseの設定
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+import sys
+import asyncio
+from datetime import datetime, date
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import config
+import clients
+from push_engine import PushEngine
+from task_store import TaskStore
+from digest import NotifiedVersions, build_digest, notify_skipped
+from logging_config import get_logger, setup_logging
+import kvstore
 
-def send_morning_notification():
-    """朝8時のタスク一覧通知"""
-    jst = pytz.timezone('Asia/Tokyo')
-    today = datetime.now(jst).date()
-    
-    # 全ユーザーのタスクを取得
-    response = supabase.table('tasks').select('*').eq('scheduled_date', today).order('scheduled_time').execute()
-    tasks = response.data
-    
-    # ユーザーごとにタスクをグループ化
-    user_tasks = {}
-    for task in tasks:
-        if task['user_id'] not in user_tasks:
-            user_tasks[task['user_id']] = []
-        user_tasks[task['user_id']].append(task)
-    
-    # 各ユーザーに通知を送信
-    for user_id, user_task_list in user_tasks.items():
-        if not user_task_list:
-            continue
-            
-        message = [f'【今日のタスク（{today.strftime("%m/%d")}）】']
-        for task in user_task_list:
-            time_str = f"{task['scheduled_time']} " if task['scheduled_time'] else ''
-            status = '✅' if task['is_done'] else '⏳'
-            message.append(f"{status} {time_str}{task['content']}")
-        
+logger = get_logger(__name__)
+
+def create_notified_versions() -> NotifiedVersions:
+    """通知したダイジェストの版の記録を開く（スケジューラの実行記録と同じ保存先）"""
+    return NotifiedVersions(kvstore.create_store(
+        'notified', backend=config.SCHEDULER_STATE_BACKEND, url=config.SCHEDULER_STATE_URL,
+        max_entries=config.NOTIFIED_VERSIONS_SIZE
+    ))
+
+async def stream_user_tasks(store: TaskStore, today: date, only_open: bool = False,
+                            page_size: int = config.NOTIFY_PAGE_SIZE) -> AsyncIterator[Tuple[str, List[dict]]]:
+    """指定日のタスクをキーセットページングで取得し、ユーザーごとにまとまった順に返す"""
+    cursor = None
+    current_user = None
+    current_tasks: List[dict] = []
+    while True:
+        rows = await store.day_tasks_page(today.isoformat(), only_open, cursor, page_size)
+
+        for row in rows:
+            if row['user_id'] != current_user:
+                # ユーザーが切り替わった時点で前のユーザーのタスクは揃っている
+                if current_tasks:
+                    yield current_user, current_tasks
+                current_user = row['user_id']
+                current_tasks = []
+            current_tasks.append(row)
+
+        if len(rows) < page_size:
+            break
+        last = rows[-1]
+        cursor = (last['user_id'], last['scheduled_time'], last['id'])
+
+    if current_tasks:
+        yield current_user, current_tasks
+
+async def stream_user_digests(store: TaskStore, today: date, only_open: bool = False,
+                              page_size: int = config.NOTIFY_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """指定日のダイジェストを user_id 順のキーセットページングで取得して返す"""
+    after_user = None
+    while True:
+        rows = await store.digests_page(today.isoformat(), only_open, after_user, page_size)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            break
+        after_user = rows[-1]['user_id']
+
+async def rebuild_digests(store: TaskStore, today: date, page_size: int = config.NOTIFY_PAGE_SIZE) -> int:
+    """指定日のタスクからダイジェストを作り直し、書き込んだ件数を返す（有効にする前の移行・復旧用）"""
+    count = 0
+    batch = []
+    async for user_id, user_task_list in stream_user_tasks(store, today, False, page_size):
+        batch.append(build_digest(user_id, today.isoformat(), user_task_list))
+        if len(batch) >= page_size:
+            await store.upsert_digests(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        await store.upsert_digests(batch)
+        count += len(batch)
+    return count
+
+def build_morning_message(today: date, user_task_list: List[dict]) -> str:
+    """朝8時のタスク一覧通知の文面を作る"""
+    message = [f'【今日のタスク（{today.strftime("%m/%d")}）】']
+    for task in user_task_list:
+        time_str = f"{task['scheduled_time'][:5]} " if task['scheduled_time'] else ''
+        status = '✅' if task['is_done'] else '⏳'
+        message.append(f"{status} {time_str}{task['content']}")
+    return '\n'.join(message)
+
+def build_afternoon_message(today: date, user_task_list: List[dict]) -> str:
+    """昼12時の未完了タスク通知の文面を作る"""
+    message = ['【未完了タスクの進捗確認】']
+    for task in user_task_list:
+        time_str = f"{task['scheduled_time'][:5]} " if task['scheduled_time'] else ''
+        message.append(f"⏳ {time_str}{task['content']}")
+    return '\n'.join(message)
+
+async def send_notification(build_message: Callable[[date, List[dict]], str], only_open: bool,
+                            today: Optional[date] = None, store: Optional[TaskStore] = None,
+                            digests: Optional[bool] = None, notified: Optional[NotifiedVersions] = None,
+                            skip_unchanged: bool = False) -> dict:
+    """タスク（またはダイジェスト）を取得しながら文面を作り、PushEngineで送信して集計結果を返す
+
+    store を省略した場合は TASK_STORE_BACKEND の設定でストアを開き、送信後に閉じる。
+    digests（省略時は DIGESTS_ENABLED）ならダイジェストから文面を作り、送信した版を notified に記録する。
+    skip_unchanged なら、記録した版から変わっていないユーザーには送らない。
+    """
+    if today is None:
+        today = datetime.now(config.JST).date()
+    if digests is None:
+        digests = config.DIGESTS_ENABLED
+    if digests and notified is None:
+        notified = create_notified_versions()
+
+    owned_store = store is None
+    if owned_store:
+        store = await clients.open_task_store()
+
+    scheduled_date = today.isoformat()
+    skipped = {'empty': 0, 'unchanged': 0}
+    # 送信待ちのユーザーのダイジェストの版（送信に成功したら記録する）
+    versions: Dict[str, str] = {}
+
+    def skip(reason: str):
+        skipped[reason] += 1
+        notify_skipped.inc(reason=reason)
+
+    async def last_notified(user_id: str) -> Optional[str]:
+        # 記録を読めない場合は変わったものとして送る
         try:
-            line_bot_api.push_message_with_http_info({
-                'to': user_id,
-                'messages': [TextMessage(text='\n'.join(message))]
-            })
+            return await notified.get(scheduled_date, user_id)
         except Exception as e:
-            print(f"Error sending notification to {user_id}: {e}")
+            logger.warning("通知した版の読み込みに失敗しました: %s", e)
+            return None
+
+    async def task_messages():
+        async for user_id, user_task_list in stream_user_tasks(store, today, only_open):
+            yield user_id, build_message(today, user_task_list)
+
+    async def digest_messages():
+        async for row in stream_user_digests(store, today, only_open):
+            user_id = row['user_id']
+            user_task_list = [task for task in row['tasks'] if not (only_open and task['is_done'])]
+            if not user_task_list:
+                skip('empty')
+                continue
+            if skip_unchanged and await last_notified(user_id) == row['version']:
+                skip('unchanged')
+                continue
+            versions[user_id] = row['version']
+            yield user_id, build_message(today, user_task_list)
+
+    async def record_sent(user_ids: List[str], text: str):
+        for user_id in user_ids:
+            version = versions.pop(user_id, None)
+            if version is None:
+                continue
+            try:
+                await notified.set(scheduled_date, user_id, version)
+            except Exception as e:
+                logger.warning("通知した版の記録に失敗しました: %s", e)
+
+    try:
+        async with clients.create_line_api(config.PUSH_CONCURRENCY) as client:
+            engine = PushEngine(
+                clients.messaging_api(client),
+                concurrency=config.PUSH_CONCURRENCY,
+                push_rate=config.PUSH_RATE,
+                multicast_rate=config.MULTICAST_RATE
+            )
+
+            if digests:
+                stats = await engine.send_stream(digest_messages(), on_sent=record_sent)
+            else:
+                stats = await engine.send_stream(task_messages())
+    finally:
+        if owned_store:
+            await store.close()
+
+    result = stats.as_dict()
+    if digests:
+        result.update(source='digests', skipped_empty=skipped['empty'], skipped_unchanged=skipped['unchanged'])
+    logger.info("通知送信結果: %s", result)
+    return result
+
+def send_morning_notification():
+    """朝8時のタスク一覧通知"""
+    return asyncio.run(send_notification(build_morning_message, only_open=False))
 
 def send_afternoon_notification():
     """昼12時の未完了タスク通知"""
-    jst = pytz.timezone('Asia/Tokyo')
-    today = datetime.now(jst).date()
-    
-    # 未完了のタスクを取得
-    response = supabase.table('tasks').select('*').eq('scheduled_date', today).eq('is_done', False).order('scheduled_time').execute()
-    tasks = response.data
-    
-    # ユーザーごとにタスクをグループ化
-    user_tasks = {}
-    for task in tasks:
-        if task['user_id'] not in user_tasks:
-            user_tasks[task['user_id']] = []
-        user_tasks[task['user_id']].append(task)
-    
-    # 各ユーザーに通知を送信
-    for user_id, user_task_list in user_tasks.items():
-        if not user_task_list:
-            continue
-            
-        message = ['【未完了タスクの進捗確認】']
-        for task in user_task_list:
-            time_str = f"{task['scheduled_time']} " if task['scheduled_time'] else ''
-            message.append(f"⏳ {time_str}{task['content']}")
-        
-        try:
-            line_bot_api.push_message_with_http_info({
-                'to': user_id,
-                'messages': [TextMessage(text='\n'.join(message))]
-            })
-        except Exception as e:
-            print(f"Error sending notification to {user_id}: {e}")
+    return asyncio.run(send_notification(build_afternoon_message, only_open=True,
+                                         skip_unchanged=config.AFTERNOON_SKIP_UNCHANGED))
+
+async def rebuild_digests_command(today: date) -> int:
+    store = await clients.open_task_store()
+    try:
+        count = await rebuild_digests(store, today)
+    finally:
+        await store.close()
+    logger.info("%sのダイジェスト%s件を作り直しました", today, count)
+    return count
 
 if __name__ == "__main__":
+    setup_logging()
+    # 通常はWebサービス内のスケジューラ（scheduler.py）が送信する。手動実行時は種類を指定できる
+    if len(sys.argv) > 1 and sys.argv[1] == 'morning':
+        send_morning_notification()
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'afternoon':
+        send_afternoon_notification()
+        sys.exit(0)
+    # python notify.py digests [YYYY-MM-DD]：既存のタスクからダイジェストを作り直す（省略時は今日）
+    if len(sys.argv) > 1 and sys.argv[1] == 'digests':
+        if len(sys.argv) > 2:
+            day = date.fromisoformat(sys.argv[2])
+        else:
+            day = datetime.now(config.JST).date()
+        asyncio.run(rebuild_digests_command(day))
+        sys.exit(0)
+
     # 現在の時刻を取得
-    jst = pytz.timezone('Asia/Tokyo')
-    current_time = datetime.now(jst).time()
-    
+    current_time = datetime.now(config.JST).time()
+
     # 朝8時の通知
     if current_time.hour == 8 and current_time.minute == 0:
         send_morning_notification()
-    
+
     # 昼12時の通知
     elif current_time.hour == 12 and current_time.minute == 0:
-        send_afternoon_notification() 
\ No newline at end of file
+        send_afternoon_notification()
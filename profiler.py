@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+profiles_written = metrics.counter('profiles_written_total', '書き出したプロファイル数')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # folded形式では ; が区切り、空白の後ろがサンプル数になるため含めない
+    name = getattr(code, 'co_qualname', code.co_name).replace(';', ':').replace(' ', '_')
+    return f'{name}({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def task_stack(task, thread_frame) -> str:
+    """asyncioのタスクの現在のスタックを、外側から ; でつないだ文字列にする
+
+    実行中なら、スレッドのスタックのうちタスクのコルーチンより内側（同期的な呼び出しを含む）を、
+    待機中なら、awaitでつながったコルーチンと待っている対象を返す。
+    別スレッドから読むため、採取の途中でタスクが進むと不正確なスタックになることがある。
+    """
+    coro = task.get_coro()
+    if getattr(coro, 'cr_running', False):
+        frames = []
+        frame = thread_frame
+        while frame is not None:
+            frames.append(frame)
+            if frame is coro.cr_frame:
+                return ';'.join(_frame_name(frame) for frame in reversed(frames))
+            frame = frame.f_back
+        return '(running)'
+    names = []
+    leaf = '(idle)'
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        awaiting = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+        if awaiting is not None and not hasattr(awaiting, 'cr_frame') and not hasattr(awaiting, 'gi_frame'):
+            leaf = f'(await_{type(awaiting).__name__})'
+            break
+        coro = awaiting
+    return ';'.join(names + [leaf])
+
+
+class _Profile:
+    def __init__(self, task, thread_id: int):
+        self.task = task
+        self.thread_id = thread_id
+        self.samples: Counter = Counter()
+
+
+class SamplingProfiler:
+    """処理中のリクエストのスタックを一定間隔で採取し、遅かったものだけfolded形式で書き出す
+
+    採取は別スレッドで行い、リクエストを処理中のasyncioのタスクごとにスタックを数える。
+    処理にかかった時間が threshold 秒以上なら directory に `*.folded` を書き出す
+    （flamegraph.pl・speedscope・inferno でフレームグラフにできる）。書き出すファイルは max_files 個までで、古いものから消す。
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005, directory: str = 'profiles', max_files: int = 100):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self._active: Dict[Any, _Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, key: Any, task) -> None:
+        """key のリクエストの採取を始める（イベントループのスレッドから呼ぶ）"""
+        if task is None:
+            return
+        with self._lock:
+            self._active[key] = _Profile(task, threading.get_ident())
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def end(self, key: Any, elapsed: float, label: str) -> Optional[str]:
+        """採取を終え、遅かった場合は書き出したファイルのパスを返す"""
+        with self._lock:
+            profile = self._active.pop(key, None)
+            if not self._active:
+                self._wake.clear()
+        if profile is None or elapsed < self.threshold or not profile.samples:
+            return None
+        try:
+            return self._write(profile.samples, elapsed, label)
+        except OSError as e:
+            logger.error("プロファイルを書き出せませんでした: %s", e)
+            return None
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self._active.values())
+            if not profiles:
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                try:
+                    profile.samples[task_stack(profile.task, frames.get(profile.thread_id))] += 1
+                except Exception:
+                    # 採取中にタスクが終わった・進んだ場合は捨てる
+                    continue
+
+    def _write(self, samples: Counter, elapsed: float, label: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(self.directory, f'{stamp}-{label}-{round(elapsed * 1000)}ms.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        profiles_written.inc()
+        self._prune()
+        logger.warning("遅いリクエストのプロファイルを書き出しました",
+                       extra={'path': path, 'elapsed_ms': round(elapsed * 1000, 1), 'samples': sum(samples.values())})
+        return path
+
+    def _prune(self) -> None:
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.folded'))
+        for name in files[:max(0, len(files) - self.max_files)]:
+            os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import DEFAULT_MULTICAST_RATE, DEFAULT_PUSH_RATE
+from logging_config import get_logger
+from resilience import RETRYABLE_STATUSES
+
+if TYPE_CHECKING:
+    from linebot.v3.messaging import AsyncMessagingApi
+    from linebot.v3.messaging.exceptions import ApiException
+
+logger = get_logger(__name__)
+
+# multicastで一度に送れる宛先数の上限
+MULTICAST_MAX_RECIPIENTS = 500
+
+
+class TokenBucket:
+    """一定レートでトークンを補充するレートリミッタ"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PushStats:
+    """送信結果の集計"""
+
+    def __init__(self):
+        self.recipients = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def wall_time(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def sends_per_sec(self) -> float:
+        return self.recipients / self.wall_time if self.wall_time > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'recipients': self.recipients,
+            'requests': self.requests,
+            'retries': self.retries,
+            'failures': self.failures,
+            'wall_time': round(self.wall_time, 3),
+            'sends_per_sec': round(self.sends_per_sec, 1),
+        }
+
+
+def _retry_after(e: "ApiException") -> Optional[float]:
+    if not e.headers:
+        return None
+    value = e.headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class PushEngine:
+    """並列数とレートを制限しながらLINEのpush/multicastを送信する"""
+
+    def __init__(self, api: "AsyncMessagingApi", concurrency: int = 50,
+                 push_rate: float = DEFAULT_PUSH_RATE, multicast_rate: float = DEFAULT_MULTICAST_RATE,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30):
+        self.api = api
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._push_bucket = TokenBucket(push_rate)
+        self._multicast_bucket = TokenBucket(multicast_rate)
+        self.stats = PushStats()
+
+    async def _call(self, bucket: TokenBucket, send, recipients: int) -> bool:
+        # SDKはPushEngineを使うときに初めて読み込む（clients.py を参照）
+        from linebot.v3.messaging.exceptions import ApiException
+        # 同じリトライキーで再送すればLINE側で重複送信が防がれる
+        retry_key = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            async with self._semaphore:
+                self.stats.requests += 1
+                try:
+                    await send(retry_key)
+                    self.stats.recipients += recipients
+                    return True
+                except ApiException as e:
+                    # 409はリトライキーが受理済み（前回の送信が成功している）
+                    if e.status == 409:
+                        self.stats.recipients += recipients
+                        return True
+                    if e.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                        logger.warning("PushEngine: 送信に失敗しました status=%s reason=%s", e.status, e.reason)
+                        break
+                    delay = _retry_after(e)
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        logger.warning("PushEngine: 送信に失敗しました: %s", e)
+                        break
+                    delay = None
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+        self.stats.failures += recipients
+        return False
+
+    async def push(self, user_id: str, text: str) -> bool:
+        """1ユーザーにpushする"""
+        from linebot.v3.messaging import PushMessageRequest, TextMessage
+
+        async def send(retry_key):
+            await self.api.push_message_with_http_info(
+                PushMessageRequest(to=user_id, messages=[TextMessage(text=text)]),
+                x_line_retry_key=retry_key
+            )
+        return await self._call(self._push_bucket, send, 1)
+
+    async def multicast(self, user_ids: List[str], text: str) -> bool:
+        """同じ文面を最大500人にまとめて送る"""
+        from linebot.v3.messaging import MulticastRequest, TextMessage
+
+        async def send(retry_key):
+            await self.api.multicast_with_http_info(
+                MulticastRequest(to=user_ids, messages=[TextMessage(text=text)]),
+                x_line_retry_key=retry_key
+            )
+        return await self._call(self._multicast_bucket, send, len(user_ids))
+
+    def _send_group(self, text: str, user_ids: List[str]):
+        if len(user_ids) == 1:
+            return self.push(user_ids[0], text)
+        return self.multicast(user_ids, text)
+
+    async def send_stream(self, messages: AsyncIterable[Tuple[str, str]], window: Optional[int] = 1000,
+                          on_sent: Optional[Callable[[List[str], str], Awaitable[None]]] = None) -> PushStats:
+        """(user_id, 文面)の組を受け取りながら送信する
+
+        同じ文面の宛先は最大 window 人分まで保留してmulticastにまとめる。
+        保留が window を超えたら古い文面から送信するため、メモリ使用量は一定に保たれる。
+        送信中のリクエストが詰まっている間は受け取りを待たせる。
+        on_sent（コルーチン関数）を渡すと、送信に成功した宛先と文面で呼び出す。
+        """
+        pending: "OrderedDict[str, List[str]]" = OrderedDict()
+        pending_count = 0
+        in_flight: Set[asyncio.Task] = set()
+        max_in_flight = self.concurrency * 2
+
+        async def send(text: str, user_ids: List[str]):
+            if await self._send_group(text, user_ids) and on_sent is not None:
+                await on_sent(user_ids, text)
+
+        async def dispatch(text: str, user_ids: List[str]):
+            if len(in_flight) >= max_in_flight:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            task = asyncio.create_task(send(text, user_ids))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        async for user_id, text in messages:
+            user_ids = pending.setdefault(text, [])
+            user_ids.append(user_id)
+            pending_count += 1
+            if len(user_ids) >= MULTICAST_MAX_RECIPIENTS:
+                del pending[text]
+                pending_count -= len(user_ids)
+                await dispatch(text, user_ids)
+            while window is not None and pending_count > window:
+                oldest_text, oldest_ids = pending.popitem(last=False)
+                pending_count -= len(oldest_ids)
+                await dispatch(oldest_text, oldest_ids)
+
+        for text, user_ids in pending.items():
+            await dispatch(text, user_ids)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        self.stats.finished = time.monotonic()
+        return self.stats
+
+    async def send_all(self, messages: Iterable[Tuple[str, str]]) -> PushStats:
+        """(user_id, 文面)の組をすべて送信する。同じ文面の宛先はmulticastにまとめる"""
+        async def iterate():
+            for message in messages:
+                yield message
+        return await self.send_stream(iterate(), window=None)
@@ -0,0 +1,230 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# リトライしてよいHTTPステータス（レート制限とサーバー側の一時的なエラー）
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+requests_throttled = metrics.counter('requests_throttled_total', 'レート制限で断ったリクエスト数（scope別）')
+requests_shed = metrics.counter('requests_shed_total', '過負荷・サーキットオープンで断ったリクエスト数（reason別）')
+external_retries = metrics.counter('external_retries_total', '外部API呼び出しのリトライ回数（service別）')
+circuit_rejected = metrics.counter('circuit_rejected_total', 'サーキットオープン中に呼ばずに失敗させた数（service別）')
+circuit_opened = metrics.counter('circuit_opened_total', 'サーキットが開いた回数（service別）')
+circuit_open = metrics.gauge('circuit_open', 'サーキットが開いていれば1（service別）')
+
+T = TypeVar('T')
+
+
+class Throttled(Exception):
+    """レート制限を超えた"""
+
+    def __init__(self, scope: str):
+        super().__init__(f'rate limit exceeded: {scope}')
+        self.scope = scope
+
+
+class Overloaded(Exception):
+    """処理能力を超えたため受け付けなかった"""
+
+
+class CircuitOpenError(Overloaded):
+    """依存サービスのサーキットが開いている"""
+
+    def __init__(self, service: str):
+        super().__init__(f'circuit open: {service}')
+        self.service = service
+
+
+class RateLimiter:
+    """キー（ユーザーIDなど）ごとのトークンバケット。待たずに可否だけを返す
+
+    バケットは最後に使った順に max_keys 個まで保持する（追い出されたキーは満タンから再開）。
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def allow(self, key: str = '*', cost: float = 1) -> bool:
+        """トークンが残っていれば消費してTrueを返す"""
+        if not self.enabled:
+            return True
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class AdmissionGate:
+    """同時実行数の上限。空きを timeout 秒待っても入れない、または待ちが max_waiting を超えたら断る"""
+
+    def __init__(self, limit: int, max_waiting: int = 100, timeout: float = 5):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded('too many waiting')
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded('admission timeout')
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def in_flight(self) -> int:
+        return self.limit - self._semaphore._value
+
+
+class CircuitBreaker:
+    """連続して failure_threshold 回失敗したら reset_timeout 秒は呼び出しを止める
+
+    時間が経つと1件だけ試しに通し（half-open）、成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        circuit_open.set(0, service=name)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self) -> None:
+        """呼び出してよいか確かめ、開いていれば CircuitOpenError を送出する"""
+        state = self.state
+        if state == 'closed':
+            return
+        # 試しの1件が戻らないまま（キャンセルなど）でも、reset_timeout 後には次の1件を通す
+        now = time.monotonic()
+        if state == 'half_open' and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+            self._probe_started = now
+            return
+        circuit_rejected.inc(service=self.name)
+        raise CircuitOpenError(self.name)
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("CircuitBreaker: %s を閉じました", self.name)
+            circuit_open.set(0, service=self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                circuit_opened.inc(service=self.name)
+                logger.warning("CircuitBreaker: %s が%s回連続で失敗したため開きました", self.name, self.failures)
+            self.opened_at = time.monotonic()
+            circuit_open.set(1, service=self.name)
+
+
+def is_retryable(e: BaseException) -> bool:
+    """一時的なエラー（429・5xx・タイムアウト・接続エラー）かどうか"""
+    status = getattr(e, 'status_code', None) or getattr(e, 'status', None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUSES
+    if isinstance(e, (asyncio.TimeoutError, OSError)):
+        return True
+    # httpx・openaiの接続/タイムアウト系の例外（依存を持たないようクラス名で判定する）
+    return any(cls.__name__ in ('HTTPError', 'TransportError', 'APIConnectionError', 'APITimeoutError')
+               for cls in type(e).__mro__)
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """指数バックオフにジッターを加えた待ち時間"""
+    return min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], breaker: Optional[CircuitBreaker] = None,
+                          retries: int = 2, base_delay: float = 0.2, max_delay: float = 5) -> T:
+    """一時的なエラーのみ指数バックオフでリトライしながら func() を呼ぶ
+
+    それ以外のエラーはすぐに送出する。サーキットが開いていれば呼ばずに CircuitOpenError を送出する。
+    """
+    service = breaker.name if breaker is not None else 'unknown'
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await func()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # 呼び出し側の誤り（4xxなど）はサービスの障害として数えない
+                    breaker.record_success()
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            external_retries.inc(service=service)
+            logger.warning("%s の呼び出しに失敗しました（%s/%s回目、%.2f秒後に再試行）: %s",
+                           service, attempt, retries, delay, e)
+            await asyncio.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+class Breakers:
+    """サービス名ごとのサーキットブレーカー"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def __getitem__(self, service: str) -> CircuitBreaker:
+        breaker = self._breakers.get(service)
+        if breaker is None:
+            breaker = self._breakers[service] = CircuitBreaker(service, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def stats(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self._breakers.items()}
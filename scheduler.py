@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import itertools
+import json
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import config
+import metrics
+from config import JST
+from coordination import SharedLock
+from logging_config import get_logger
+from task_store import REMINDER_COLUMNS
+
+logger = get_logger(__name__)
+
+# キューが空でもこの間隔で起きて時計のずれを吸収する
+MAX_SLEEP = 60
+
+scheduler_fired = metrics.counter('scheduler_fired_total', '実行したジョブ数（kind別）')
+scheduler_failed = metrics.counter('scheduler_failed_total', '失敗したジョブ数（kind別）')
+scheduler_lag = metrics.histogram('scheduler_lag_seconds', '予定時刻から実行開始までの遅れ（kind別）',
+                                  buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 3600))
+scheduler_last_lag = metrics.gauge('scheduler_last_lag_seconds', '直近に実行したジョブの遅れ')
+
+Action = Callable[[], Awaitable[None]]
+
+
+def now_jst() -> datetime:
+    return datetime.now(JST)
+
+
+class Scheduler:
+    """実行時刻の最小ヒープでジョブを管理するプロセス内スケジューラ
+
+    ジョブはキー単位で一意。実行時に state ストアへキーをアトミックに記録（SET NX）し、
+    記録できたワーカーだけが実行するので、再起動をまたいでも複数のワーカーでも同じジョブを二重に実行しない。
+    予定時刻を過ぎたジョブは catch_up 秒以内であれば直ちに実行する。
+    """
+
+    def __init__(self, state=None, clock: Callable[[], datetime] = now_jst):
+        self.state = state
+        self.clock = clock
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._jobs: Dict[str, Tuple[datetime, str, Action, Optional[Callable[[], None]]]] = {}
+        self._counter = itertools.count()
+        # 実行済みを記録しない（繰り返し実行する）ジョブのキー
+        self._transient: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # 実行中のジョブ（参照を持っていないとタスクがGCで消えることがある）
+        self._running: Set[asyncio.Task] = set()
+        metrics.gauge('scheduler_pending_jobs', '待機中のジョブ数', lambda: len(self._jobs))
+
+    async def _claim(self, key: str) -> bool:
+        """このワーカーで実行してよければTrue（実行済みの記録がなければ記録する）"""
+        if self.state is None or key in self._transient:
+            return True
+        try:
+            return await self.state.aadd(f'done:{key}', '1', 3 * 24 * 60 * 60)
+        except Exception as e:
+            # 記録できない場合は取りこぼすより実行する
+            logger.error("Scheduler: ジョブ %s の実行記録に失敗しました: %s", key, e)
+            return True
+
+    def schedule(self, key: str, fire_at: datetime, action: Action, kind: str = 'job',
+                 catch_up: float = 2 * 60 * 60, then: Optional[Callable[[], None]] = None) -> bool:
+        """ジョブを登録する。猶予切れの場合はFalseを返す
+
+        実行済みのジョブも登録はされ、予定時刻に読み飛ばす。then は実行したか読み飛ばしたかによらず予定時刻の後に呼ぶ。
+        """
+        if self.clock() - fire_at > timedelta(seconds=catch_up):
+            return False
+        job = self._jobs.get(key)
+        if job is not None and job[0] == fire_at:
+            # 同じ時刻での再登録（定期的な読み込み）はヒープに積まずに差し替える
+            self._jobs[key] = (fire_at, kind, action, then)
+            return True
+        self._jobs[key] = (fire_at, kind, action, then)
+        heapq.heappush(self._heap, (fire_at, next(self._counter), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+        return True
+
+    def cancel(self, key: str) -> None:
+        """ジョブを取り消す（ヒープからは実行時に読み飛ばす）"""
+        self._jobs.pop(key, None)
+
+    def schedule_daily(self, name: str, at: str, action: Callable[[date], Awaitable[None]],
+                       catch_up: float = 2 * 60 * 60) -> None:
+        """毎日 at（HH:MM、日本時間）に action(当日の日付) を実行する"""
+        hour, minute = map(int, at.split(':'))
+
+        def schedule_for(day: date) -> bool:
+            fire_at = datetime.combine(day, datetime.min.time(), tzinfo=JST).replace(hour=hour, minute=minute)
+
+            async def run():
+                await action(day)
+
+            # 実行後（他のワーカーで実行済みなら予定時刻の後）に次の日の分を登録
+            return self.schedule(f'{name}:{day.isoformat()}', fire_at, run, kind=name, catch_up=catch_up,
+                                 then=lambda: schedule_for(day + timedelta(days=1)))
+
+        today = self.clock().date()
+        if not schedule_for(today):
+            schedule_for(today + timedelta(days=1))
+
+    def schedule_every(self, name: str, interval: float, action: Action) -> None:
+        """interval 秒ごとに action を実行する（実行済みの記録は残さない）"""
+        key = f'every:{name}'
+        self._transient.add(key)
+
+        self.schedule(key, self.clock() + timedelta(seconds=interval), action, kind=name,
+                      then=lambda: self.schedule_every(name, interval, action))
+
+    async def _run_job(self, key: str, fire_at: datetime, kind: str, action: Action,
+                       then: Optional[Callable[[], None]]) -> None:
+        try:
+            if not await self._claim(key):
+                logger.info("Scheduler: ジョブ %s は実行済みのため読み飛ばしました", key)
+                return
+            lag = max(0.0, (self.clock() - fire_at).total_seconds())
+            scheduler_lag.observe(lag, kind=kind)
+            scheduler_last_lag.set(lag)
+            try:
+                await action()
+                scheduler_fired.inc(kind=kind)
+            except Exception as e:
+                scheduler_failed.inc(kind=kind)
+                logger.error("Scheduler: ジョブ %s の実行に失敗しました: %s", key, e)
+        finally:
+            if then is not None:
+                then()
+
+    async def run(self) -> None:
+        """ジョブを予定時刻に実行し続ける"""
+        while True:
+            self._wakeup.clear()
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, key = heapq.heappop(self._heap)
+                job = self._jobs.get(key)
+                # 取り消し済み、または再登録で時刻が変わったものは読み飛ばす
+                if job is None or job[0] != fire_at:
+                    continue
+                del self._jobs[key]
+                task = asyncio.create_task(self._run_job(key, fire_at, job[1], job[2], job[3]))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            delay = MAX_SLEEP
+            if self._heap:
+                delay = min(delay, max(0.0, (self._heap[0][0] - self.clock()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        upcoming = min((job[0] for job in self._jobs.values()), default=None)
+        return {
+            'pending': len(self._jobs),
+            'next_fire_at': upcoming.isoformat() if upcoming else None,
+            'last_lag_seconds': scheduler_last_lag.value(),
+        }
+
+
+def reminder_fire_at(scheduled_date: str, remind_time: str) -> datetime:
+    """タスクの日付とリマインド時刻（HH:MM[:SS]）から実行時刻を求める"""
+    day = date.fromisoformat(scheduled_date)
+    hour, minute = map(int, remind_time.split(':')[:2])
+    return datetime.combine(day, datetime.min.time(), tzinfo=JST).replace(hour=hour, minute=minute)
+
+
+def schedule_task_reminder(scheduler: Scheduler, task: dict, send: Callable[[dict], Awaitable[None]]) -> bool:
+    """remind_time付きのタスクをリマインドジョブとして登録する"""
+    if not task.get('remind_time') or not task.get('id'):
+        return False
+
+    async def run():
+        await send(task)
+
+    fire_at = reminder_fire_at(task['scheduled_date'], task['remind_time'])
+    return scheduler.schedule(f"reminder:{task['id']}", fire_at, run, kind='reminder', catch_up=30 * 60)
+
+
+async def load_task_reminders(scheduler: Scheduler, store, send: Callable[[dict], Awaitable[None]],
+                              start: date, days: int = 2) -> int:
+    """指定期間の未完了タスクのリマインドをまとめて登録し、登録件数を返す"""
+    end = start + timedelta(days=days - 1)
+    count = 0
+    for task in await store.reminder_tasks(start, end):
+        if schedule_task_reminder(scheduler, task, send):
+            count += 1
+    return count
+
+
+class ReminderInbox:
+    """スケジューラを持たないワーカーで登録されたリマインドを、共有ストア経由でスケジューラに渡す
+
+    登録したワーカーが publish で積み、スケジューラは drain で前回から積まれた分だけを取り出して登録する
+    （定期的に期間内のリマインドを全件読み直さずに済む）。
+    """
+
+    KEY = 'pending'
+
+    def __init__(self, store, ttl: float = 2 * 24 * 60 * 60):
+        self.store = store
+        self.ttl = ttl
+        self._lock = SharedLock(store, ttl=5, timeout=5)
+
+    async def publish(self, tasks: List[dict]) -> int:
+        """remind_time付きのタスクを積み、積んだ件数を返す"""
+        columns = [column.strip() for column in REMINDER_COLUMNS.split(',')]
+        entries = [{column: task.get(column) for column in columns}
+                   for task in tasks if task.get('remind_time') and task.get('id')]
+        if not entries:
+            return 0
+        async with self._lock.hold(f'{self.KEY}:lock'):
+            pending = json.loads(await self.store.aget(self.KEY) or '[]')
+            await self.store.aset(self.KEY, json.dumps(pending + entries, ensure_ascii=False), self.ttl)
+        return len(entries)
+
+    async def drain(self) -> List[dict]:
+        """積まれているタスクをすべて取り出す"""
+        async with self._lock.hold(f'{self.KEY}:lock'):
+            pending = json.loads(await self.store.aget(self.KEY) or '[]')
+            if pending:
+                await self.store.adelete(self.KEY)
+        return pending
+
+
+async def sync_task_reminders(scheduler: Scheduler, inbox: ReminderInbox,
+                              send: Callable[[dict], Awaitable[None]]) -> int:
+    """他のワーカーで登録されたタスクのリマインドを登録し、登録件数を返す"""
+    count = 0
+    for task in await inbox.drain():
+        if schedule_task_reminder(scheduler, task, send):
+            count += 1
+    return count
+
+
+async def run_worker() -> None:
+    """Webサービスとは別の常駐ワーカーとしてスケジューラを動かす
+
+    複数起動してもリースを取れた1つだけがスケジューラを動かし、落ちれば別のワーカーが引き継ぐ。
+    """
+    import main
+    from coordination import LeaderLease
+
+    async def on_elected():
+        await main.start_scheduler()
+
+    async def on_revoked():
+        if main.scheduler is not None:
+            await main.scheduler.stop()
+            main.scheduler = None
+
+    await main.create_clients()
+    lease = LeaderLease(main.shared_store('leases'), name='scheduler-worker', ttl=config.LEADER_LEASE_TTL,
+                        renew_interval=config.LEADER_LEASE_TTL / 3, on_elected=on_elected, on_revoked=on_revoked)
+    await lease.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await lease.stop()
+        await main.close_clients()
+
+
+if __name__ == '__main__':
+    asyncio.run(run_worker())
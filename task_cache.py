@@ -0,0 +1,169 @@
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from kvstore import cache_evictions, cache_hits, cache_misses
+from task_store import TASK_COLUMNS
+
+# 一覧表示・リマインドで使う列のみ保持する
+_CACHED_COLUMNS = tuple(column.strip() for column in TASK_COLUMNS.split(','))
+
+CACHE_NAME = 'tasks'
+
+Key = Tuple[str, str]
+
+
+def _sort_key(task: Dict[str, Any]):
+    # Supabaseの order('scheduled_time') と同じく時間未指定は末尾
+    return (task.get('scheduled_time') is None, task.get('scheduled_time') or '')
+
+
+def _estimate_size(tasks: List[Dict[str, Any]]) -> int:
+    size = sys.getsizeof(tasks)
+    for task in tasks:
+        size += sys.getsizeof(task)
+        for value in task.values():
+            size += sys.getsizeof(value)
+    return size
+
+
+class TaskCache:
+    """(user_id, scheduled_date)ごとのタスク一覧を保持する、メモリ量上限付きのLRUキャッシュ
+
+    versions（共有キー・バリューストア）を渡すと、ユーザーごとの版を共有して
+    他のワーカーが登録・完了した一覧をキャッシュから返さないようにする。
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300, versions=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.versions = versions
+        self._data: "OrderedDict[Key, Tuple[List[Dict[str, Any]], int, float, Optional[str]]]" = OrderedDict()
+        self._dates_by_user: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    async def version(self, user_id: str) -> Optional[str]:
+        """共有している現在の版（DBから読む前に取得し、get・setに渡す）"""
+        if self.versions is None or not self.enabled:
+            return None
+        return await self.versions.aget(f'taskver:{user_id}')
+
+    async def _bump(self, user_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """書き込みのたびに版を新しくし、(以前の版, 新しい版)を返す"""
+        if self.versions is None:
+            return None, None
+        previous = await self.versions.aget(f'taskver:{user_id}')
+        current = uuid.uuid4().hex
+        # 版が消えると全ワーカーのキャッシュがミスになるだけなので、TTLはキャッシュより長ければよい
+        await self.versions.aset(f'taskver:{user_id}', current, self.ttl * 2)
+        return previous, current
+
+    def get(self, user_id: str, scheduled_date: str, version: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """キャッシュ済みのタスク一覧（コピー）を返す。なければ（版が違えば）None"""
+        if not self.enabled:
+            return None
+        key = (user_id, scheduled_date)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[2] > time.monotonic() and item[3] == version:
+                self._data.move_to_end(key)
+                cache_hits.inc(cache=CACHE_NAME)
+                return [dict(task) for task in item[0]]
+            if item is not None:
+                self._remove(key)
+        cache_misses.inc(cache=CACHE_NAME)
+        return None
+
+    def set(self, user_id: str, scheduled_date: str, tasks: List[Dict[str, Any]],
+            version: Optional[str] = None) -> None:
+        """DBから取得したタスク一覧を、読む前に取得した版とともに保存する"""
+        if not self.enabled:
+            return
+        tasks = [{column: task.get(column) for column in _CACHED_COLUMNS} for task in tasks]
+        with self._lock:
+            self._store((user_id, scheduled_date), tasks, version)
+
+    async def add_task(self, user_id: str, scheduled_date: str, task: Dict[str, Any]) -> None:
+        """登録したタスクをキャッシュ済みの一覧に反映する（未キャッシュなら何もしない）"""
+        await self.add_tasks(user_id, [{**task, 'scheduled_date': scheduled_date}])
+
+    async def add_tasks(self, user_id: str, tasks: List[Dict[str, Any]]) -> None:
+        """まとめて登録したタスクを、版の更新1回でキャッシュ済みの一覧に反映する"""
+        if not self.enabled:
+            return
+        previous, current = await self._bump(user_id)
+        with self._lock:
+            for scheduled_date in list(self._dates_by_user.get(user_id, ())):
+                key = (user_id, scheduled_date)
+                cached, _, _, version = self._data[key]
+                if version != previous:
+                    # 他のワーカーの書き込みを反映していない一覧は捨てる
+                    self._remove(key)
+                    continue
+                added = [{
+                    'id': task.get('id'),
+                    'content': task.get('content'),
+                    'scheduled_time': task.get('scheduled_time'),
+                    'is_done': bool(task.get('is_done')),
+                } for task in tasks if task.get('scheduled_date') == scheduled_date]
+                if added or current != previous:
+                    merged = cached + added
+                    merged.sort(key=_sort_key)
+                    self._store(key, merged, current)
+
+    async def mark_done(self, user_id: str, task_ids: Iterable[Any]) -> None:
+        """完了にしたタスクをそのユーザーのキャッシュ済み一覧すべてに反映する"""
+        if not self.enabled:
+            return
+        task_ids = set(task_ids)
+        previous, current = await self._bump(user_id)
+        with self._lock:
+            for scheduled_date in list(self._dates_by_user.get(user_id, ())):
+                key = (user_id, scheduled_date)
+                tasks, size, expires_at, version = self._data[key]
+                if version != previous:
+                    self._remove(key)
+                    continue
+                for task in tasks:
+                    if task['id'] in task_ids:
+                        task['is_done'] = True
+                self._data[key] = (tasks, size, expires_at, current)
+
+    def invalidate(self, user_id: str, scheduled_date: Optional[str] = None) -> None:
+        """指定ユーザー（と日付）のキャッシュを破棄する"""
+        with self._lock:
+            dates = [scheduled_date] if scheduled_date else list(self._dates_by_user.get(user_id, ()))
+            for date_str in dates:
+                if (user_id, date_str) in self._data:
+                    self._remove((user_id, date_str))
+
+    def _store(self, key: Key, tasks: List[Dict[str, Any]], version: Optional[str]) -> None:
+        if key in self._data:
+            self._remove(key)
+        size = _estimate_size(tasks)
+        self._data[key] = (tasks, size, time.monotonic() + self.ttl, version)
+        self._dates_by_user.setdefault(key[0], set()).add(key[1])
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._data:
+            self._remove(next(iter(self._data)))
+            cache_evictions.inc(cache=CACHE_NAME)
+
+    def _remove(self, key: Key) -> None:
+        _, size, _, _ = self._data.pop(key)
+        self._bytes -= size
+        dates = self._dates_by_user.get(key[0])
+        if dates is not None:
+            dates.discard(key[1])
+            if not dates:
+                del self._dates_by_user[key[0]]
+
+    def stats(self) -> Dict[str, float]:
+        return {'entries': len(self._data), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
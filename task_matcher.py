@@ -0,0 +1,62 @@
+import json
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional
+
+from intent_cache import normalize_key
+
+# これ未満の類似度は一致とみなさない
+DEFAULT_MIN_SIMILARITY = 0.6
+
+
+class OrdinalMap:
+    """一覧で表示した番号とタスクIDの対応をユーザーごとに短時間保持する"""
+
+    def __init__(self, store, ttl: float = 30 * 60):
+        self.store = store
+        self.ttl = ttl
+
+    async def remember(self, user_id: str, tasks: List[Dict[str, Any]]) -> None:
+        """表示した順にタスクのIDと内容を保存する（最後に表示した一覧で上書き）
+
+        IDのない（保存が確認できていない）タスクも番号がずれないよう None として位置を残す。
+        """
+        entries = [{'id': task['id'], 'content': task['content']} if task.get('id') is not None else None
+                   for task in tasks]
+        if any(entries):
+            await self.store.aset(f'ordinals:{user_id}', json.dumps(entries, ensure_ascii=False), self.ttl)
+
+    async def resolve(self, user_id: str, ordinal: int) -> Optional[Dict[str, Any]]:
+        """番号（1始まり）に対応する {'id', 'content'} を返す。期限切れ・範囲外・IDのないタスクならNone"""
+        value = await self.store.aget(f'ordinals:{user_id}')
+        if value is None:
+            return None
+        entries = json.loads(value)
+        if 1 <= ordinal <= len(entries):
+            return entries[ordinal - 1]
+        return None
+
+
+def match_task(query: str, tasks: List[Dict[str, Any]],
+               min_similarity: float = DEFAULT_MIN_SIMILARITY) -> Optional[Dict[str, Any]]:
+    """内容が最も近いタスクを返す（完全一致→部分一致→類似度の順）。候補が絞れなければNone"""
+    key = normalize_key(query)
+    if not key:
+        return None
+    normalized = [(normalize_key(task['content']), task) for task in tasks]
+    for candidates in (
+        [task for content, task in normalized if content == key],
+        [task for content, task in normalized if content and (key in content or content in key)],
+    ):
+        if len(candidates) == 1:
+            return candidates[0]
+        if candidates:
+            # 同じ内容が複数あれば時間順で最初のものを完了にする
+            return candidates[0] if all(task['content'] == candidates[0]['content'] for task in candidates) else None
+    scored = sorted(((SequenceMatcher(None, key, content).ratio(), task) for content, task in normalized),
+                    key=lambda item: item[0], reverse=True)
+    if not scored or scored[0][0] < min_similarity:
+        return None
+    # 上位が僅差なら曖昧として扱う
+    if len(scored) > 1 and scored[0][0] - scored[1][0] < 0.1:
+        return None
+    return scored[0][1]
@@ -0,0 +1,470 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 一覧表示・リマインドで使う列
+TASK_COLUMNS = 'id, content, scheduled_time, is_done'
+# 朝・昼の通知で使う列
+NOTIFY_COLUMNS = 'id, user_id, content, scheduled_time, is_done'
+# リマインドの登録で使う列
+REMINDER_COLUMNS = 'id, user_id, content, scheduled_date, scheduled_time, remind_time'
+# 複製・初期読み込みで扱う列
+ALL_COLUMNS = 'id, user_id, content, is_done, created_at, scheduled_date, scheduled_time, remind_time'
+# ユーザー・日付ごとのダイジェスト（digest.py）の列
+DIGEST_COLUMNS = 'user_id, scheduled_date, tasks, open_count, version, updated_at'
+
+# 通知のキーセットページングのカーソル (user_id, scheduled_time, id)
+Cursor = Tuple[str, Optional[str], Any]
+
+replicated_rows = metrics.counter('task_replication_rows_total', 'Supabaseに複製したタスクの行数')
+replication_failures = metrics.counter('task_replication_failures_total', 'Supabaseへの複製に失敗した回数')
+
+
+class TaskStore:
+    """タスクの読み書きを行うストアのインターフェース
+
+    行は辞書で受け渡し、scheduled_time・remind_time は HH:MM:SS、scheduled_date は YYYY-MM-DD で返す。
+    """
+
+    name = 'tasks'
+
+    async def list_day(self, user_id: str, scheduled_date: str) -> List[Dict[str, Any]]:
+        """ユーザーの指定日のタスク（TASK_COLUMNS）を時間順（時間未指定は末尾）で返す"""
+        raise NotImplementedError
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """タスクをまとめて登録し、IDを含む登録後の行を返す"""
+        raise NotImplementedError
+
+    async def mark_done(self, user_id: str, task_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        """ユーザーのタスクをIDで完了にし、更新した行を返す"""
+        raise NotImplementedError
+
+    async def is_done(self, task_id: Any) -> Optional[bool]:
+        """タスクが完了済みかどうか。存在しなければNone"""
+        raise NotImplementedError
+
+    async def reminder_tasks(self, start: date, end: date) -> List[Dict[str, Any]]:
+        """期間内の未完了でリマインド時刻付きのタスク（REMINDER_COLUMNS）を返す"""
+        raise NotImplementedError
+
+    async def day_tasks_page(self, scheduled_date: str, only_open: bool, cursor: Optional[Cursor],
+                             limit: int) -> List[Dict[str, Any]]:
+        """指定日のタスク（NOTIFY_COLUMNS）を (user_id, scheduled_time NULLS LAST, id) 順に、cursorより後ろから返す"""
+        raise NotImplementedError
+
+    async def upsert_digests(self, rows: List[Dict[str, Any]]) -> None:
+        """ダイジェスト（DIGEST_COLUMNS、tasksはリスト）を (user_id, scheduled_date) をキーにまとめて書き込む"""
+        raise NotImplementedError
+
+    async def digests_page(self, scheduled_date: str, only_open: bool, after_user: Optional[str],
+                           limit: int) -> List[Dict[str, Any]]:
+        """指定日のダイジェストを user_id 順に after_user より後ろから返す（only_openなら未完了のあるものだけ）"""
+        raise NotImplementedError
+
+    async def ping(self) -> None:
+        """ストアに到達できるか確認する（失敗時は例外）"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+def _quote(value: str) -> str:
+    """PostgRESTのフィルタ値として安全に埋め込めるよう引用符で囲む"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def keyset_filter(user_id: str, scheduled_time: Optional[str], task_id: str) -> str:
+    """(user_id, scheduled_time NULLS LAST, id)順で直前の行より後ろを表すorフィルタを作る"""
+    user = _quote(user_id)
+    task = _quote(task_id)
+    if scheduled_time is None:
+        # 時間未指定の行は各ユーザーの末尾に並ぶ
+        return (f'user_id.gt.{user},'
+                f'and(user_id.eq.{user},scheduled_time.is.null,id.gt.{task})')
+    at = _quote(scheduled_time)
+    return (f'user_id.gt.{user},'
+            f'and(user_id.eq.{user},scheduled_time.gt.{at}),'
+            f'and(user_id.eq.{user},scheduled_time.eq.{at},id.gt.{task}),'
+            f'and(user_id.eq.{user},scheduled_time.is.null)')
+
+
+class SupabaseTaskStore(TaskStore):
+    """Supabase（PostgREST）の tasks テーブルを使うストア"""
+
+    name = 'supabase'
+
+    def __init__(self, client):
+        self.client = client
+
+    def _table(self):
+        return self.client.table('tasks')
+
+    async def list_day(self, user_id: str, scheduled_date: str) -> List[Dict[str, Any]]:
+        query = self._table().select(TASK_COLUMNS).eq('user_id', user_id).eq('scheduled_date', scheduled_date)
+        return (await query.order('scheduled_time').execute()).data
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return (await self._table().insert(rows).execute()).data
+
+    async def mark_done(self, user_id: str, task_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        query = self._table().update({'is_done': True}).eq('user_id', user_id).in_('id', list(task_ids))
+        return (await query.execute()).data
+
+    async def is_done(self, task_id: Any) -> Optional[bool]:
+        response = await self._table().select('is_done').eq('id', task_id).execute()
+        return response.data[0]['is_done'] if response.data else None
+
+    async def reminder_tasks(self, start: date, end: date) -> List[Dict[str, Any]]:
+        response = await self._table().select(REMINDER_COLUMNS) \
+            .gte('scheduled_date', start.isoformat()).lte('scheduled_date', end.isoformat()) \
+            .eq('is_done', False).not_.is_('remind_time', 'null') \
+            .execute()
+        return response.data
+
+    async def day_tasks_page(self, scheduled_date: str, only_open: bool, cursor: Optional[Cursor],
+                             limit: int) -> List[Dict[str, Any]]:
+        query = self._table().select(NOTIFY_COLUMNS).eq('scheduled_date', scheduled_date)
+        if only_open:
+            query = query.eq('is_done', False)
+        if cursor:
+            query = query.or_(keyset_filter(*cursor))
+        return (await query.order('user_id').order('scheduled_time').order('id').limit(limit).execute()).data
+
+    async def upsert_digests(self, rows: List[Dict[str, Any]]) -> None:
+        await self.client.table('task_digests').upsert(rows, on_conflict='user_id,scheduled_date').execute()
+
+    async def digests_page(self, scheduled_date: str, only_open: bool, after_user: Optional[str],
+                           limit: int) -> List[Dict[str, Any]]:
+        query = self.client.table('task_digests').select(DIGEST_COLUMNS).eq('scheduled_date', scheduled_date)
+        if only_open:
+            query = query.gt('open_count', 0)
+        if after_user is not None:
+            query = query.gt('user_id', after_user)
+        return (await query.order('user_id').limit(limit).execute()).data
+
+    async def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """IDをキーにまとめて書き込む（複製用）"""
+        await self._table().upsert(rows).execute()
+
+    async def all_tasks_page(self, after_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """全タスクをID順に返す（初期読み込み用）"""
+        query = self._table().select(ALL_COLUMNS)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return (await query.order('id').limit(limit).execute()).data
+
+    async def ping(self) -> None:
+        await self._table().select('id').limit(1).execute()
+
+    async def close(self) -> None:
+        await self.client.postgrest.aclose()
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    """HH:MM を PostgresのTIME型と同じ HH:MM:SS にそろえる"""
+    if not value:
+        return None
+    parts = value.split(':')
+    return ':'.join(f'{int(part):02d}' for part in (parts + ['0', '0'])[:3])
+
+
+class SqliteTaskStore(TaskStore):
+    """WALモードのSQLiteファイルにタスクを保存する、単一ノード向けの組み込みストア
+
+    行ごとに version と synced_version を持ち、差分を TaskReplicator がSupabaseへ複製する。
+    SQLは定数の文字列で発行し、sqlite3 のステートメントキャッシュで準備済み文を使い回す。
+    """
+
+    name = 'sqlite'
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS tasks ('
+        'id TEXT PRIMARY KEY, user_id TEXT NOT NULL, content TEXT NOT NULL, '
+        'is_done INTEGER NOT NULL DEFAULT 0, created_at TEXT, scheduled_date TEXT NOT NULL, '
+        'scheduled_time TEXT, remind_time TEXT, '
+        'version INTEGER NOT NULL DEFAULT 1, synced_version INTEGER NOT NULL DEFAULT 0)',
+        # 一覧・リマインド
+        'CREATE INDEX IF NOT EXISTS tasks_user_date_time_idx ON tasks (user_id, scheduled_date, scheduled_time)',
+        # 朝・昼の通知（migrations/001_task_indexes.sql と同じ並び）
+        'DROP INDEX IF EXISTS tasks_date_done_idx',
+        'CREATE INDEX IF NOT EXISTS tasks_date_done_user_time_idx '
+        'ON tasks (scheduled_date, is_done, user_id, scheduled_time, id)',
+        # 未複製の行だけを引く部分インデックス
+        'CREATE INDEX IF NOT EXISTS tasks_unsynced_idx ON tasks (id) WHERE version > synced_version',
+        # 通知で読むダイジェスト（ローカルのみで、Supabaseへは複製しない）
+        'CREATE TABLE IF NOT EXISTS task_digests ('
+        'user_id TEXT NOT NULL, scheduled_date TEXT NOT NULL, tasks TEXT NOT NULL, '
+        'open_count INTEGER NOT NULL, version TEXT NOT NULL, updated_at TEXT, '
+        'PRIMARY KEY (scheduled_date, user_id))',
+    )
+    _LIST_DAY = (
+        'SELECT id, content, scheduled_time, is_done FROM tasks WHERE user_id = ? AND scheduled_date = ? '
+        'ORDER BY scheduled_time IS NULL, scheduled_time'
+    )
+    _INSERT = (
+        'INSERT INTO tasks (id, user_id, content, is_done, created_at, scheduled_date, scheduled_time, remind_time, '
+        'version, synced_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)'
+    )
+    _MARK_DONE = 'UPDATE tasks SET is_done = 1, version = version + 1 WHERE user_id = ? AND id = ? AND is_done = 0'
+    _GET_TASK = (
+        'SELECT id, user_id, content, is_done, scheduled_date, scheduled_time FROM tasks WHERE user_id = ? AND id = ?'
+    )
+    _IS_DONE = 'SELECT is_done FROM tasks WHERE id = ?'
+    _REMINDERS = (
+        'SELECT id, user_id, content, scheduled_date, scheduled_time, remind_time FROM tasks '
+        'WHERE scheduled_date BETWEEN ? AND ? AND is_done = 0 AND remind_time IS NOT NULL'
+    )
+    _DAY_PAGE = (
+        'SELECT id, user_id, content, scheduled_time, is_done FROM tasks '
+        'WHERE scheduled_date = ? AND (? = 0 OR is_done = 0) '
+        'AND (user_id, scheduled_time IS NULL, COALESCE(scheduled_time, \'\'), id) > (?, ?, ?, ?) '
+        'ORDER BY user_id, scheduled_time IS NULL, scheduled_time, id LIMIT ?'
+    )
+    _UNSYNCED = (
+        'SELECT id, user_id, content, is_done, created_at, scheduled_date, scheduled_time, remind_time, version '
+        'FROM tasks WHERE version > synced_version LIMIT ?'
+    )
+    _MARK_SYNCED = 'UPDATE tasks SET synced_version = ? WHERE id = ? AND synced_version < ?'
+    _UPSERT_DIGEST = (
+        'INSERT OR REPLACE INTO task_digests (user_id, scheduled_date, tasks, open_count, version, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)'
+    )
+    _DIGEST_PAGE = (
+        'SELECT user_id, scheduled_date, tasks, open_count, version, updated_at FROM task_digests '
+        'WHERE scheduled_date = ? AND (? = 0 OR open_count > 0) AND user_id > ? ORDER BY user_id LIMIT ?'
+    )
+
+    def __init__(self, path: str = 'tasks.sqlite3'):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False,
+                                    cached_statements=256)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in self._SCHEMA:
+            self.conn.execute(statement)
+        # 接続は1つを使い回し、スレッドプールからの呼び出しをこのロックで1つずつにする
+        self._lock = threading.Lock()
+
+    async def _call(self, func, *args):
+        # 他のワーカーが書き込み中だと最大 timeout 秒待つため、イベントループを止めないようスレッドで実行する
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    def _locked(self, func, *args):
+        with self._lock:
+            return func(*args)
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        if 'is_done' in data:
+            data['is_done'] = bool(data['is_done'])
+        return data
+
+    def _list_day(self, user_id: str, scheduled_date: str) -> List[Dict[str, Any]]:
+        return [self._row(row) for row in self.conn.execute(self._LIST_DAY, (user_id, scheduled_date))]
+
+    async def list_day(self, user_id: str, scheduled_date: str) -> List[Dict[str, Any]]:
+        return await self._call(self._list_day, user_id, scheduled_date)
+
+    def _insert(self, rows: List[Dict[str, Any]], synced: bool) -> List[Dict[str, Any]]:
+        inserted = []
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for row in rows:
+                data = {
+                    'id': str(row.get('id') or uuid.uuid4()),
+                    'user_id': row['user_id'],
+                    'content': row['content'],
+                    'is_done': bool(row.get('is_done')),
+                    'created_at': row.get('created_at'),
+                    'scheduled_date': row['scheduled_date'],
+                    'scheduled_time': _normalize_time(row.get('scheduled_time')),
+                    'remind_time': _normalize_time(row.get('remind_time')),
+                }
+                self.conn.execute(self._INSERT, (*data.values(), 1 if synced else 0))
+                inserted.append(data)
+        return inserted
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._call(self._insert, rows, False)
+
+    def _mark_done(self, user_id: str, task_ids: List[Any]) -> List[Dict[str, Any]]:
+        updated = []
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for task_id in task_ids:
+                self.conn.execute(self._MARK_DONE, (user_id, str(task_id)))
+                updated.extend(self._row(row) for row in self.conn.execute(self._GET_TASK, (user_id, str(task_id))))
+        return updated
+
+    async def mark_done(self, user_id: str, task_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        return await self._call(self._mark_done, user_id, list(task_ids))
+
+    def _is_done(self, task_id: Any) -> Optional[bool]:
+        row = self.conn.execute(self._IS_DONE, (str(task_id),)).fetchone()
+        return bool(row['is_done']) if row is not None else None
+
+    async def is_done(self, task_id: Any) -> Optional[bool]:
+        return await self._call(self._is_done, task_id)
+
+    def _reminder_tasks(self, start: date, end: date) -> List[Dict[str, Any]]:
+        return [self._row(row) for row in self.conn.execute(self._REMINDERS, (start.isoformat(), end.isoformat()))]
+
+    async def reminder_tasks(self, start: date, end: date) -> List[Dict[str, Any]]:
+        return await self._call(self._reminder_tasks, start, end)
+
+    def _day_tasks_page(self, scheduled_date: str, only_open: bool, cursor: Optional[Cursor],
+                        limit: int) -> List[Dict[str, Any]]:
+        if cursor is None:
+            # どの行よりも前を表すカーソル
+            after = ('', 0, '', '')
+        else:
+            user_id, scheduled_time, task_id = cursor
+            after = (user_id, scheduled_time is None, scheduled_time or '', str(task_id))
+        rows = self.conn.execute(self._DAY_PAGE, (scheduled_date, 1 if only_open else 0, *after, limit))
+        return [self._row(row) for row in rows]
+
+    async def day_tasks_page(self, scheduled_date: str, only_open: bool, cursor: Optional[Cursor],
+                             limit: int) -> List[Dict[str, Any]]:
+        return await self._call(self._day_tasks_page, scheduled_date, only_open, cursor, limit)
+
+    def _upsert_digests(self, rows: List[Dict[str, Any]]) -> None:
+        with self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(self._UPSERT_DIGEST, [
+                (row['user_id'], row['scheduled_date'], json.dumps(row['tasks'], ensure_ascii=False),
+                 row['open_count'], row['version'], row.get('updated_at'))
+                for row in rows
+            ])
+
+    async def upsert_digests(self, rows: List[Dict[str, Any]]) -> None:
+        await self._call(self._upsert_digests, rows)
+
+    def _digests_page(self, scheduled_date: str, only_open: bool, after_user: Optional[str],
+                      limit: int) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(self._DIGEST_PAGE, (scheduled_date, 1 if only_open else 0, after_user or '', limit))
+        return [{**dict(row), 'tasks': json.loads(row['tasks'])} for row in rows]
+
+    async def digests_page(self, scheduled_date: str, only_open: bool, after_user: Optional[str],
+                           limit: int) -> List[Dict[str, Any]]:
+        return await self._call(self._digests_page, scheduled_date, only_open, after_user, limit)
+
+    async def ping(self) -> None:
+        await self._call(lambda: self.conn.execute('SELECT 1').fetchone())
+
+    # 以下の同期メソッドは TaskReplicator がスレッドから呼ぶ
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def unsynced(self, limit: int) -> List[Dict[str, Any]]:
+        """Supabaseに未複製の行（version付き）を返す"""
+        with self._lock:
+            return [self._row(row) for row in self.conn.execute(self._UNSYNCED, (limit,))]
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM tasks WHERE version > synced_version').fetchone()[0]
+
+    def mark_synced(self, versions: List[Tuple[str, int]]) -> None:
+        """複製した時点のversionを記録する（その後に更新された行は次回また複製する）"""
+        with self._lock, self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(self._MARK_SYNCED, [(version, task_id, version) for task_id, version in versions])
+
+    def load(self, rows: List[Dict[str, Any]]) -> None:
+        """Supabaseから読み込んだ行を複製済みとして保存する"""
+        with self._lock:
+            self._insert(rows, synced=True)
+
+    async def close(self) -> None:
+        await self._call(self.conn.close)
+
+
+class TaskReplicator:
+    """SqliteTaskStore の変更を一定間隔でまとめてSupabaseに書き込む"""
+
+    def __init__(self, source: SqliteTaskStore, target: SupabaseTaskStore,
+                 interval: float = 5, batch_size: int = 500):
+        self.source = source
+        self.target = target
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        metrics.gauge('task_replication_backlog', 'Supabaseに未複製のタスク数', source.backlog)
+
+    async def bootstrap(self) -> int:
+        """ローカルが空の場合にSupabaseの全タスクを読み込み、読み込んだ件数を返す"""
+        if await asyncio.to_thread(self.source.count):
+            return 0
+        loaded = 0
+        after_id = None
+        while True:
+            rows = await self.target.all_tasks_page(after_id, self.batch_size)
+            if not rows:
+                break
+            await asyncio.to_thread(self.source.load, rows)
+            loaded += len(rows)
+            after_id = rows[-1]['id']
+            if len(rows) < self.batch_size:
+                break
+        logger.info("TaskReplicator: Supabaseから%s件を読み込みました", loaded)
+        return loaded
+
+    async def flush(self) -> int:
+        """未複製の行をすべて書き込み、書き込んだ件数を返す"""
+        total = 0
+        while True:
+            rows = await asyncio.to_thread(self.source.unsynced, self.batch_size)
+            if not rows:
+                return total
+            versions = [(row['id'], row.pop('version')) for row in rows]
+            await self.target.upsert(rows)
+            await asyncio.to_thread(self.source.mark_synced, versions)
+            replicated_rows.inc(len(rows))
+            total += len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                replication_failures.inc()
+                logger.warning("TaskReplicator: Supabaseへの複製に失敗しました: %s", e)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            replication_failures.inc()
+            logger.warning("TaskReplicator: 停止時の複製に失敗しました: %s", e)
+
+
+def create_task_store(backend: str, supabase=None, path: Optional[str] = None) -> TaskStore:
+    """バックエンド名（supabase / sqlite）からストアを生成する"""
+    if backend == 'supabase':
+        return SupabaseTaskStore(supabase)
+    if backend == 'sqlite':
+        return SqliteTaskStore(path or 'tasks.sqlite3')
+    raise ValueError(f'unknown task store backend: {backend}')
@@ -0,0 +1,25 @@
+import asyncio
+
+import kvstore
+from coordination import LockTimeout, SharedLock
+
+
+def test_shared_lock_is_renewed_while_held():
+    store = kvstore.create_store('locks')
+    lock = SharedLock(store, ttl=0.3, timeout=0.5, poll_interval=0.01, max_poll_interval=0.05)
+    other = SharedLock(store, ttl=0.3, timeout=0.5, poll_interval=0.01, max_poll_interval=0.05)
+
+    async def run():
+        async with lock.hold('U1'):
+            # ttl を過ぎても保持したままで、他からは取得できない
+            await asyncio.sleep(0.4)
+            try:
+                async with other.hold('U1'):
+                    return False
+            except LockTimeout:
+                pass
+        # 手放した後はすぐ取得できる
+        async with other.hold('U1'):
+            return True
+
+    assert asyncio.run(run())
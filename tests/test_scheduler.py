@@ -0,0 +1,31 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import kvstore
+from config import JST
+from scheduler import ReminderInbox, Scheduler, sync_task_reminders
+
+
+def test_reminder_sync_takes_only_newly_published_tasks():
+    now = datetime(2026, 1, 5, 9, 0, tzinfo=JST)
+    scheduler = Scheduler(clock=lambda: now)
+    inbox = ReminderInbox(kvstore.create_store('reminders'))
+    tomorrow = (now + timedelta(days=1)).date().isoformat()
+
+    async def send(task):
+        pass
+
+    async def run():
+        await inbox.publish([
+            {'id': 'a', 'user_id': 'U1', 'content': '会議', 'scheduled_date': tomorrow,
+             'scheduled_time': '10:00:00', 'remind_time': '09:30:00', 'is_done': False},
+            {'id': 'b', 'user_id': 'U1', 'content': '買い物', 'scheduled_date': tomorrow,
+             'scheduled_time': None, 'remind_time': None, 'is_done': False},
+        ])
+        first = await sync_task_reminders(scheduler, inbox, send)
+        # 前回取り込んだ分は再び読まない
+        second = await sync_task_reminders(scheduler, inbox, send)
+        return first, second
+
+    assert asyncio.run(run()) == (1, 0)
+    assert 'reminder:a' in scheduler._jobs
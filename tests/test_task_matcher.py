@@ -0,0 +1,24 @@
+import asyncio
+
+import kvstore
+from task_matcher import OrdinalMap
+
+
+def test_ordinals_keep_positions_of_tasks_without_id():
+    ordinals = OrdinalMap(kvstore.create_store('ordinals'))
+    tasks = [
+        {'id': 'a', 'content': '会議'},
+        {'id': None, 'content': '保存前のタスク'},
+        {'id': 'c', 'content': '歯医者'},
+    ]
+
+    async def run():
+        await ordinals.remember('U1', tasks)
+        return [await ordinals.resolve('U1', number) for number in (1, 2, 3, 4)]
+
+    first, second, third, fourth = asyncio.run(run())
+    assert first == {'id': 'a', 'content': '会議'}
+    # IDのないタスクの番号は見つからない扱いにし、後ろの番号はずらさない
+    assert second is None
+    assert third == {'id': 'c', 'content': '歯医者'}
+    assert fourth is None
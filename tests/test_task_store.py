@@ -0,0 +1,44 @@
+import asyncio
+import sqlite3
+import time
+
+from task_store import SqliteTaskStore
+
+
+def test_event_loop_stays_responsive_while_another_connection_holds_write_lock(tmp_path):
+    path = str(tmp_path / 'tasks.sqlite3')
+
+    async def run():
+        store = SqliteTaskStore(path)
+        # 別のワーカーの書き込み中を再現する
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        other.execute("INSERT INTO tasks (id, user_id, content, scheduled_date) VALUES ('x', 'U2', 'other', '2026-10-18')")
+
+        gaps = []
+
+        async def ticker():
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        inserting = asyncio.create_task(store.insert([
+            {'user_id': 'U1', 'content': '会議', 'scheduled_date': '2026-10-18'}
+        ]))
+        await asyncio.sleep(0.5)
+        assert not inserting.done()
+        other.execute('COMMIT')
+        inserted = await asyncio.wait_for(inserting, 5)
+        ticking.cancel()
+        other.close()
+
+        assert [row['content'] for row in inserted] == ['会議']
+        assert len(await store.list_day('U1', '2026-10-18')) == 1
+        await store.close()
+        return max(gaps)
+
+    assert asyncio.run(run()) < 0.2
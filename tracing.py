@@ -0,0 +1,311 @@
+import asyncio
+import atexit
+import functools
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import config
+import metrics
+from logging_config import get_logger
+from profiler import SamplingProfiler
+
+logger = get_logger(__name__)
+
+stage_seconds = metrics.histogram('stage_seconds', '処理の段階ごとの所要時間（stage別）')
+traces_exported = metrics.counter('traces_exported_total', '書き出したトレース数')
+traces_dropped = metrics.counter('traces_dropped_total', '書き出せずに捨てたトレース数（reason=full|error）')
+
+# OTLPのSpanKind・StatusCode
+_KIND_INTERNAL = 1
+_STATUS_ERROR = 2
+
+
+class Span:
+    """処理の1区間（トレース中の親子関係と開始・終了時刻を持つ）"""
+
+    __slots__ = ('name', 'trace', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, trace: "Trace", parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+
+class Trace:
+    """1リクエストの処理中に終わった区間の一覧"""
+
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self):
+        self.trace_id = f'{random.getrandbits(128):032x}'
+        self.spans: List[Span] = []
+
+    def breakdown(self) -> Dict[str, float]:
+        """区間名ごとの合計時間（ミリ秒）"""
+        result: Dict[str, float] = {}
+        for span in self.spans:
+            result[span.name] = result.get(span.name, 0.0) + (span.end_ns - span.start_ns) / 1e6
+        return {name: round(value, 1) for name, value in result.items()}
+
+
+# 処理中の区間（asyncioのタスクごとに引き継がれる）
+_current: ContextVar[Optional[Span]] = ContextVar('span', default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current.get()
+    return current.trace.trace_id if current is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """with文の区間の所要時間を stage_seconds に記録し、トレース中ならその子区間として残す"""
+    parent = _current.get()
+    if parent is None:
+        # トレース外（スケジューラのジョブなど）では所要時間だけを記録する
+        start = time.perf_counter()
+        try:
+            yield None
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, stage=name)
+        return
+    trace = parent.trace
+    current = Span(name, trace, parent.span_id, attributes)
+    token = _current.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        stage_seconds.observe(elapsed, stage=name)
+        current.end_ns = current.start_ns + int(elapsed * 1e9)
+        trace.spans.append(current)
+
+
+def traced(name: str):
+    """非同期関数の呼び出し全体を区間として記録するデコレータ"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _Tracer:
+    def __init__(self):
+        self.exporter: Optional["TraceExporter"] = None
+        self.sample_rate = 1.0
+        self.slow_threshold = 0.0
+        self.profiler: Optional[SamplingProfiler] = None
+
+
+_tracer = _Tracer()
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """リクエスト1件分のトレースを始める（ルートの区間）
+
+    終了時、サンプリングされたか slow_threshold 秒以上かかったトレースを書き出し、
+    遅かった場合は区間ごとの内訳をログに出す。プロファイラが有効なら処理中のスタックも採取する。
+    """
+    current = Trace()
+    root = Span(name, current, None, attributes)
+    token = _current.set(root)
+    profiler = _tracer.profiler
+    if profiler is not None:
+        try:
+            profiler.begin(current.trace_id, asyncio.current_task())
+        except RuntimeError:
+            profiler = None
+    start = time.perf_counter()
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        stage_seconds.observe(elapsed, stage=name)
+        root.end_ns = root.start_ns + int(elapsed * 1e9)
+        current.spans.append(root)
+        slow = 0 < _tracer.slow_threshold <= elapsed
+        if slow:
+            logger.warning("slow request", extra={'trace_id': current.trace_id, 'stage': name,
+                                                  'elapsed_ms': round(elapsed * 1000, 1),
+                                                  'breakdown': current.breakdown()})
+        if _tracer.exporter is not None and (slow or random.random() < _tracer.sample_rate):
+            _tracer.exporter.submit(current)
+        if profiler is not None:
+            profiler.end(current.trace_id, elapsed, f'{name}-{current.trace_id[:16]}')
+
+
+def stage_stats() -> Dict[str, Dict[str, float]]:
+    """段階ごとの件数・平均・p95（バケットの上限）をミリ秒で返す"""
+    result = {}
+    for labels in stage_seconds.label_sets():
+        count = stage_seconds.count(**labels)
+        result[labels['stage']] = {
+            'count': count,
+            'avg_ms': round(stage_seconds.sum(**labels) / count * 1000, 1) if count else 0.0,
+            'p95_ms': stage_seconds.quantile(0.95, **labels) * 1000,
+        }
+    return dict(sorted(result.items()))
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+def encode_otlp(traces: List[Trace], service_name: str) -> Dict[str, Any]:
+    """トレースをOTLP/HTTPのJSON（ExportTraceServiceRequest）にする"""
+    spans = []
+    for current in traces:
+        for item in current.spans:
+            encoded = {
+                'traceId': current.trace_id,
+                'spanId': item.span_id,
+                'name': item.name,
+                'kind': _KIND_INTERNAL,
+                'startTimeUnixNano': str(item.start_ns),
+                'endTimeUnixNano': str(item.end_ns),
+                'attributes': [_attribute(key, value) for key, value in item.attributes.items()],
+            }
+            if item.parent_id:
+                encoded['parentSpanId'] = item.parent_id
+            if item.error:
+                encoded['status'] = {'code': _STATUS_ERROR, 'message': item.error}
+            spans.append(encoded)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_attribute('service.name', service_name)]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': spans}],
+    }]}
+
+
+class TraceExporter:
+    """トレースを別スレッドでまとめて書き出す
+
+    file はOTLPのJSONを1行1リクエストでファイルに追記し（OpenTelemetry Collectorのfile exporterと同じ形式）、
+    otlp は `{endpoint}/v1/traces` にOTLP/HTTP（JSON）で送る。キューが満杯の場合は捨てる。
+    """
+
+    def __init__(self, kind: str, path: str = 'traces.jsonl', endpoint: str = 'http://localhost:4318',
+                 service_name: str = 'line-task-bot', batch_size: int = 64, interval: float = 1.0,
+                 maxsize: int = 10000):
+        if kind not in ('file', 'otlp'):
+            raise ValueError(f'unknown trace exporter: {kind}')
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint.rstrip('/')
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._client = None
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def submit(self, current: Trace) -> None:
+        try:
+            self._queue.put_nowait(current)
+        except queue.Full:
+            traces_dropped.inc(reason='full')
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Trace]) -> None:
+        payload = encode_otlp(batch, self.service_name)
+        try:
+            if self.kind == 'file':
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+            else:
+                if self._client is None:
+                    import httpx
+                    self._client = httpx.Client(timeout=5)
+                self._client.post(f'{self.endpoint}/v1/traces', json=payload).raise_for_status()
+            traces_exported.inc(len(batch))
+        except Exception as e:
+            traces_dropped.inc(len(batch), reason='error')
+            logger.warning("トレースを書き出せませんでした: %s", e)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """キューに残っているトレースを書き出し切ってからスレッドを止める"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._client is not None:
+            self._client.close()
+
+
+def setup_tracing() -> None:
+    """設定（config）からトレースの書き出し先・サンプリング・プロファイラを設定する
+
+    TRACE_EXPORTER（none / file / otlp）、TRACE_FILE、OTLP_ENDPOINT、TRACE_SAMPLE_RATE、TRACE_SLOW_THRESHOLD、
+    PROFILE_SLOW_THRESHOLD（0でプロファイラ無効）、PROFILE_INTERVAL、PROFILE_DIR、PROFILE_MAX_FILES を使う。
+    """
+    if _tracer.exporter is not None:
+        return
+    if config.TRACE_EXPORTER != 'none':
+        _tracer.exporter = TraceExporter(
+            config.TRACE_EXPORTER,
+            path=config.TRACE_FILE,
+            endpoint=config.OTLP_ENDPOINT,
+            service_name=config.OTEL_SERVICE_NAME
+        )
+        atexit.register(shutdown_tracing)
+    _tracer.sample_rate = config.TRACE_SAMPLE_RATE
+    _tracer.slow_threshold = config.TRACE_SLOW_THRESHOLD
+    if config.PROFILE_SLOW_THRESHOLD > 0:
+        _tracer.profiler = SamplingProfiler(
+            config.PROFILE_SLOW_THRESHOLD,
+            interval=config.PROFILE_INTERVAL,
+            directory=config.PROFILE_DIR,
+            max_files=config.PROFILE_MAX_FILES
+        )
+
+
+def shutdown_tracing() -> None:
+    if _tracer.exporter is not None:
+        _tracer.exporter.shutdown()
+        _tracer.exporter = None